@@ -0,0 +1,104 @@
+# app/actions.py
+"""
+Outbound Telegram actions (restrict, owner log messages, ...) run by a small
+worker pool instead of inline in handlers.
+
+Actions are plain (method, kwargs) pairs with JSON-native kwargs, so whatever
+is still queued at shutdown can be written to the journal and replayed.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.ratelimit import RateLimiter
+
+logger = logging.getLogger("eclis.actions")
+
+MAX_ATTEMPTS = 3
+
+
+class ActionQueue:
+    def __init__(self, workers: int = 4, maxsize: int = 10000, rate: float = 25):
+        self.workers = workers
+        self.limiter = RateLimiter(rate=rate, burst=max(1, int(rate)))
+        self._queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+        self._closed = False
+        self.done = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._closed = False
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, method: str, **kwargs: Any) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait({"method": method, "kwargs": kwargs})
+            return True
+        except asyncio.QueueFull:
+            logger.warning("action queue full, dropping %s", method)
+            return False
+
+    async def _run(self, action: Dict[str, Any]) -> None:
+        call = getattr(self._bot, action["method"])
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.limiter.acquire()
+            try:
+                await call(**action["kwargs"])
+                self.done += 1
+                return
+            except TelegramRetryAfter as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def _worker(self) -> None:
+        while True:
+            action = await self._queue.get()
+            try:
+                await self._run(action)
+            except asyncio.CancelledError:
+                # put it back so drain() can journal it
+                self._queue.put_nowait(action)
+                self._queue.task_done()
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.warning("action %s failed: %s", action["method"], e)
+            self._queue.task_done()
+
+    async def drain(self, timeout: float) -> List[Dict[str, Any]]:
+        """Stop intake, run what is queued until `timeout`, return the rest."""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        left: List[Dict[str, Any]] = []
+        while not self._queue.empty():
+            left.append(self._queue.get_nowait())
+            self._queue.task_done()
+        return left
+
+    def replay(self, records: List[Dict[str, Any]]) -> int:
+        return sum(1 for r in records if r and self.submit(r["method"], **r["kwargs"]))
+
+
+actions = ActionQueue()
@@ -0,0 +1,240 @@
+# app/backup.py
+"""
+Online backup / restore of the guard DB.
+
+Uses SQLite's backup API in steps of BACKUP_PAGES pages from a worker thread,
+so the event loop keeps running and writers only wait for one short step at a
+time. Snapshots are gzip-compressed into BACKUP_DIR and rotated (BACKUP_KEEP).
+
+If the live DB keeps changing, SQLite restarts a stepped backup from page 0;
+after a few restarts we fall back to a single-step copy, which in WAL mode
+reads one consistent snapshot without blocking writers.
+
+While a backup runs, a probe measures how long a writer has to wait for the
+write lock (BEGIN IMMEDIATE + ROLLBACK, no data touched) and how late the
+event loop wakes up; both are reported in BackupResult and logged.
+
+SQLite backend only; with DB_BACKEND=postgres use pg_dump / PITR instead.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, BACKUP_PAGES
+from app.db import db
+
+logger = logging.getLogger("eclis.backup")
+
+PREFIX = "eclis_guard-"
+SUFFIX = ".sqlite3.gz"
+MAX_RESTARTS = 3
+STEP_PAUSE = 0.005
+PROBE_EVERY = 0.1
+
+_lock = asyncio.Lock()
+
+
+@dataclass
+class BackupResult:
+    path: Path
+    size: int
+    seconds: float
+    steps: int
+    restarts: int
+    max_write_wait_ms: float
+    max_loop_lag_ms: float
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy_stepped(src: sqlite3.Connection, dst: sqlite3.Connection, pages: int) -> tuple[int, int]:
+    steps = 0
+    restarts = 0
+    last_remaining: Optional[int] = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _Restarted()
+        last_remaining = remaining
+        # give writers the lock between steps
+        time.sleep(STEP_PAUSE)
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+    except _Restarted:
+        # busy DB: one-step copy of a consistent snapshot
+        src.backup(dst, pages=-1)
+        steps += 1
+    return steps, restarts
+
+
+def _backup_sync(db_path: str, out_dir: Path, pages: int) -> tuple[Path, int, int]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    final = out_dir / f"{PREFIX}{stamp}{SUFFIX}"
+
+    fd, raw_path = tempfile.mkstemp(suffix=".sqlite3", dir=out_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(raw_path)
+        try:
+            steps, restarts = _copy_stepped(src, dst, pages)
+        finally:
+            dst.close()
+            src.close()
+
+        tmp_gz = final.with_suffix(".tmp")
+        with open(raw_path, "rb") as fin, gzip.open(tmp_gz, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        os.replace(tmp_gz, final)
+    finally:
+        os.unlink(raw_path)
+    return final, steps, restarts
+
+
+async def _probe(db_path: str, stop: asyncio.Event, stats: dict):
+    def write_wait() -> float:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        try:
+            t0 = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            waited = time.perf_counter() - t0
+            conn.execute("ROLLBACK")
+            return waited
+        finally:
+            conn.close()
+
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(PROBE_EVERY)
+        stats["loop"] = max(stats["loop"], loop.time() - t0 - PROBE_EVERY)
+        stats["write"] = max(stats["write"], await asyncio.to_thread(write_wait))
+
+
+def list_backups(out_dir: str = BACKUP_DIR) -> List[Path]:
+    d = Path(out_dir)
+    if not d.is_dir():
+        return []
+    return sorted(
+        (p for p in d.iterdir() if p.name.startswith(PREFIX) and p.name.endswith(SUFFIX)),
+        reverse=True,
+    )
+
+
+def rotate_backups(keep: int = BACKUP_KEEP, out_dir: str = BACKUP_DIR) -> int:
+    old = list_backups(out_dir)[max(1, keep):]
+    for p in old:
+        p.unlink(missing_ok=True)
+    return len(old)
+
+
+def _require_sqlite() -> None:
+    if db.name != "sqlite":
+        raise RuntimeError(f"built-in backups need the sqlite backend (DB_BACKEND={db.name})")
+
+
+async def create_backup(
+    pages: int = BACKUP_PAGES, out_dir: str = BACKUP_DIR, rotate: bool = True
+) -> BackupResult:
+    _require_sqlite()
+    async with _lock:
+        stop = asyncio.Event()
+        stats = {"write": 0.0, "loop": 0.0}
+        probe = asyncio.create_task(_probe(db.path, stop, stats))
+        t0 = time.perf_counter()
+        try:
+            path, steps, restarts = await asyncio.to_thread(_backup_sync, db.path, Path(out_dir), pages)
+        finally:
+            stop.set()
+            await asyncio.gather(probe, return_exceptions=True)
+
+        result = BackupResult(
+            path=path,
+            size=path.stat().st_size,
+            seconds=time.perf_counter() - t0,
+            steps=steps,
+            restarts=restarts,
+            max_write_wait_ms=stats["write"] * 1000,
+            max_loop_lag_ms=stats["loop"] * 1000,
+        )
+        if rotate:
+            rotate_backups(out_dir=out_dir)
+        logger.info(
+            "backup %s: %.1f KB in %.2fs, steps=%s restarts=%s max_write_wait=%.1fms max_loop_lag=%.1fms",
+            path.name, result.size / 1024, result.seconds, steps, restarts,
+            result.max_write_wait_ms, result.max_loop_lag_ms,
+        )
+        return result
+
+
+def _restore_sync(db_path: str, snapshot: Path) -> None:
+    fd, raw_path = tempfile.mkstemp(suffix=".sqlite3", dir=snapshot.parent)
+    os.close(fd)
+    try:
+        with gzip.open(snapshot, "rb") as fin, open(raw_path, "wb") as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+
+        src = sqlite3.connect(raw_path)
+        dst = sqlite3.connect(db_path, timeout=30)
+        try:
+            # sanity check before touching the live DB
+            if src.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                raise ValueError("snapshot failed integrity_check")
+            # copies into the live file under SQLite's own locking: no file swapping
+            src.backup(dst, pages=-1)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        os.unlink(raw_path)
+
+
+async def restore_backup(name: str, out_dir: str = BACKUP_DIR) -> BackupResult:
+    """
+    Restore a snapshot by file name (must be one of list_backups()).
+    A safety snapshot of the current state is taken first and returned.
+    """
+    snapshot = next((p for p in list_backups(out_dir) if p.name == name), None)
+    if snapshot is None:
+        raise FileNotFoundError(name)
+
+    # no rotation here: it could delete the very snapshot we are restoring
+    safety = await create_backup(out_dir=out_dir, rotate=False)
+    async with _lock:
+        await asyncio.to_thread(_restore_sync, db.path, snapshot)
+    # a snapshot from an older release carries its old schema: migrate it like a boot would
+    await db.init()
+    logger.info("restored %s (safety snapshot %s)", name, safety.path.name)
+    return safety
+
+
+async def backup_loop():
+    if BACKUP_INTERVAL <= 0 or db.name != "sqlite":
+        return
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            await create_backup()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("scheduled backup failed")
@@ -0,0 +1,185 @@
+# app/broadcast.py
+"""
+Broadcast engine: copy one message to many registered chats.
+
+A job is persisted first (`broadcasts` + one `broadcast_deliveries` row per chat),
+then drained by a small pool of workers:
+  - global pace: BROADCAST_RATE msgs/sec (token bucket)
+  - per-chat pace: BROADCAST_CHAT_INTERVAL seconds between sends to one chat
+  - flood control (RetryAfter) is honoured and retried
+Results are written in batches; the owner's progress message is edited in place.
+Jobs still 'running' after a restart are resumed from their pending rows.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.callbacks import BroadcastCb
+from app.config import BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_CONCURRENCY
+from app.db import db
+from app.log import report
+from app.ratelimit import RateLimiter, PerKeyLimiter
+
+logger = logging.getLogger("eclis.broadcast")
+
+FLUSH_EVERY = 50
+PROGRESS_EVERY = 2.0
+MAX_ATTEMPTS = 3
+
+
+class BroadcastManager:
+    def __init__(
+        self,
+        rate: float = BROADCAST_RATE,
+        chat_interval: float = BROADCAST_CHAT_INTERVAL,
+        concurrency: int = BROADCAST_CONCURRENCY,
+    ):
+        self.limiter = RateLimiter(rate=rate, burst=max(1, int(rate)))
+        self.per_chat = PerKeyLimiter(chat_interval)
+        self.concurrency = max(1, concurrency)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: set[int] = set()
+
+    def is_running(self, broadcast_id: int) -> bool:
+        task = self._tasks.get(broadcast_id)
+        return task is not None and not task.done()
+
+    def start(self, bot: Bot, broadcast_id: int) -> None:
+        if self.is_running(broadcast_id):
+            return
+        task = asyncio.create_task(self._run(bot, broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(broadcast_id, None))
+
+    def cancel(self, broadcast_id: int) -> bool:
+        if not self.is_running(broadcast_id):
+            return False
+        self._cancelled.add(broadcast_id)
+        return True
+
+    async def resume_all(self, bot: Bot) -> int:
+        ids = await db.list_running_broadcasts()
+        for broadcast_id in ids:
+            self.start(bot, broadcast_id)
+        return len(ids)
+
+    async def stop(self) -> None:
+        """Stop workers; undelivered rows stay 'pending' and resume next start."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, bot: Bot, chat_id: int, from_chat_id: int, message_id: int) -> Tuple[str, Optional[str]]:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.per_chat.acquire(chat_id)
+            await self.limiter.acquire()
+            try:
+                await bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+                return "sent", None
+            except TelegramRetryAfter as e:
+                if attempt == MAX_ATTEMPTS:
+                    return "failed", str(e)
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                return "failed", str(e)[:300]
+        return "failed", "retries exhausted"
+
+    async def _progress(self, bot: Bot, job, counts: Dict[str, int], total: int, final: str = ""):
+        _id, _from, _msg, _status, p_chat, p_msg = job
+        if not p_chat or not p_msg:
+            return
+        done = counts.get("sent", 0) + counts.get("failed", 0)
+        text = (
+            f"📣 Broadcast #{job[0]} {final or '…'}\n"
+            f"✅ sent: {counts.get('sent', 0)}\n"
+            f"⚠️ failed: {counts.get('failed', 0)}\n"
+            f"⏳ {done}/{total}"
+        )
+        try:
+            await bot.edit_message_text(
+                text=text,
+                chat_id=p_chat,
+                message_id=p_msg,
+                reply_markup=None if final else cancel_markup(job[0]),
+            )
+        except Exception as e:
+            # "message is not modified" or deleted progress message: not fatal
+            report("broadcast.progress_failed", e, broadcast_id=job[0])
+
+    async def _run(self, bot: Bot, broadcast_id: int) -> None:
+        job = await db.get_broadcast(broadcast_id)
+        if not job or job[3] != "running":
+            return
+        _id, from_chat_id, message_id = job[:3]
+
+        pending = await db.pending_deliveries(broadcast_id)
+        counts = await db.broadcast_counts(broadcast_id)
+        total = sum(counts.values())
+
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for chat_id in pending:
+            queue.put_nowait(chat_id)
+
+        results: List[Tuple[int, str, Optional[str]]] = []
+        flush_lock = asyncio.Lock()
+
+        async def flush():
+            async with flush_lock:
+                if results:
+                    batch = results[:]
+                    results.clear()
+                    await db.record_deliveries(broadcast_id, batch)
+
+        async def worker():
+            while broadcast_id not in self._cancelled:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, error = await self._send(bot, chat_id, from_chat_id, message_id)
+                results.append((chat_id, status, error))
+                counts["pending"] = counts.get("pending", 0) - 1
+                counts[status] = counts.get(status, 0) + 1
+                if len(results) >= FLUSH_EVERY:
+                    await flush()
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(PROGRESS_EVERY)
+                await flush()
+                await self._progress(bot, job, counts, total)
+
+        t0 = time.perf_counter()
+        rep = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            rep.cancel()
+            await asyncio.gather(rep, return_exceptions=True)
+            await flush()
+
+        final = "cancelled" if broadcast_id in self._cancelled else "done"
+        self._cancelled.discard(broadcast_id)
+        await db.set_broadcast_status(broadcast_id, final)
+        await self._progress(bot, job, counts, total, final=final)
+        logger.info(
+            "broadcast #%s %s: sent=%s failed=%s in %.1fs",
+            broadcast_id, final, counts.get("sent", 0), counts.get("failed", 0), time.perf_counter() - t0,
+        )
+
+
+def cancel_markup(broadcast_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="⏹ Cancel", callback_data=BroadcastCb(op="cancel", ref=broadcast_id).pack())]]
+    )
+
+
+broadcasts = BroadcastManager()
@@ -0,0 +1,160 @@
+# app/cache.py
+"""
+In-memory indexes consulted on the join path, so a join never costs a JOIN query.
+The DB stays the source of truth; these are rebuilt from it on start and patched
+after every edit made through the panel.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from app.db import db
+
+
+class FolderSafeIndex:
+    """
+    Reverse index `user_id -> {chat_id: refcount}` over folders marked SAFE.
+
+    A user may sit in several SAFE folders for the same chat, hence the refcount:
+    removing one folder must not un-safe a user that another folder still covers.
+    """
+
+    def __init__(self):
+        self._by_user: Dict[int, Dict[int, int]] = {}
+        self._folders: Dict[int, Tuple[FrozenSet[int], FrozenSet[int]]] = {}
+
+    def is_safe(self, user_id: int, chat_id: int) -> bool:
+        chats = self._by_user.get(user_id)
+        return chats is not None and chat_id in chats
+
+    def chats_for(self, user_id: int) -> FrozenSet[int]:
+        return frozenset(self._by_user.get(user_id, ()))
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+    def _apply(self, members: Iterable[int], chats: Iterable[int], delta: int) -> None:
+        chats = tuple(chats)
+        for uid in members:
+            per_chat = self._by_user.setdefault(uid, {})
+            for cid in chats:
+                n = per_chat.get(cid, 0) + delta
+                if n > 0:
+                    per_chat[cid] = n
+                else:
+                    per_chat.pop(cid, None)
+            if not per_chat:
+                del self._by_user[uid]
+
+    def set_folder(self, folder_id: int, members: Iterable[int], chats: Iterable[int]) -> None:
+        self.drop_folder(folder_id)
+        members, chats = frozenset(members), frozenset(chats)
+        if not members or not chats:
+            return
+        self._folders[folder_id] = (members, chats)
+        self._apply(members, chats, +1)
+
+    def drop_folder(self, folder_id: int) -> None:
+        old = self._folders.pop(folder_id, None)
+        if old:
+            self._apply(old[0], old[1], -1)
+
+    async def load(self, database=db) -> None:
+        state = await database.folder_safe_state()
+        self._by_user.clear()
+        self._folders.clear()
+        for folder_id, (members, chats) in state.items():
+            self.set_folder(folder_id, members, chats)
+
+    async def refresh_folder(self, folder_id: int, database=db) -> None:
+        state = await database.folder_safe_state(folder_id)
+        members, chats = state.get(folder_id, ((), ()))
+        self.set_folder(folder_id, members, chats)
+
+
+folder_index = FolderSafeIndex()
+
+
+class AdminSet:
+    """
+    Bot admins (the `admins` table) as a set, so filters and the update pre-filter
+    answer "is this an admin?" without a DB round trip. Until `load()` has run,
+    `loaded` is False and callers fall back to the DB.
+    """
+
+    def __init__(self):
+        self._ids: set[int] = set()
+        self.loaded = False
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, user_id: int) -> None:
+        self._ids.add(user_id)
+
+    def discard(self, user_id: int) -> None:
+        self._ids.discard(user_id)
+
+    async def load(self, database=db) -> None:
+        self._ids = set(await database.list_admins())
+        self.loaded = True
+
+    async def is_admin(self, user_id: int, database=db) -> bool:
+        if self.loaded:
+            return user_id in self._ids
+        return await database.is_admin(user_id)
+
+
+admins = AdminSet()
+
+
+class UserChatSet:
+    """
+    (user_id, chat_id) pairs of the `safe_users` / `bans` tables; chat_id None = GLOBAL.
+    `contains()` mirrors Database.is_safe / is_banned: a global row matches every chat.
+    """
+
+    def __init__(self, loader: str, checker: str):
+        self._loader = loader
+        self._checker = checker
+        self._pairs: set[tuple[int, Optional[int]]] = set()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def contains(self, user_id: int, chat_id: Optional[int]) -> bool:
+        pairs = self._pairs
+        return (user_id, None) in pairs or (user_id, chat_id) in pairs
+
+    def add(self, user_id: int, chat_id: Optional[int]) -> None:
+        self._pairs.add((user_id, chat_id))
+
+    def discard(self, user_id: int, chat_id: Optional[int]) -> None:
+        self._pairs.discard((user_id, chat_id))
+
+    async def load(self, database=db) -> None:
+        self._pairs = set(map(tuple, await getattr(database, self._loader)()))
+        self.loaded = True
+
+    async def check(self, user_id: int, chat_id: Optional[int], database=db) -> bool:
+        if self.loaded:
+            return self.contains(user_id, chat_id)
+        return await getattr(database, self._checker)(user_id, chat_id)
+
+
+safe_users = UserChatSet("all_safe", "is_safe")
+bans = UserChatSet("all_bans", "is_banned")
+
+
+async def warm_all(database=db) -> None:
+    await asyncio.gather(
+        folder_index.load(database),
+        admins.load(database),
+        safe_users.load(database),
+        bans.load(database),
+    )
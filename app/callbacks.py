@@ -0,0 +1,138 @@
+# app/callbacks.py
+"""
+Panel callback scheme + a single dict-based dispatcher.
+
+Wire format stays "<prefix>:<op>[:<arg>...]" (e.g. "fld:open:12"), so buttons
+already sitting in chats keep working. Parameterized buttons are typed
+CallbackData classes whose pack() produces exactly that format; fixed buttons
+("owner:backup", "cancel", ...) stay plain strings.
+
+CallbackTable resolves a click with at most three dict lookups
+(full data, then "<prefix>:<op>", then "<prefix>") and checks authorization
+once per update, instead of aiogram walking every handler's filter chain.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+
+from app.cache import admins
+from app.config import OWNER_ID
+
+
+class CtxCb(CallbackData, prefix="ctx"):
+    op: str
+    chat_id: int
+
+
+class SafeCb(CallbackData, prefix="safe"):
+    op: str
+    user_id: int
+
+
+class UnbanCb(CallbackData, prefix="do_unban"):
+    user_id: int
+    chat_id: int
+
+
+class GlobalUnbanCb(CallbackData, prefix="do_unban_global"):
+    user_id: int
+
+
+class FolderCb(CallbackData, prefix="fld"):
+    op: str
+    folder_id: int
+
+
+class LinkCb(CallbackData, prefix="lnk"):
+    op: str
+    link_id: int
+
+
+class BackupCb(CallbackData, prefix="bk"):
+    op: str
+    name: str
+
+
+class BroadcastCb(CallbackData, prefix="bc"):
+    op: str
+    ref: int
+
+
+class ProfCb(CallbackData, prefix="prof"):
+    op: str
+    seconds: int
+
+
+# who may press a button
+PUBLIC, ADMIN, OWNER = 0, 1, 2
+
+
+@dataclass(frozen=True)
+class _Entry:
+    handler: Callable[..., Awaitable[Any]]
+    role: int
+    parser: Optional[Type[CallbackData]]
+
+
+class CallbackTable:
+    def __init__(self):
+        self._table: Dict[str, _Entry] = {}
+        self.dispatched = 0
+        self.unknown = 0
+        self.denied = 0
+        self.bad_data = 0
+
+    def on(self, *keys: str, role: int = ADMIN, parser: Optional[Type[CallbackData]] = None):
+        """
+        Register a handler for exact callback data or a "<prefix>:<op>" key.
+        With `parser`, the handler gets the unpacked CallbackData as third argument.
+        """
+        def decorator(handler):
+            for key in keys:
+                if key in self._table:
+                    raise ValueError(f"callback {key!r} registered twice")
+                self._table[key] = _Entry(handler, role, parser)
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> Optional[_Entry]:
+        entry = self._table.get(data)
+        if entry is None and ":" in data:
+            head, _, rest = data.partition(":")
+            op = rest.partition(":")[0]
+            entry = self._table.get(f"{head}:{op}") or self._table.get(head)
+        return entry
+
+    @staticmethod
+    async def role_of(user_id: int) -> int:
+        if user_id == OWNER_ID:
+            return OWNER
+        return ADMIN if await admins.is_admin(user_id) else PUBLIC
+
+    async def dispatch(self, cb: CallbackQuery, state: FSMContext) -> bool:
+        """Returns False when nothing handled the click (unknown, denied or malformed)."""
+        entry = self.resolve(cb.data or "")
+        if entry is None:
+            self.unknown += 1
+            return False
+        if entry.role > PUBLIC and await self.role_of(cb.from_user.id) < entry.role:
+            self.denied += 1
+            return False
+
+        if entry.parser is None:
+            await entry.handler(cb, state)
+        else:
+            try:
+                parsed = entry.parser.unpack(cb.data)
+            except (TypeError, ValueError):
+                self.bad_data += 1
+                await cb.answer("Bad data.")
+                return False
+            await entry.handler(cb, state, parsed)
+        self.dispatched += 1
+        return True
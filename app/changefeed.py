@@ -0,0 +1,130 @@
+# app/changefeed.py
+"""
+Keeps the in-memory caches in step with edits made by other bot processes that
+share the same DB file (hot standby, second token, ...).
+
+Every mutating Database method appends a row to `changes` in its own
+transaction. This poller reads rows after the last seen `seq` (a primary-key
+range scan), skips its own origin — local edits already patched the caches —
+and applies each row as a delta:
+
+  admin add            -> admins.add
+  safe/ban add|remove  -> safe_users / bans add|discard
+  folder *             -> folder_index.refresh_folder / drop_folder, policies.invalidate
+  policy *             -> policies.invalidate(chat)
+  gate on|off          -> join_gate switch for that chat
+  block *              -> spam_filter.refresh(chat)
+  chat reload (clone)  -> full reload of the member sets + that chat's policy/blocklist
+  group upsert         -> flood detector starts watching the chat
+  link                 -> nothing cached
+
+If the feed was pruned past our position, or went backwards (DB restored from
+a backup), the caches are reloaded once and polling resumes from the new head.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from app.cache import admins, bans, folder_index, safe_users, warm_all
+from app.config import CHANGES_KEEP, CHANGES_POLL_INTERVAL
+from app.db import db
+from app.flood import flood
+from app.join_gate import join_gate
+from app.policy import policies
+from app.spam_filter import spam_filter
+
+logger = logging.getLogger("eclis.changefeed")
+
+BATCH = 500
+PRUNE_EVERY = 3600
+
+
+class ChangeFeed:
+    def __init__(self):
+        self.seq = 0
+        self.applied = 0
+        self.reloads = 0
+
+    async def mark(self) -> None:
+        """Start from the current head; call right before the caches are loaded."""
+        self.seq = (await db.change_bounds())[1]
+
+    async def _reload(self, reason: str) -> None:
+        logger.info("changefeed: %s, reloading caches", reason)
+        self.seq = (await db.change_bounds())[1]
+        await asyncio.gather(warm_all(), join_gate.load(), spam_filter.load(), flood.load())
+        policies.invalidate()
+        self.reloads += 1
+
+    async def _apply(self, kind: str, op: str, user_id, chat_id, ref) -> None:
+        if kind == "admin" and op == "add":
+            admins.add(user_id)
+        elif kind in ("safe", "ban"):
+            target = safe_users if kind == "safe" else bans
+            if op == "add":
+                target.add(user_id, chat_id)
+            else:
+                target.discard(user_id, chat_id)
+        elif kind == "folder":
+            if op == "delete":
+                folder_index.drop_folder(ref)
+            elif ref is not None:
+                await folder_index.refresh_folder(ref)
+            # folder names/members feed the policy matchers
+            policies.invalidate(chat_id)
+        elif kind == "policy":
+            policies.invalidate(chat_id)
+        elif kind == "gate":
+            join_gate.set_enabled(chat_id, op == "on")
+        elif kind == "group" and op == "upsert":
+            flood.track_group(chat_id)
+        elif kind == "block":
+            await spam_filter.refresh(chat_id)
+        elif kind == "chat" and op == "reload":
+            await asyncio.gather(
+                folder_index.load(), safe_users.load(), bans.load(), spam_filter.refresh(chat_id)
+            )
+            policies.invalidate(chat_id)
+
+    async def poll(self) -> int:
+        """Apply everything after `seq`; returns how many foreign changes were applied."""
+        lo, hi = await db.change_bounds()
+        if hi < self.seq:
+            await self._reload("change feed went backwards (restore?)")
+            return 0
+        if hi == self.seq:
+            return 0
+        if lo > self.seq + 1:
+            await self._reload("fell behind the pruned change feed")
+            return 0
+
+        applied = 0
+        while True:
+            rows = await db.changes_since(self.seq, BATCH)
+            for seq, origin, kind, op, user_id, chat_id, ref in rows:
+                if origin != db.origin:
+                    await self._apply(kind, op, user_id, chat_id, ref)
+                    applied += 1
+                self.seq = seq
+            if len(rows) < BATCH:
+                break
+        self.applied += applied
+        return applied
+
+
+async def changefeed_loop() -> None:
+    last_prune = time.monotonic()
+    while True:
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+        try:
+            await changefeed.poll()
+            if time.monotonic() - last_prune >= PRUNE_EVERY:
+                await db.prune_changes(int(time.time()) - CHANGES_KEEP)
+                last_prune = time.monotonic()
+        except Exception:
+            logger.exception("changefeed poll failed")
+
+
+changefeed = ChangeFeed()
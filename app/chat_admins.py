@@ -0,0 +1,112 @@
+# app/chat_admins.py
+"""
+Per-chat cache of Telegram chat administrators, so the guard never bans a
+group admin (e.g. one re-joining after leaving) without calling
+get_chat_administrators on every join.
+
+  - filled lazily: the first lookup for a chat loads its admin list
+  - single-flight: concurrent lookups for the same chat share that one call
+  - CHAT_ADMINS_TTL: entries are reloaded after this many seconds
+  - chat_member updates patch cached chats in place:
+      promoted (-> administrator/creator) -> added
+      demoted  (administrator -> member)  -> removed
+    An admin who *leaves* stays cached until the TTL runs out: Telegram strips
+    their rights on leave, and they are exactly the ones who re-join.
+  - a failed load is cached as empty for FAIL_TTL so a raid cannot turn an
+    unreachable chat into one API call per join
+
+Lookups on a warm entry are a dict hit plus a set membership test.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import ChatMemberUpdated
+
+from app.config import CHAT_ADMINS_TTL
+from app.ratelimit import api_limiter
+
+logger = logging.getLogger("eclis.chat_admins")
+
+ADMIN_STATUSES = frozenset({"administrator", "creator"})
+FAIL_TTL = 60
+
+
+class ChatAdminCache:
+    def __init__(self, ttl: float = CHAT_ADMINS_TTL):
+        self.ttl = ttl
+        # chat_id -> (admin user ids, expires at)
+        self._chats: Dict[int, Tuple[FrozenSet[int], float]] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.loads = 0
+        self.failures = 0
+
+    def peek(self, chat_id: int, user_id: int) -> Optional[bool]:
+        """Answer from the cache only; None when the chat is not cached (or stale)."""
+        entry = self._chats.get(chat_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return user_id in entry[0]
+
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        known = self.peek(chat_id, user_id)
+        if known is not None:
+            self.hits += 1
+            return known
+        return user_id in await self._load(bot, chat_id)
+
+    async def _load(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        fut = self._loading.get(chat_id)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._loading[chat_id] = fut
+            fut.add_done_callback(lambda _f: self._loading.pop(chat_id, None))
+        # shield: one waiter being cancelled must not cancel the shared call
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        self.loads += 1
+        try:
+            await api_limiter.acquire()
+            members = await bot.get_chat_administrators(chat_id=chat_id)
+        except Exception as e:
+            self.failures += 1
+            stale = self._chats.get(chat_id)
+            ids = stale[0] if stale else frozenset()
+            logger.warning("get_chat_administrators(%s) failed: %s", chat_id, e)
+            self._chats[chat_id] = (ids, time.monotonic() + FAIL_TTL)
+            return ids
+        ids = frozenset(m.user.id for m in members)
+        self._chats[chat_id] = (ids, time.monotonic() + self.ttl)
+        return ids
+
+    def apply(self, event: ChatMemberUpdated) -> None:
+        """Patch a cached chat from a chat_member update (promotion/demotion)."""
+        entry = self._chats.get(event.chat.id)
+        if entry is None:
+            # not cached: the next lookup loads the current list anyway
+            return
+        ids, expires = entry
+        user_id = event.new_chat_member.user.id
+        old, new = event.old_chat_member.status, event.new_chat_member.status
+        if new in ADMIN_STATUSES and user_id not in ids:
+            self._chats[event.chat.id] = (ids | {user_id}, expires)
+        elif old in ADMIN_STATUSES and new in ("member", "restricted") and user_id in ids:
+            self._chats[event.chat.id] = (ids - {user_id}, expires)
+
+    def invalidate(self, chat_id: Optional[int] = None) -> None:
+        if chat_id is None:
+            self._chats.clear()
+        else:
+            self._chats.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"chats": len(self._chats), "hits": self.hits, "loads": self.loads, "failures": self.failures}
+
+
+chat_admins = ChatAdminCache()
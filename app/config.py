@@ -5,3 +5,94 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 OWNER_ID = int(os.getenv("OWNER_ID", "0"))
+
+# invite-link rotation job (seconds). Opt-in: it creates and revokes bot links in every
+# registered group, so links admins already shared stop working; 0 (default) = off
+INVITE_LINK_TTL = int(os.getenv("INVITE_LINK_TTL", str(24 * 3600)))
+INVITE_ROTATE_INTERVAL = int(os.getenv("INVITE_ROTATE_INTERVAL", "0"))
+INVITE_CONCURRENCY = int(os.getenv("INVITE_CONCURRENCY", "5"))
+
+# online DB backups; BACKUP_INTERVAL=0 disables the scheduled job
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL = int(os.getenv("BACKUP_INTERVAL", str(6 * 3600)))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "10"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))
+
+# broadcast pacing: global messages/second and minimum seconds between sends to one chat
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "3"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+
+# graceful shutdown: seconds to drain in-flight work; leftovers go to the journal file
+SHUTDOWN_DEADLINE = float(os.getenv("SHUTDOWN_DEADLINE", "10"))
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "eclis_journal.jsonl")
+
+# moderation outbox: batch size per drain pass, retries before giving up, max backoff (seconds)
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_MAX_BACKOFF = int(os.getenv("OUTBOX_MAX_BACKOFF", "600"))
+
+# guard stats: flush in-memory counters every N seconds, compact rollups every N seconds
+STATS_FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", "10"))
+STATS_COMPACT_INTERVAL = int(os.getenv("STATS_COMPACT_INTERVAL", "3600"))
+
+# change feed (several instances on one DB): poll interval (seconds), how long rows are kept (seconds)
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+CHANGES_KEEP = int(os.getenv("CHANGES_KEEP", "86400"))
+
+# storage backend: sqlite (default, DB_PATH) or postgres (DATABASE_URL, needs asyncpg)
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlite")
+DB_PATH = os.getenv("DB_PATH", "eclis_guard.sqlite3")
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Telegram chat admins are cached per chat for this many seconds (refreshed on promotions/demotions)
+CHAT_ADMINS_TTL = int(os.getenv("CHAT_ADMINS_TTL", "3600"))
+
+# join-request gate: seconds to collect requests into one batch, parallel approve/decline calls
+JOIN_BATCH_INTERVAL = float(os.getenv("JOIN_BATCH_INTERVAL", "0.5"))
+JOIN_CONCURRENCY = int(os.getenv("JOIN_CONCURRENCY", "8"))
+
+# group message spam filter: delete batching (seconds), hits before a ban, window for counting hits (seconds)
+SPAM_FLUSH_INTERVAL = float(os.getenv("SPAM_FLUSH_INTERVAL", "0.5"))
+SPAM_STRIKES = int(os.getenv("SPAM_STRIKES", "1"))
+SPAM_STRIKE_WINDOW = int(os.getenv("SPAM_STRIKE_WINDOW", "3600"))
+
+# cross-group flood detection: same content in FLOOD_CHATS chats within FLOOD_WINDOW seconds
+# -> global ban + delete; FLOOD_CHATS=0 disables it
+FLOOD_CHATS = int(os.getenv("FLOOD_CHATS", "3"))
+FLOOD_WINDOW = int(os.getenv("FLOOD_WINDOW", "60"))
+FLOOD_MIN_LENGTH = int(os.getenv("FLOOD_MIN_LENGTH", "20"))
+FLOOD_SIMILARITY = float(os.getenv("FLOOD_SIMILARITY", "0.6"))
+FLOOD_MAX_KEYS = int(os.getenv("FLOOD_MAX_KEYS", "20000"))
+
+# traffic recording for `python -m app.replay`: directory for gzip'ed JSONL segments (empty = off),
+# seconds between writes, segment size (MB of JSON) and age (seconds), segments kept
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+RECORD_FLUSH_INTERVAL = float(os.getenv("RECORD_FLUSH_INTERVAL", "1"))
+RECORD_SEGMENT_MB = float(os.getenv("RECORD_SEGMENT_MB", "64"))
+RECORD_SEGMENT_SECONDS = int(os.getenv("RECORD_SEGMENT_SECONDS", "3600"))
+RECORD_KEEP = int(os.getenv("RECORD_KEEP", "24"))
+
+# logging (written by a background thread): level, text|json, queue size (oldest dropped when full),
+# 1-in-N sampling of high-volume events, min seconds between repeats of one swallowed-error event
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+LOG_ERROR_INTERVAL = float(os.getenv("LOG_ERROR_INTERVAL", "60"))
+
+# slow log (owner panel -> Profiling): updates / storage calls slower than these (ms; 0 = off), entries kept
+SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "500"))
+SLOW_DB_MS = float(os.getenv("SLOW_DB_MS", "200"))
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", "100"))
+
+# Bot API HTTP session: pool size, idle keep-alive (s), DNS cache (s), default request timeout (s),
+# per-method timeouts ("banChatMember=10,sendDocument=120"), JSON codec (auto|orjson|stdlib)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "3600"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_METHOD_TIMEOUTS = os.getenv("HTTP_METHOD_TIMEOUTS", "")
+HTTP_JSON = os.getenv("HTTP_JSON", "auto")
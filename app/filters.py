@@ -1,8 +1,8 @@
 from aiogram.filters import BaseFilter
 from aiogram.types import Message, CallbackQuery
 
+from app.cache import admins
 from app.config import OWNER_ID
-from app.db import db
 
 
 def _get_user_id(event: Message | CallbackQuery) -> int:
@@ -19,10 +19,10 @@ class IsOwner(BaseFilter):
 
 class IsAdmin(BaseFilter):
     async def __call__(self, event: Message | CallbackQuery) -> bool:
-        return await db.is_admin(_get_user_id(event))
+        return await admins.is_admin(_get_user_id(event))
 
 
 class IsAdminOrOwner(BaseFilter):
     async def __call__(self, event: Message | CallbackQuery) -> bool:
         uid = _get_user_id(event)
-        return uid == OWNER_ID or await db.is_admin(uid)
+        return uid == OWNER_ID or await admins.is_admin(uid)
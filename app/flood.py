@@ -0,0 +1,365 @@
+# app/flood.py
+"""
+Cross-group flood detection: the same content posted into many of our groups
+within seconds (spam campaigns), which no single chat can see on its own.
+
+Every group message (text/caption, plus the file id of photos/videos/documents)
+is normalized and fingerprinted twice:
+  - exact: 64-bit blake2b of the normalized content
+  - near:  16-value MinHash over word uni/bigrams, so small edits (an emoji,
+           a changed word) still match; estimated Jaccard >= FLOOD_SIMILARITY
+Near-duplicates are found by LSH: the signature is cut into 8 bands of 2
+values and a lookup is 8 dict hits plus one comparison, not a scan.
+(64-bit SimHash was tried first; on short messages a one-word edit moved it
+as far as unrelated texts are apart, so it could not separate them.)
+
+Fingerprints go into a sliding window of BUCKETS time buckets covering
+FLOOD_WINDOW seconds. Each bucket holds at most FLOOD_MAX_KEYS fingerprints
+and each fingerprint a bounded number of chats/messages, so memory is capped
+no matter how much traffic flows through; old buckets are dropped whole.
+
+When one fingerprint has been seen in FLOOD_CHATS different chats inside the
+window it trips: every sender is banned globally (DB) and in the chats where
+they posted (outbox), and their recorded messages are deleted in batches.
+Senders the join guard would let through (owner, bot admins, SAFE users incl.
+folder SAFE, chat admins where they posted) are left alone, messages included.
+A tripped fingerprint stays blocked for BLOCK_TTL, so later copies are removed
+on sight.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import html
+import logging
+import re
+import struct
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from app.actions import actions
+from app.cache import admins, bans, folder_index, safe_users
+from app.chat_admins import chat_admins
+from app.config import (
+    FLOOD_CHATS,
+    FLOOD_MAX_KEYS,
+    FLOOD_MIN_LENGTH,
+    FLOOD_SIMILARITY,
+    FLOOD_WINDOW,
+    OWNER_ID,
+)
+from app.db import db
+from app.log import event
+from app.outbox import outbox
+from app.spam_filter import message_text, spam_filter
+from app.stats import stats
+
+logger = logging.getLogger("eclis.flood")
+
+BUCKETS = 6
+NUM_PERM = 16
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+MAX_CHATS_PER_KEY = 64
+MAX_MESSAGES_PER_CHAT = 20
+MIN_TOKENS = 4
+MAX_TOKENS = 64
+BLOCK_TTL = 600
+
+# (chat_id, message_id, user_id or None)
+Sighting = Tuple[int, int, Optional[int]]
+# ("x", content hash) or ("n", id of a near-duplicate cluster)
+Key = Tuple[str, int]
+Signature = Tuple[int, ...]
+
+_PUNCT = re.compile(r"[^\w\s/.:+@-]+")
+# one 64-byte digest = the feature's value under all 16 hash functions
+_unpack = struct.Struct(f"<{NUM_PERM}I").unpack
+
+
+def _h64(data: str) -> int:
+    return int.from_bytes(hashlib.blake2b(data.encode(), digest_size=8).digest(), "big")
+
+
+def minhash(tokens: List[str]) -> Signature:
+    features = set(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    rows = [_unpack(hashlib.blake2b(f.encode(), digest_size=4 * NUM_PERM).digest()) for f in features]
+    return tuple(map(min, zip(*rows)))
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def _bands(sig: Signature) -> Iterable[Tuple[int, ...]]:
+    return ((i, *sig[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS))
+
+
+def _media_id(message: Message) -> Optional[str]:
+    if message.photo:
+        return message.photo[-1].file_unique_id
+    for media in (message.video, message.document, message.animation, message.audio, message.voice):
+        if media is not None:
+            return media.file_unique_id
+    return None
+
+
+class _Index:
+    """Fingerprint -> {chat_id: [(message_id, user_id), ...]}, plus the LSH band index."""
+
+    __slots__ = ("start", "entries", "bands", "sigs", "expires")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.entries: Dict[Key, Dict[int, List[Tuple[int, Optional[int]]]]] = {}
+        self.bands: Dict[Tuple[int, ...], int] = {}
+        self.sigs: Dict[int, Signature] = {}
+        self.expires: Dict[Key, float] = {}
+
+    def find_similar(self, sig: Signature, threshold: float) -> Optional[int]:
+        for band in _bands(sig):
+            rep = self.bands.get(band)
+            if rep is not None and similarity(self.sigs[rep], sig) >= threshold:
+                return rep
+        return None
+
+    def add_key(self, key: Key, sig: Optional[Signature] = None) -> Dict[int, List[Tuple[int, Optional[int]]]]:
+        entry = self.entries[key] = {}
+        if sig is not None:
+            self.sigs[key[1]] = sig
+            for band in _bands(sig):
+                self.bands.setdefault(band, key[1])
+        return entry
+
+    def drop_key(self, key: Key) -> None:
+        self.entries.pop(key, None)
+        self.expires.pop(key, None)
+        sig = self.sigs.pop(key[1], None) if key[0] == "n" else None
+        if sig is not None:
+            for band in _bands(sig):
+                if self.bands.get(band) == key[1]:
+                    del self.bands[band]
+
+
+class FloodDetector:
+    def __init__(
+        self,
+        chats: int = FLOOD_CHATS,
+        window: float = FLOOD_WINDOW,
+        min_length: int = FLOOD_MIN_LENGTH,
+        threshold: float = FLOOD_SIMILARITY,
+        max_keys: int = FLOOD_MAX_KEYS,
+    ):
+        self.chats = chats
+        self.window = window
+        self.width = window / BUCKETS
+        self.min_length = min_length
+        self.threshold = threshold
+        self.max_keys = max_keys
+        self._buckets: Deque[_Index] = deque(maxlen=BUCKETS + 1)
+        self._blocked = _Index(0.0)
+        self._groups: Set[int] = set()
+        self.seen = 0
+        self.tripped = 0
+        self.overflow = 0
+        self.blocked_hits = 0
+
+    # ----- which chats -----
+    async def load(self, database=db) -> None:
+        self._groups = {chat_id for chat_id, _title, _type in await database.list_groups()}
+
+    def track_group(self, chat_id: int) -> None:
+        self._groups.add(chat_id)
+
+    def watches(self, chat_id: int) -> bool:
+        return self.chats > 0 and chat_id in self._groups
+
+    # ----- fingerprints -----
+    def fingerprints(self, message: Message) -> List[Tuple[Key, Optional[Signature]]]:
+        text = _PUNCT.sub("", message_text(message)).strip()
+        media = _media_id(message)
+        out: List[Tuple[Key, Optional[Signature]]] = []
+        if media is not None or len(text) >= self.min_length:
+            out.append((("x", _h64(f"{media or ''}\n{text}")), None))
+        tokens = text.split()[:MAX_TOKENS]
+        if len(text) >= self.min_length and len(tokens) >= MIN_TOKENS:
+            sig = minhash(tokens)
+            out.append((("n", hash(sig)), sig))
+        return out
+
+    def _resolve(self, key: Key, sig: Optional[Signature]) -> Key:
+        """Map a near-duplicate signature to its cluster, if one is known."""
+        if sig is None:
+            return key
+        for index in (self._blocked, *reversed(self._buckets)):
+            rep = index.find_similar(sig, self.threshold)
+            if rep is not None:
+                return ("n", rep)
+        return key
+
+    def _rotate(self, now: float) -> None:
+        if self._buckets and now - self._buckets[-1].start < self.width:
+            return
+        self._buckets.append(_Index(now))
+        while self._buckets[0].start < now - self.window - self.width:
+            self._buckets.popleft()
+        # once per bucket, not per message
+        for key in [k for k, exp in self._blocked.expires.items() if exp <= now]:
+            self._blocked.drop_key(key)
+
+    def observe(
+        self,
+        chat_id: int,
+        message_id: int,
+        user_id: Optional[int],
+        fingerprints: List[Tuple[Key, Optional[Signature]]],
+    ) -> List[Sighting]:
+        """
+        Record one message. Returns the messages to act on: empty while below
+        the threshold, everything recorded for the fingerprint once it trips,
+        or just this message if the fingerprint is already blocked.
+        """
+        if not fingerprints:
+            return []
+        now = time.monotonic()
+        self._rotate(now)
+        self.seen += 1
+
+        resolved = [(self._resolve(key, sig), sig) for key, sig in fingerprints]
+        keys = [key for key, _sig in resolved]
+        for key in keys:
+            if key in self._blocked.expires:
+                self.blocked_hits += 1
+                return [(chat_id, message_id, user_id)]
+
+        bucket = self._buckets[-1]
+        for key, sig in resolved:
+            entry = bucket.entries.get(key)
+            if entry is None:
+                if len(bucket.entries) >= self.max_keys:
+                    self.overflow += 1
+                    continue
+                entry = bucket.add_key(key, sig if key[0] == "n" else None)
+            msgs = entry.get(chat_id)
+            if msgs is None:
+                if len(entry) >= MAX_CHATS_PER_KEY:
+                    continue
+                msgs = entry[chat_id] = []
+            if len(msgs) < MAX_MESSAGES_PER_CHAT:
+                msgs.append((message_id, user_id))
+
+            chats: Set[int] = set()
+            for b in self._buckets:
+                e = b.entries.get(key)
+                if e:
+                    chats.update(e)
+            if len(chats) >= self.chats:
+                self.tripped += 1
+                # block every fingerprint of this content, not only the one that tripped
+                sightings: Dict[Sighting, None] = {}
+                for k in keys:
+                    sightings.update(dict.fromkeys(self._trip(k, now)))
+                return list(sightings)
+        return []
+
+    def _trip(self, key: Key, now: float) -> List[Sighting]:
+        sightings: List[Sighting] = []
+        sig: Optional[Signature] = None
+        for b in self._buckets:
+            entry = b.entries.get(key)
+            if entry is not None:
+                for chat_id, msgs in entry.items():
+                    sightings.extend((chat_id, m, u) for m, u in msgs)
+                if key[0] == "n" and sig is None:
+                    sig = b.sigs.get(key[1])
+                b.drop_key(key)
+        if key in self._blocked.entries or len(self._blocked.entries) < self.max_keys:
+            if key not in self._blocked.entries:
+                # near-duplicate keys keep their signature: later copies are matched against it
+                self._blocked.add_key(key, sig)
+            self._blocked.expires[key] = now + BLOCK_TTL
+        else:
+            self.overflow += 1
+        return sightings
+
+    # ----- enforcement -----
+    async def punish(self, bot: Bot, sightings: List[Sighting]) -> None:
+        senders: Dict[int, Set[int]] = {}
+        for chat_id, _message_id, user_id in sightings:
+            if user_id is not None:
+                senders.setdefault(user_id, set()).add(chat_id)
+        exempt = await self._exempt(bot, senders)
+        by_chat: Dict[int, List[int]] = {}
+        for chat_id, message_id, user_id in sightings:
+            # an admin's or SAFE user's announcement stays up: same rules as the join guard
+            if user_id not in exempt:
+                by_chat.setdefault(chat_id, []).append(message_id)
+        for chat_id, ids in by_chat.items():
+            stats.incr(chat_id, "flood", len(ids))
+            spam_filter.delete(chat_id, ids)
+        for u in exempt:
+            senders.pop(u, None)
+
+        new = [u for u in senders if not bans.contains(u, None)]
+        if not new:
+            return
+        # GLOBAL ban rows + Telegram bans in the chats they posted to, one transaction
+        await db.add_bans(
+            [(u, None) for u in new],
+            [(u, chat_id) for u in new for chat_id in senders[u]],
+        )
+        outbox.notify()
+        for u in new:
+            bans.add(u, None)
+        event(
+            "flood.ban",
+            level=logging.WARNING,
+            users=len(new),
+            chats=len(by_chat),
+            messages=sum(map(len, by_chat.values())),
+            user_ids=new[:50],
+        )
+        actions.submit(
+            "send_message",
+            chat_id=OWNER_ID,
+            text=(
+                f"فلود بین گروه‌ها: {len(new)} کاربر گلوبال بن شدند، "
+                f"{sum(map(len, by_chat.values()))} پیام در {len(by_chat)} گروه پاک شد.\n"
+                + html.escape(" ".join(map(str, new[:50])))
+            ),
+        )
+
+    async def _exempt(self, bot: Bot, senders: Dict[int, Set[int]]) -> Set[int]:
+        """Senders never punished: owner, bot admins, SAFE (global/chat/folder) or chat admin where they posted."""
+        exempt: Set[int] = set()
+        unknown: List[Tuple[int, int]] = []
+        for user_id, chats in senders.items():
+            if user_id == OWNER_ID or user_id in admins or any(
+                safe_users.contains(user_id, c) or folder_index.is_safe(user_id, c) or chat_admins.peek(c, user_id)
+                for c in chats
+            ):
+                exempt.add(user_id)
+            else:
+                unknown.extend((user_id, c) for c in chats)
+        if unknown:
+            # cold chats: one shared get_chat_administrators per chat
+            results = await asyncio.gather(*(chat_admins.is_admin(bot, c, u) for u, c in unknown))
+            exempt.update(u for (u, _c), is_admin in zip(unknown, results) if is_admin)
+        return exempt
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "seen": self.seen,
+            "tripped": self.tripped,
+            "blocked_hits": self.blocked_hits,
+            "overflow": self.overflow,
+            "keys": sum(len(b.entries) for b in self._buckets),
+        }
+
+
+flood = FloodDetector()
@@ -1,21 +1,44 @@
+import logging
+
 from aiogram import Dispatcher
 
+logger = logging.getLogger("eclis.handlers")
+
 
 def include_all_routers(dp: Dispatcher) -> None:
     """
     Central router registry.
     All feature routers must be imported here exactly once.
-    This file is considered FINAL and should not be edited again.
+    Imports happen here (not at module import time of app.main) so startup can time them.
+    The guard comes first: it is the path that must work from the first update.
     """
 
     try:
-        from app.handlers.private_panel import router as private_panel_router
-        dp.include_router(private_panel_router)
+        from app.handlers.group_guard import router as group_guard_router
+        dp.include_router(group_guard_router)
     except Exception:
-        pass
+        logger.exception("group_guard router failed to load")
 
     try:
-        from app.handlers.group_guard import router as group_guard_router
-        dp.include_router(group_guard_router)
+        from app.handlers.group_messages import router as group_messages_router
+        dp.include_router(group_messages_router)
+    except Exception:
+        logger.exception("group_messages router failed to load")
+
+    try:
+        from app.handlers.join_requests import router as join_requests_router
+        dp.include_router(join_requests_router)
+    except Exception:
+        logger.exception("join_requests router failed to load")
+
+    try:
+        from app.handlers.register_group import router as register_group_router
+        dp.include_router(register_group_router)
+    except Exception:
+        logger.exception("register_group router failed to load")
+
+    try:
+        from app.handlers.private_panel import router as private_panel_router
+        dp.include_router(private_panel_router)
     except Exception:
-        pass
+        logger.exception("private_panel router failed to load")
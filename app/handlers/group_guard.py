@@ -1,53 +1,137 @@
 from aiogram import Router
-from aiogram.types import ChatMemberUpdated
+from aiogram.types import ChatMemberUpdated, ChatPermissions
+
+from app.actions import actions
+from app.chat_admins import chat_admins
+from app.outbox import outbox
+from app.serializer import member_lanes
 
 from app.db import db
+from app.log import event
 from app.config import OWNER_ID
+from app.cache import bans, folder_index, safe_users
+from app.policy import policies, ALLOW, MUTE
+from app.startup import startup
+from app.stats import stats
 
 router = Router()
 
+# JSON-native so a queued restrict can be journaled and replayed
+NO_PERMISSIONS = ChatPermissions(
+    can_send_messages=False,
+    can_send_audios=False,
+    can_send_documents=False,
+    can_send_photos=False,
+    can_send_videos=False,
+    can_send_video_notes=False,
+    can_send_voice_notes=False,
+    can_send_polls=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False,
+).model_dump(exclude_none=True)
+
+
+# a join is a non-member becoming a member; demotions (administrator -> member)
+# and lifted restrictions (restricted -> member) are not joins
+JOIN_FROM = frozenset({"left", "kicked"})
+
+
+# routine outcomes are logged 1 in LOG_SAMPLE_EVERY; mutes/bans always
+SAMPLED_OUTCOMES = frozenset({"safe", "allow"})
+
+
+def _decided(chat_id: int, user_id: int, outcome: str, reason: str) -> None:
+    stats.incr(chat_id, outcome)
+    event(
+        "guard.decision",
+        sample=outcome in SAMPLED_OUTCOMES,
+        chat_id=chat_id,
+        user_id=user_id,
+        outcome=outcome,
+        reason=reason,
+    )
+
 
 @router.chat_member()
 async def guard_new_members(event: ChatMemberUpdated):
     """
     Triggered on any chat member update.
-    We only care about NEW joins.
+    We only care about NEW joins (left/kicked -> member).
     """
+    # promotions/demotions keep the cached admin list of this chat current
+    chat_admins.apply(event)
+
+    # updates for the same (chat, user) are decided in arrival order
+    key = (event.chat.id, event.new_chat_member.user.id)
+    await member_lanes.run(key, lambda: _guard(event))
+
 
-    if event.new_chat_member.status != "member":
+async def _guard(event: ChatMemberUpdated):
+    if event.new_chat_member.status != "member" or event.old_chat_member.status not in JOIN_FROM:
         return
 
-    user = event.from_user
+    # from_user is whoever caused the update (may be an admin adding someone);
+    # the member that actually joined is new_chat_member.user
+    user = event.new_chat_member.user
     chat = event.chat
 
     # Save group info (once)
-    await db.add_group(chat.id, chat.title)
+    await db.upsert_group(chat.id, chat.title, chat.type)
+
+    stats.incr(chat.id, "join")
 
     # Allow owner always
     if user.id == OWNER_ID:
+        _decided(chat.id, user.id, "safe", "owner")
+        return
+
+    # SAFE through a folder (in-memory reverse index, no DB hit)
+    if folder_index.is_safe(user.id, chat.id):
+        _decided(chat.id, user.id, "safe", "folder")
+        return
+
+    # Check SAFE list (global + this chat); in-memory once caches are warm
+    if await safe_users.check(user.id, chat.id):
+        _decided(chat.id, user.id, "safe", "safe_list")
         return
 
-    # Check SAFE list
-    if await db.is_safe(user.id):
+    # Telegram admins of this chat (e.g. re-joining); cached per chat, one shared API call per TTL
+    if await chat_admins.is_admin(event.bot, chat.id, user.id):
+        _decided(chat.id, user.id, "safe", "chat_admin")
         return
 
-    # Ban user from THIS group only
-    try:
-        await event.bot.ban_chat_member(
+    # Per-chat policy (default: ban)
+    action = await policies.decide(chat.id, user)
+    if action == ALLOW:
+        _decided(chat.id, user.id, "allow", "policy")
+        return
+
+    if action == MUTE:
+        _decided(chat.id, user.id, "mute", "policy")
+        actions.submit(
+            "restrict_chat_member",
             chat_id=chat.id,
-            user_id=user.id
+            user_id=user.id,
+            permissions=NO_PERMISSIONS,
+        )
+        actions.submit(
+            "send_message",
+            chat_id=OWNER_ID,
+            text=f"این کاربر با این ID میوت شد : {user.id}\nECLIS HAMISHE SAFE <3",
         )
-    except Exception:
-        pass
+        return
 
-    # Save ban
-    await db.add_ban(user.id, chat.id)
+    # Save ban + queue the Telegram ban in one transaction (THIS group only);
+    # the outbox worker applies it with retries, even across restarts
+    await db.add_ban(user.id, chat.id, enforce=True)
+    outbox.notify()
+    bans.add(user.id, chat.id)
+    _decided(chat.id, user.id, "ban", "policy")
+    startup.mark_once("first_ban")
 
     # Send log to owner
-    try:
-        await event.bot.send_message(
-            OWNER_ID,
-            f"این کاربر با این ID بن شد : {user.id}\nECLIS HAMISHE SAFE <3"
-        )
-    except Exception:
-        pass
+    actions.submit(
+        "send_message",
+        chat_id=OWNER_ID,
+        text=f"این کاربر با این ID بن شد : {user.id}\nECLIS HAMISHE SAFE <3",
+    )
@@ -0,0 +1,44 @@
+# app/handlers/group_messages.py
+from aiogram import F, Router
+from aiogram.types import Message
+
+from app.cache import admins
+from app.chat_admins import chat_admins
+from app.flood import flood
+from app.spam_filter import spam_filter
+
+router = Router()
+router.message.filter(F.chat.type.in_({"group", "supergroup"}))
+router.edited_message.filter(F.chat.type.in_({"group", "supergroup"}))
+
+
+@router.message()
+@router.edited_message()
+async def scan_group_message(message: Message):
+    """
+    Only chats with a blocklist, or watched by the flood detector, get here
+    (see PrefilterMiddleware). One regex search + one fingerprint per message;
+    hits are deleted in batches and may escalate to a ban.
+    """
+    chat_id = message.chat.id
+    if message.sender_chat is not None and message.sender_chat.id == chat_id:
+        # anonymous admin
+        return
+    # posts on behalf of a channel carry a placeholder from_user
+    user = message.from_user if message.sender_chat is None else None
+    if user is not None and (user.id in admins or chat_admins.peek(chat_id, user.id)):
+        return
+
+    hit = spam_filter.check(message)
+    if hit is not None:
+        # rare path: worth one (shared, cached) admin lookup before deleting
+        if user is not None and await chat_admins.is_admin(message.bot, chat_id, user.id):
+            return
+        await spam_filter.punish(message, hit)
+        return
+
+    if flood.watches(chat_id):
+        sender = user.id if user is not None else None
+        sightings = flood.observe(chat_id, message.message_id, sender, flood.fingerprints(message))
+        if sightings:
+            await flood.punish(message.bot, sightings)
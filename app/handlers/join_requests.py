@@ -0,0 +1,23 @@
+# app/handlers/join_requests.py
+from aiogram import Router
+from aiogram.types import ChatJoinRequest
+
+from app.join_gate import join_gate
+from app.stats import stats
+
+router = Router()
+
+
+@router.chat_join_request()
+async def on_join_request(request: ChatJoinRequest):
+    """
+    Chats with the join gate on: queue the request for a batched approve/decline.
+    Nothing else happens here (no DB, no API call), so a raid costs almost nothing.
+    Until the switch is loaded, requests are queued and checked again when decided.
+    """
+    chat_id = request.chat.id
+    if join_gate.loaded and not join_gate.enabled(chat_id):
+        # gate off: the chat's admins answer it by hand
+        return
+    stats.incr(chat_id, "request")
+    join_gate.submit(chat_id, request.from_user)
@@ -1,19 +1,54 @@
 # app/handlers/private_panel.py
 from __future__ import annotations
 
+import asyncio
+import html
+import json
+import time
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
+from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from app.config import OWNER_ID
+from app.backup import create_backup, list_backups, restore_backup
+from app.broadcast import broadcasts, cancel_markup
+from app.callbacks import (
+    OWNER, PUBLIC, CallbackTable,
+    BackupCb, BroadcastCb, CtxCb, FolderCb, GlobalUnbanCb, LinkCb, ProfCb, SafeCb, UnbanCb,
+)
+from app.cache import admins, bans, folder_index, safe_users, warm_all
 from app.db import db
 from app.filters import IsOwner, IsAdminOrOwner
-from app.keyboards import owner_panel, admin_panel, confirm_keyboard
+from app.flood import flood
+from app.log import report
+from app.keyboards import owner_panel, admin_panel, role_panel, confirm_keyboard
+from app.invite_links import create_invite_link
+from app.join_gate import join_gate
+from app.outbox import outbox
+from app.serializer import member_lanes
+from app.spam_filter import BlocklistError, parse_blocklist_text, spam_filter
+from app.panel import panel
+from app.policy import policies, parse_policy_text, PolicyError
+from app.profiler import profiler, slow_log
 from app.states import OwnerStates, AdminStates
+from app.stats import format_summary, stats
 
 router = Router()
 
+# every panel button goes through one handler: dict lookup + one auth check
+cbs = CallbackTable()
+
+
+@router.callback_query()
+async def dispatch_callback(cb: CallbackQuery, state: FSMContext):
+    if not await cbs.dispatch(cb, state):
+        # unknown or not allowed: leave it to other routers, as a filter miss would
+        raise SkipHandler()
+
 
 # =========================
 # Helpers
@@ -25,8 +60,8 @@ async def _safe_answer(cb: CallbackQuery, text: str | None = None, show_alert: b
     """
     try:
         await cb.answer(text or "", show_alert=show_alert)
-    except Exception:
-        pass
+    except Exception as e:
+        report("panel.answer_failed", e, user_id=cb.from_user.id)
 
 
 async def _format_user(bot, user_id: int) -> str:
@@ -45,7 +80,8 @@ async def _format_user(bot, user_id: int) -> str:
         if name:
             return f"{user_id} | {name}"
         return str(user_id)
-    except Exception:
+    except Exception as e:
+        report("panel.user_lookup_failed", e, user_id=user_id)
         return str(user_id)
 
 
@@ -53,11 +89,41 @@ def _get_ctx_chat_id(data: dict) -> int | None:
     return data.get("active_chat_id")
 
 
+async def _show(cb: CallbackQuery, state: FSMContext, text: str, reply_markup=None, **kwargs):
+    """
+    Render into the panel message the button belongs to (edited in place, debounced).
+    Without an explicit keyboard the caller's role panel is attached.
+    """
+    if reply_markup is None:
+        data = await state.get_data()
+        reply_markup = role_panel(cb.from_user.id == OWNER_ID, _get_ctx_chat_id(data))
+    await panel.render(cb.bot, cb.message.chat.id, text, reply_markup, cb.message.message_id, **kwargs)
+
+
+async def _send(message: Message, state: FSMContext, text: str, reply_markup=None, **kwargs):
+    """
+    Answer typed input with a fresh panel message (the old one is above the user's text now).
+    """
+    if reply_markup is None:
+        data = await state.get_data()
+        reply_markup = role_panel(message.from_user.id == OWNER_ID, _get_ctx_chat_id(data))
+    await panel.send(message.bot, message.chat.id, text, reply_markup, **kwargs)
+
+
+async def _finish(state: FSMContext):
+    # leave the FSM step but keep the selected Target
+    data = await state.get_data()
+    await state.clear()
+    chat_id = _get_ctx_chat_id(data)
+    if chat_id:
+        await state.update_data(active_chat_id=chat_id)
+
+
 async def _require_ctx(cb: CallbackQuery, state: FSMContext) -> int | None:
     data = await state.get_data()
     chat_id = _get_ctx_chat_id(data)
     if not chat_id:
-        await cb.message.answer("اول Target (گروه/کانال) رو انتخاب کن. روی 🎯 Select Group/Channel بزن.")
+        await _show(cb, state, "اول Target (گروه/کانال) رو انتخاب کن. روی 🎯 Select Group/Channel بزن.")
         return None
     return int(chat_id)
 
@@ -66,6 +132,16 @@ def _is_numeric(text: str | None) -> bool:
     return bool(text) and text.strip().isdigit()
 
 
+def _parse_int_list(text: str | None) -> list[int]:
+    out: list[int] = []
+    for p in (text or "").replace(",", " ").split():
+        try:
+            out.append(int(p))
+        except ValueError:
+            pass
+    return out
+
+
 # =========================
 # START / PANEL
 # =========================
@@ -74,12 +150,12 @@ def _is_numeric(text: str | None) -> bool:
 async def start_private(message: Message, state: FSMContext):
     if message.from_user.id == OWNER_ID:
         data = await state.get_data()
-        await message.answer("Owner Panel", reply_markup=owner_panel(_get_ctx_chat_id(data)))
+        await panel.send(message.bot, message.chat.id, "Owner Panel", owner_panel(_get_ctx_chat_id(data)))
         return
 
-    if await db.is_admin(message.from_user.id):
+    if await admins.is_admin(message.from_user.id):
         data = await state.get_data()
-        await message.answer("Admin Panel", reply_markup=admin_panel(_get_ctx_chat_id(data)))
+        await panel.send(message.bot, message.chat.id, "Admin Panel", admin_panel(_get_ctx_chat_id(data)))
         return
 
     await message.answer("You are not authorized.")
@@ -91,20 +167,21 @@ async def owner_open_admin_panel(message: Message, state: FSMContext):
         await message.answer("You are not authorized.")
         return
     data = await state.get_data()
-    await message.answer("Admin Panel", reply_markup=admin_panel(_get_ctx_chat_id(data)))
+    await panel.send(message.bot, message.chat.id, "Admin Panel", admin_panel(_get_ctx_chat_id(data)))
 
 
 # =========================
 # CONTEXT: SELECT GROUP/CHANNEL
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data == "ctx:select")
+@cbs.on("ctx:select")
 async def ctx_select(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
 
     groups = await db.list_groups()
     if not groups:
-        await cb.message.answer(
+        await _show(
+            cb, state,
             "هیچ Group/Channel تو DB نیست.\n"
             "اول ربات رو به گروه/کانال اضافه کن و یک پیام/رویداد تو همون چت رد و بدل بشه تا ثبت انجام بشه."
         )
@@ -113,71 +190,64 @@ async def ctx_select(cb: CallbackQuery, state: FSMContext):
     kb = InlineKeyboardBuilder()
     for chat_id, title, chat_type in groups[:50]:
         t = title or "-"
-        kb.button(text=f"{t} ({chat_type})", callback_data=f"ctx:set:{chat_id}")
+        kb.button(text=f"{t} ({chat_type})", callback_data=CtxCb(op="set", chat_id=chat_id))
     kb.button(text="Close", callback_data="cancel")
     kb.adjust(1)
 
-    await cb.message.answer("Target رو انتخاب کن:", reply_markup=kb.as_markup())
+    await _show(cb, state, "Target رو انتخاب کن:", reply_markup=kb.as_markup())
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.startswith("ctx:set:"))
-async def ctx_set(cb: CallbackQuery, state: FSMContext):
+@cbs.on("ctx:set", parser=CtxCb)
+async def ctx_set(cb: CallbackQuery, state: FSMContext, data: CtxCb):
     await _safe_answer(cb)
-    try:
-        _, _, chat_id_str = cb.data.split(":")
-        chat_id = int(chat_id_str)
-    except Exception:
-        await cb.message.answer("Bad data.")
-        return
-
+    chat_id = data.chat_id
     await state.update_data(active_chat_id=chat_id)
 
-    if cb.from_user.id == OWNER_ID:
-        await cb.message.answer(f"✅ Target set: {chat_id}", reply_markup=owner_panel(chat_id))
-    else:
-        await cb.message.answer(f"✅ Target set: {chat_id}", reply_markup=admin_panel(chat_id))
+    await _show(cb, state, f"✅ Target set: {chat_id}", role_panel(cb.from_user.id == OWNER_ID, chat_id))
 
 
 # =========================
 # OWNER: ADD ADMIN
 # =========================
 
-@router.callback_query(IsOwner(), F.data == "owner:add_admin")
+@cbs.on("owner:add_admin", role=OWNER)
 async def owner_add_admin(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     await state.set_state(OwnerStates.waiting_for_admin_id)
-    await cb.message.answer("Send numeric user_id to add as Admin:")
+    await _show(cb, state, "Send numeric user_id to add as Admin:")
 
 
 @router.message(IsOwner(), OwnerStates.waiting_for_admin_id)
 async def owner_receive_admin_id(message: Message, state: FSMContext):
     if not _is_numeric(message.text):
-        await message.answer("ID must be numeric.")
+        await _send(message, state, "ID must be numeric.")
         return
 
     user_id = int(message.text)
     await state.update_data(user_id=user_id)
-    await message.answer(
+    await _send(
+        message, state,
         f"Add user `{user_id}` as Admin?",
         reply_markup=confirm_keyboard("add_admin"),
     )
 
 
-@router.callback_query(IsOwner(), F.data == "confirm:add_admin")
+@cbs.on("confirm:add_admin", role=OWNER)
 async def owner_confirm_add_admin(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     data = await state.get_data()
     user_id = data.get("user_id")
     await db.add_admin(int(user_id))
-    await state.clear()
-    await cb.message.answer(f"User {user_id} added as Admin.")
+    admins.add(int(user_id))
+    await _finish(state)
+    await _show(cb, state, f"User {user_id} added as Admin.")
 
 
 # =========================
 # ADMIN/OWNER: ADD SAFE USER (TARGET)
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data == "admin:add_safe")
+@cbs.on("admin:add_safe")
 async def admin_add_safe(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
@@ -185,30 +255,31 @@ async def admin_add_safe(cb: CallbackQuery, state: FSMContext):
         return
 
     await state.set_state(AdminStates.waiting_for_safe_user_id)
-    await cb.message.answer("Send numeric user_id to add as SAFE (for Target):")
+    await _show(cb, state, "Send numeric user_id to add as SAFE (for Target):")
 
 
 @router.message(IsAdminOrOwner(), AdminStates.waiting_for_safe_user_id)
 async def admin_receive_safe_user(message: Message, state: FSMContext):
     if not _is_numeric(message.text):
-        await message.answer("ID must be numeric.")
+        await _send(message, state, "ID must be numeric.")
         return
 
     data = await state.get_data()
     chat_id = _get_ctx_chat_id(data)
     if not chat_id:
-        await message.answer("Target انتخاب نشده.")
+        await _send(message, state, "Target انتخاب نشده.")
         return
 
     user_id = int(message.text)
     await state.update_data(user_id=user_id)
-    await message.answer(
+    await _send(
+        message, state,
         f"Add user `{user_id}` to SAFE list for `{chat_id}`?",
         reply_markup=confirm_keyboard("add_safe"),
     )
 
 
-@router.callback_query(IsAdminOrOwner(), F.data == "confirm:add_safe")
+@cbs.on("confirm:add_safe")
 async def admin_confirm_add_safe(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     data = await state.get_data()
@@ -216,15 +287,16 @@ async def admin_confirm_add_safe(cb: CallbackQuery, state: FSMContext):
     chat_id = int(_get_ctx_chat_id(data))
 
     await db.add_safe(user_id, chat_id=chat_id)
-    await state.clear()
-    await cb.message.answer(f"✅ User {user_id} added to SAFE for {chat_id}.")
+    safe_users.add(user_id, chat_id)
+    await _finish(state)
+    await _show(cb, state, f"✅ User {user_id} added to SAFE for {chat_id}.")
 
 
 # =========================
 # REMOVE SAFE USER (TARGET)
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data == "admin:remove_safe")
+@cbs.on("admin:remove_safe")
 async def remove_safe_menu(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
@@ -233,33 +305,29 @@ async def remove_safe_menu(cb: CallbackQuery, state: FSMContext):
 
     safe_ids = await db.list_safe(chat_id)
     if not safe_ids:
-        await cb.message.answer("SAFE list (Target) خالیه.")
+        await _show(cb, state, "SAFE list (Target) خالیه.")
         return
 
     kb = InlineKeyboardBuilder()
     for uid in safe_ids[:30]:
-        kb.button(text=f"Remove {uid}", callback_data=f"safe:rm:{uid}")
+        kb.button(text=f"Remove {uid}", callback_data=SafeCb(op="rm", user_id=uid))
     kb.button(text="Close", callback_data="cancel")
     kb.adjust(1)
 
-    await cb.message.answer("کدوم کاربر از SAFE حذف بشه؟", reply_markup=kb.as_markup())
+    await _show(cb, state, "کدوم کاربر از SAFE حذف بشه؟", reply_markup=kb.as_markup())
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.startswith("safe:rm:"))
-async def do_remove_safe(cb: CallbackQuery, state: FSMContext):
+@cbs.on("safe:rm", parser=SafeCb)
+async def do_remove_safe(cb: CallbackQuery, state: FSMContext, data: SafeCb):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
     if not chat_id:
         return
 
-    try:
-        user_id = int(cb.data.split(":")[-1])
-    except Exception:
-        await cb.message.answer("Bad data.")
-        return
-
+    user_id = data.user_id
     await db.remove_safe(user_id, chat_id=chat_id)
-    await cb.message.answer(f"✅ Removed {user_id} from SAFE for {chat_id}.")
+    safe_users.discard(user_id, chat_id)
+    await _show(cb, state, f"✅ Removed {user_id} from SAFE for {chat_id}.")
 
 
 # =========================
@@ -269,7 +337,7 @@ async def do_remove_safe(cb: CallbackQuery, state: FSMContext):
 BAN_STATE_WAIT_ID = "ban:wait_user_id"
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"ban:target", "ban:global"}))
+@cbs.on("ban:target", "ban:global")
 async def ban_open(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
 
@@ -279,25 +347,24 @@ async def ban_open(cb: CallbackQuery, state: FSMContext):
         if not chat_id:
             return
         await state.update_data(ban_mode="target", ban_chat_id=chat_id)
-        await cb.message.answer("⛔ Ban (Target): user_id عددی رو بفرست:")
+        await _show(cb, state, "⛔ Ban (Target): user_id عددی رو بفرست:")
     else:
         await state.update_data(ban_mode="global", ban_chat_id=None)
-        await cb.message.answer("🌍 Global Ban: user_id عددی رو بفرست:")
+        await _show(cb, state, "🌍 Global Ban: user_id عددی رو بفرست:")
 
     await state.set_state(BAN_STATE_WAIT_ID)
 
 
-@router.message(IsAdminOrOwner(), F.chat.type == "private")
+@router.message(StateFilter(BAN_STATE_WAIT_ID), F.chat.type == "private", IsAdminOrOwner())
 async def ban_receive_user_id(message: Message, state: FSMContext):
     """
     این handler فقط وقتی فعال میشه که state روی BAN_STATE_WAIT_ID باشه.
     چون aiogram v3 با state string هم کار می‌کنه، ما states.py رو دست نزدیم.
+    (StateFilter لازمه؛ بدونش این handler همه پیام‌های private بعدی رو می‌بلعید.)
     """
-    if (await state.get_state()) != BAN_STATE_WAIT_ID:
-        return
 
     if not _is_numeric(message.text):
-        await message.answer("ID must be numeric.")
+        await _send(message, state, "ID must be numeric.")
         return
 
     data = await state.get_data()
@@ -308,48 +375,43 @@ async def ban_receive_user_id(message: Message, state: FSMContext):
     await state.update_data(user_id=user_id)
 
     if ban_mode == "target":
-        await message.answer(
+        await _send(
+            message, state,
             f"⛔ Ban user `{user_id}` for Target `{ban_chat_id}`?",
             reply_markup=confirm_keyboard("ban_target"),
         )
     else:
-        await message.answer(
+        await _send(
+            message, state,
             f"🌍 Global Ban user `{user_id}` (all groups via DB/guard logic)?",
             reply_markup=confirm_keyboard("ban_global"),
         )
 
 
-@router.callback_query(IsAdminOrOwner(), F.data == "confirm:ban_target")
+@cbs.on("confirm:ban_target")
 async def confirm_ban_target(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     data = await state.get_data()
     user_id = int(data.get("user_id"))
     chat_id = int(data.get("ban_chat_id"))
 
-    # 1) store in DB
-    await db.add_ban(user_id, chat_id)
-
-    # 2) try to ban in Telegram (optional, but usually expected)
-    ban_ok = False
-    ban_err = None
-    try:
-        await cb.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
-        ban_ok = True
-    except Exception as e:
-        ban_err = str(e)
+    async def ban():
+        # DB ban + queued Telegram ban in one transaction; the outbox worker retries
+        await db.add_ban(user_id, chat_id, enforce=True)
+        bans.add(user_id, chat_id)
 
-    await state.clear()
+    await member_lanes.run((chat_id, user_id), ban)
+    outbox.notify()
 
-    if ban_ok:
-        await cb.message.answer(f"✅ Banned {user_id} in Target {chat_id}. (DB + Telegram)")
-    else:
-        await cb.message.answer(
-            f"⚠️ Added to DB ban list, but Telegram ban failed.\n"
-            f"user_id={user_id} chat_id={chat_id}\n\nError:\n{ban_err}"
-        )
+    await _finish(state)
+    await _show(
+        cb, state,
+        f"✅ Banned {user_id} in Target {chat_id}. (DB, Telegram ban queued)\n"
+        f"Outbox backlog: {await outbox.backlog()}"
+    )
 
 
-@router.callback_query(IsAdminOrOwner(), F.data == "confirm:ban_global")
+@cbs.on("confirm:ban_global")
 async def confirm_ban_global(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     data = await state.get_data()
@@ -357,16 +419,17 @@ async def confirm_ban_global(cb: CallbackQuery, state: FSMContext):
 
     # Global => chat_id NULL
     await db.add_ban(user_id, None)
+    bans.add(user_id, None)
 
-    await state.clear()
-    await cb.message.answer(f"✅ Global banned {user_id} (DB).")
+    await _finish(state)
+    await _show(cb, state, f"✅ Global banned {user_id} (DB).")
 
 
 # =========================
 # UNBAN MENUS (TARGET + GLOBAL)
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"admin:unban", "owner:unban"}))
+@cbs.on("admin:unban", "owner:unban")
 async def unban_menu_target(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
@@ -375,83 +438,66 @@ async def unban_menu_target(cb: CallbackQuery, state: FSMContext):
 
     bans = await db.list_bans(chat_id)
     if not bans:
-        await cb.message.answer("⛔ Ban list (Target) is empty.")
+        await _show(cb, state, "⛔ Ban list (Target) is empty.")
         return
 
     kb = InlineKeyboardBuilder()
     for (u, _g) in bans[:30]:
-        kb.button(text=f"Unban {u}", callback_data=f"do_unban:{u}:{chat_id}")
+        kb.button(text=f"Unban {u}", callback_data=UnbanCb(user_id=u, chat_id=chat_id))
     kb.button(text="Close", callback_data="cancel")
     kb.adjust(1)
-    await cb.message.answer("Select a ban to remove (Target):", reply_markup=kb.as_markup())
+    await _show(cb, state, "Select a ban to remove (Target):", reply_markup=kb.as_markup())
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"admin:unban_global", "owner:unban_global"}))
-async def unban_menu_global(cb: CallbackQuery):
+@cbs.on("admin:unban_global", "owner:unban_global")
+async def unban_menu_global(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
 
     bans = await db.list_bans(None)
     if not bans:
-        await cb.message.answer("⛔ Global ban list is empty.")
+        await _show(cb, state, "⛔ Global ban list is empty.")
         return
 
     kb = InlineKeyboardBuilder()
     for (u, _g) in bans[:30]:
-        kb.button(text=f"Global Unban {u}", callback_data=f"do_unban_global:{u}")
+        kb.button(text=f"Global Unban {u}", callback_data=GlobalUnbanCb(user_id=u))
     kb.button(text="Close", callback_data="cancel")
     kb.adjust(1)
-    await cb.message.answer("Select a global ban to remove:", reply_markup=kb.as_markup())
+    await _show(cb, state, "Select a global ban to remove:", reply_markup=kb.as_markup())
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.startswith("do_unban:"))
-async def do_unban(cb: CallbackQuery):
+@cbs.on("do_unban", parser=UnbanCb)
+async def do_unban(cb: CallbackQuery, state: FSMContext, data: UnbanCb):
     await _safe_answer(cb)
 
-    try:
-        _, u_str, g_str = cb.data.split(":")
-        user_id = int(u_str)
-        group_id = int(g_str)
-    except Exception:
-        await cb.message.answer("Bad data.")
-        return
+    user_id, group_id = data.user_id, data.chat_id
 
-    await db.remove_ban(user_id, group_id)
+    async def unban():
+        # DB change + queued Telegram unban in one transaction
+        await db.remove_ban(user_id, group_id, enforce=True)
+        bans.discard(user_id, group_id)
 
-    unban_ok = False
-    unban_err = None
-    try:
-        await cb.bot.unban_chat_member(chat_id=group_id, user_id=user_id, only_if_banned=True)
-        unban_ok = True
-    except Exception as e:
-        unban_err = str(e)
+    # same lane as the guard: an in-flight automatic ban cannot overtake this
+    await member_lanes.run((group_id, user_id), unban)
+    outbox.notify()
 
-    if unban_ok:
-        await cb.message.answer(f"✅ Unbanned {user_id} in {group_id}.")
-    else:
-        await cb.message.answer(
-            f"⚠️ Removed from DB but Telegram unban failed.\n"
-            f"user_id={user_id} group_id={group_id}\n\nError:\n{unban_err}"
-        )
+    await _show(cb, state, f"✅ Unbanned {user_id} in {group_id}. (DB, Telegram unban queued)")
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.startswith("do_unban_global:"))
-async def do_unban_global(cb: CallbackQuery):
+@cbs.on("do_unban_global", parser=GlobalUnbanCb)
+async def do_unban_global(cb: CallbackQuery, state: FSMContext, data: GlobalUnbanCb):
     await _safe_answer(cb)
-    try:
-        user_id = int(cb.data.split(":")[-1])
-    except Exception:
-        await cb.message.answer("Bad data.")
-        return
-
+    user_id = data.user_id
     await db.remove_ban(user_id, None)
-    await cb.message.answer(f"✅ Global unbanned {user_id} (DB).")
+    bans.discard(user_id, None)
+    await _show(cb, state, f"✅ Global unbanned {user_id} (DB).")
 
 
 # =========================
 # LISTS (TARGET + GLOBAL)
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"owner:lists", "admin:lists"}))
+@cbs.on("owner:lists", "admin:lists")
 async def show_lists_target(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
@@ -490,11 +536,11 @@ async def show_lists_target(cb: CallbackQuery, state: FSMContext):
     for (gid, title, tp) in groups[:30]:
         lines.append(f"{gid} | {title or '-'} | {tp}")
 
-    await cb.message.answer("\n".join(lines))
+    await _show(cb, state, "\n".join(lines))
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"owner:lists_global", "admin:lists_global"}))
-async def show_lists_global(cb: CallbackQuery):
+@cbs.on("owner:lists_global", "admin:lists_global")
+async def show_lists_global(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
 
     safe_ids = await db.list_safe(None)
@@ -515,32 +561,740 @@ async def show_lists_global(cb: CallbackQuery):
     if len(bans) > 30:
         lines.append("...")
 
-    await cb.message.answer("\n".join(lines))
+    await _show(cb, state, "\n".join(lines))
+
+
+# =========================
+# OWNER: GUARD POLICY (TARGET)
+# =========================
+
+@cbs.on("owner:policy", role=OWNER)
+async def policy_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+
+    row = await db.get_policy(chat_id)
+    if row:
+        rules_json, default_action = row
+        current = json.dumps(
+            {"default": default_action, "rules": json.loads(rules_json)},
+            ensure_ascii=False,
+            indent=1,
+        )
+    else:
+        current = "(none - everyone not SAFE is banned)"
+
+    await state.set_state(OwnerStates.waiting_for_policy_json)
+    await _show(
+        cb, state,
+        f"🛡 Guard policy for {chat_id}:\n<pre>{html.escape(current)}</pre>\n\n"
+        "Send new policy as JSON (list of rules or {\"default\": ..., \"rules\": [...]}),\n"
+        "or /reset to remove the policy."
+    )
+
+
+@router.message(IsOwner(), OwnerStates.waiting_for_policy_json)
+async def policy_receive(message: Message, state: FSMContext):
+    data = await state.get_data()
+    chat_id = _get_ctx_chat_id(data)
+    if not chat_id:
+        await _send(message, state, "Target انتخاب نشده.")
+        return
+
+    text = (message.text or "").strip()
+    if text == "/reset":
+        await db.delete_policy(chat_id)
+        policies.invalidate(chat_id)
+        await state.set_state(None)
+        await _send(message, state, f"✅ Policy removed for {chat_id}.")
+        return
+
+    try:
+        rules, default_action = parse_policy_text(text)
+    except PolicyError as e:
+        await _send(message, state, f"❌ {html.escape(str(e))}")
+        return
+
+    await db.set_policy(chat_id, json.dumps(rules, ensure_ascii=False), default_action)
+    policies.invalidate(chat_id)
+    await state.set_state(None)
+    await _send(message, state, f"✅ Policy saved for {chat_id}: {len(rules)} rule(s), default={default_action}.")
+
+
+# =========================
+# FOLDERS (TARGET)
+# =========================
+
+async def _folder_changed(folder_id: int, chat_id: int):
+    # keep the join-path index and the compiled policy of the folder's chat in sync
+    await folder_index.refresh_folder(folder_id)
+    policies.invalidate(chat_id)
+
+
+async def _folder_view(folder_id: int):
+    folder = await db.get_folder(folder_id)
+    if not folder:
+        return None, None
+    _fid, chat_id, name = folder
+    members = await db.list_folder_members_by_id(folder_id)
+    safe_chats = await db.list_folder_safe_chats(folder_id)
+
+    lines = [f"📂 Folder <code>{html.escape(name)}</code> (chat {chat_id})", f"👤 Members: {len(members)}"]
+    for uid in members[:30]:
+        lines.append(str(uid))
+    if len(members) > 30:
+        lines.append("...")
+    lines.append("")
+    lines.append("✅ SAFE for: " + (", ".join(str(c) for c in safe_chats) if safe_chats else "-"))
+
+    own_safe = chat_id in safe_chats
+    kb = InlineKeyboardBuilder()
+    kb.button(text="➕ Add users", callback_data=FolderCb(op="add", folder_id=folder_id))
+    kb.button(text="➖ Remove users", callback_data=FolderCb(op="rm", folder_id=folder_id))
+    kb.button(
+        text="🚫 Not SAFE for this chat" if own_safe else "✅ SAFE for this chat",
+        callback_data=FolderCb(op="safe", folder_id=folder_id),
+    )
+    kb.button(text="🌐 SAFE for chats…", callback_data=FolderCb(op="chats", folder_id=folder_id))
+    kb.button(text="🗑 Delete folder", callback_data=FolderCb(op="del", folder_id=folder_id))
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(2, 1, 1, 1, 1)
+    return "\n".join(lines), kb.as_markup()
+
+
+@cbs.on("owner:folders", "admin:folders")
+async def folders_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+
+    folders = await db.list_folders(chat_id)
+
+    kb = InlineKeyboardBuilder()
+    for folder_id, name in folders[:50]:
+        kb.button(text=f"📂 {name}", callback_data=FolderCb(op="open", folder_id=folder_id))
+    kb.button(text="➕ New Folder", callback_data="fld:new")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+
+    await _show(cb, state, f"📂 Folders ({chat_id}): {len(folders)}", reply_markup=kb.as_markup())
+
+
+@cbs.on("fld:new")
+async def folder_new(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+    await state.set_state(AdminStates.waiting_for_create_folder_name)
+    await _show(cb, state, "Send new folder name:")
+
+
+@router.message(IsAdminOrOwner(), AdminStates.waiting_for_create_folder_name)
+async def folder_receive_name(message: Message, state: FSMContext):
+    data = await state.get_data()
+    chat_id = _get_ctx_chat_id(data)
+    name = (message.text or "").strip()
+    if not chat_id:
+        await _send(message, state, "Target انتخاب نشده.")
+        return
+    if not name or len(name) > 64:
+        await _send(message, state, "Folder name must be 1-64 chars.")
+        return
+
+    await db.create_folder(chat_id, name)
+    await state.set_state(None)
+    await _send(message, state, f"✅ Folder <code>{html.escape(name)}</code> ready for {chat_id}.")
+
+
+@cbs.on("fld:open", parser=FolderCb)
+async def folder_open(cb: CallbackQuery, state: FSMContext, data: FolderCb):
+    await _safe_answer(cb)
+    text, markup = await _folder_view(data.folder_id)
+    if text is None:
+        await _show(cb, state, "Folder not found.")
+        return
+    await _show(cb, state, text, reply_markup=markup)
+
+
+@cbs.on("fld:add", "fld:rm", "fld:chats", parser=FolderCb)
+async def folder_ask_ids(cb: CallbackQuery, state: FSMContext, data: FolderCb):
+    await _safe_answer(cb)
+    op = data.op
+    await state.update_data(folder_id=data.folder_id)
+    if op == "add":
+        await state.set_state(AdminStates.waiting_for_folder_add_user_id)
+        await _show(cb, state, "Send user_ids to ADD (separated by space/newline):")
+    elif op == "rm":
+        await state.set_state(AdminStates.waiting_for_folder_remove_user_id)
+        await _show(cb, state, "Send user_ids to REMOVE (separated by space/newline):")
+    else:
+        await state.set_state(AdminStates.waiting_for_folder_safe_chat_ids)
+        await _show(
+            cb, state,
+            "Send chat_ids this folder is SAFE for (replaces current list), or `-` to clear:"
+        )
+
+
+@router.message(
+    IsAdminOrOwner(),
+    StateFilter(
+        AdminStates.waiting_for_folder_add_user_id,
+        AdminStates.waiting_for_folder_remove_user_id,
+        AdminStates.waiting_for_folder_safe_chat_ids,
+    ),
+)
+async def folder_receive_ids(message: Message, state: FSMContext):
+    current = await state.get_state()
+    data = await state.get_data()
+    folder = await db.get_folder(int(data.get("folder_id") or 0))
+    if not folder:
+        await state.set_state(None)
+        await _send(message, state, "Folder not found.")
+        return
+    folder_id, chat_id, name = folder
+
+    text = (message.text or "").strip()
+    ids = [] if text == "-" else _parse_int_list(text)
+    if not ids and current != AdminStates.waiting_for_folder_safe_chat_ids.state:
+        await _send(message, state, "هیچ ID معتبری پیدا نشد.")
+        return
+
+    # each bulk op is one transaction in db
+    if current == AdminStates.waiting_for_folder_add_user_id.state:
+        n = await db.folder_add_users(folder_id, ids)
+        result = f"✅ Added {n} user(s) to <code>{html.escape(name)}</code>."
+    elif current == AdminStates.waiting_for_folder_remove_user_id.state:
+        n = await db.folder_remove_users(folder_id, ids)
+        result = f"✅ Removed {n} user(s) from <code>{html.escape(name)}</code>."
+    else:
+        await db.set_folder_safe_chats(folder_id, ids)
+        result = f"✅ <code>{html.escape(name)}</code> is SAFE for {len(ids)} chat(s)."
+
+    await _folder_changed(folder_id, chat_id)
+    await state.set_state(None)
+    view, markup = await _folder_view(folder_id)
+    await _send(message, state, f"{result}\n\n{view}", reply_markup=markup)
+
+
+@cbs.on("fld:safe", parser=FolderCb)
+async def folder_toggle_safe(cb: CallbackQuery, state: FSMContext, data: FolderCb):
+    await _safe_answer(cb)
+    folder = await db.get_folder(data.folder_id)
+    if not folder:
+        await _show(cb, state, "Folder not found.")
+        return
+    folder_id, chat_id, _name = folder
+
+    safe_chats = set(await db.list_folder_safe_chats(folder_id))
+    safe_chats ^= {chat_id}
+    await db.set_folder_safe_chats(folder_id, sorted(safe_chats))
+    await _folder_changed(folder_id, chat_id)
+
+    text, markup = await _folder_view(folder_id)
+    await _show(cb, state, text, reply_markup=markup)
+
+
+@cbs.on("fld:del", parser=FolderCb)
+async def folder_delete(cb: CallbackQuery, state: FSMContext, data: FolderCb):
+    await _safe_answer(cb)
+    folder = await db.get_folder(data.folder_id)
+    if not folder:
+        await _show(cb, state, "Folder not found.")
+        return
+    folder_id, chat_id, name = folder
+
+    await db.delete_folder(folder_id)
+    folder_index.drop_folder(folder_id)
+    policies.invalidate(chat_id)
+    await _show(cb, state, f"🗑 Folder <code>{html.escape(name)}</code> deleted.")
+
+
+# =========================
+# LINKS (TARGET)
+# =========================
+
+async def _links_view(chat_id: int):
+    links = await db.list_links(chat_id)
+    lines = [f"🔗 Links ({chat_id}): {len(links)}"]
+    kb = InlineKeyboardBuilder()
+    for link_id, name, url, _created in links[:30]:
+        lines.append(f"{link_id}. {html.escape(name)} — {html.escape(url)}")
+        kb.button(text=f"🗑 {name} #{link_id}", callback_data=LinkCb(op="del", link_id=link_id))
+    if len(links) > 30:
+        lines.append("...")
+    kb.button(text="➕ Add link", callback_data="lnk:add")
+    kb.button(text="🔄 New invite link", callback_data="lnk:invite")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+    return "\n".join(lines), kb.as_markup()
+
+
+@cbs.on("owner:links", "admin:links")
+async def links_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+    text, markup = await _links_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup, disable_web_page_preview=True)
+
+
+@cbs.on("lnk:add")
+async def link_add(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+    await state.set_state(AdminStates.waiting_for_link)
+    await _show(cb, state, "Send `name url` (example: `main https://t.me/+abc`):")
+
+
+@router.message(IsAdminOrOwner(), AdminStates.waiting_for_link)
+async def link_receive(message: Message, state: FSMContext):
+    data = await state.get_data()
+    chat_id = _get_ctx_chat_id(data)
+    if not chat_id:
+        await _send(message, state, "Target انتخاب نشده.")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) < 2:
+        await _send(message, state, "Format: `name url`")
+        return
+    name, url = " ".join(parts[:-1]), parts[-1]
+
+    added = await db.add_link(chat_id, name, url)
+    await state.set_state(None)
+    await _send(message, state, "✅ Link saved." if added else "ℹ️ This URL is already stored for Target.")
+
+
+@cbs.on("lnk:invite")
+async def link_new_invite(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+
+    try:
+        row = await create_invite_link(cb.bot, chat_id)
+    except Exception as e:
+        await _show(cb, state, f"⚠️ Telegram refused to create a link:\n{html.escape(str(e))}")
+        return
+
+    await db.add_invite_links([row])
+    text, markup = await _links_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup, disable_web_page_preview=True)
+
+
+@cbs.on("lnk:del", parser=LinkCb)
+async def link_delete(cb: CallbackQuery, state: FSMContext, data: LinkCb):
+    await _safe_answer(cb)
+    link = await db.get_link(data.link_id)
+    if not link:
+        await _show(cb, state, "Link not found.")
+        return
+    link_id, chat_id, _name, url, is_invite = link
+
+    if is_invite:
+        try:
+            await cb.bot.revoke_chat_invite_link(chat_id=chat_id, invite_link=url)
+        except Exception as e:
+            # already revoked / bot lost its rights: the row goes either way
+            report("panel.revoke_failed", e, chat_id=chat_id)
+
+    await db.delete_link(link_id)
+    text, markup = await _links_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup, disable_web_page_preview=True)
 
 
 # =========================
-# FOLDERS / LINKS / CLONE (placeholder handlers for now)
+# STATS (OWNER)
 # =========================
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"owner:folders", "admin:folders"}))
-async def folders_placeholder(cb: CallbackQuery, state: FSMContext):
+@cbs.on("owner:stats", "st:all", role=OWNER)
+async def stats_view(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    # Target chat if one is selected, all groups otherwise (or on request)
+    chat_id = None
+    if cb.data == "owner:stats":
+        chat_id = _get_ctx_chat_id(await state.get_data())
+        chat_id = int(chat_id) if chat_id else None
+
+    summary = await stats.summary(chat_id)
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔄 Refresh", callback_data=cb.data)
+    if chat_id is not None:
+        kb.button(text="🌍 All groups", callback_data="st:all")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+
+    await _show(cb, state, format_summary(chat_id, summary), reply_markup=kb.as_markup())
+
+
+# =========================
+# PROFILING (OWNER)
+# =========================
+
+PROFILE_SECONDS = (10, 30, 60)
+
+
+def _profiling_view(bot):
+    if profiler.running:
+        left = max(0, int(profiler.until - time.monotonic()))
+        cpu = f"🔬 {profiler.mode} running, {left}s left"
+    else:
+        cpu = "🔬 CPU profiler: idle"
+    lines = [
+        cpu,
+        f"🧠 tracemalloc: {'ON' if profiler.tracing else 'OFF'}",
+        f"🐢 slow log: {len(slow_log.entries)} kept / {slow_log.total} total "
+        f"(updates ≥ {slow_log.handler_ms:.0f}ms, DB ≥ {slow_log.db_ms:.0f}ms)",
+    ]
+    # Bot API latency per method (TunedSession; absent with a plain session)
+    summary = getattr(bot.session, "summary", None)
+    if summary is not None:
+        http = bot.session.stats()
+        lines.append("")
+        lines.append(
+            f"🌐 Bot API ({http['json']}): {http['requests']} requests, "
+            f"connections reused {http['reuse_ratio'] * 100:.0f}%"
+        )
+        lines.extend(html.escape(line) for line in summary())
+    recent = slow_log.summary()
+    if recent:
+        lines.append("")
+        lines.extend(html.escape(line) for line in recent)
+
+    kb = InlineKeyboardBuilder()
+    if profiler.running:
+        kb.button(text="⏹ Stop profiler", callback_data=ProfCb(op="cancel", seconds=0))
+    else:
+        for seconds in PROFILE_SECONDS:
+            kb.button(text=f"▶️ Sample {seconds}s", callback_data=ProfCb(op="sample", seconds=seconds))
+        for seconds in PROFILE_SECONDS:
+            kb.button(text=f"▶️ cProfile {seconds}s", callback_data=ProfCb(op="cprofile", seconds=seconds))
+    if profiler.tracing:
+        kb.button(text="📸 Memory snapshot", callback_data=ProfCb(op="mem", seconds=0))
+        kb.button(text="🧠 tracemalloc OFF", callback_data=ProfCb(op="trace_off", seconds=0))
+    else:
+        kb.button(text="🧠 tracemalloc ON", callback_data=ProfCb(op="trace_on", seconds=0))
+    if slow_log.entries:
+        kb.button(text="📄 Slow log file", callback_data=ProfCb(op="slow", seconds=0))
+    kb.button(text="🔄 Refresh", callback_data="owner:profiling")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(*([1] if profiler.running else [3, 3]), 1)
+    return "\n".join(lines), kb.as_markup()
+
+
+@cbs.on("owner:profiling", role=OWNER)
+async def profiling_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    text, markup = _profiling_view(cb.bot)
+    await _show(cb, state, text, reply_markup=markup)
+
+
+@cbs.on("prof", role=OWNER, parser=ProfCb)
+async def profiling_action(cb: CallbackQuery, state: FSMContext, data: ProfCb):
+    op = data.op
+    if op in ("sample", "cprofile"):
+        started = profiler.start(cb.bot, cb.from_user.id, op, min(max(data.seconds, 1), 300))
+        await _safe_answer(cb, f"Profiling {data.seconds}s…" if started else "A session is already running.")
+    elif op == "cancel":
+        profiler.cancel()
+        await _safe_answer(cb, "Stopped.")
+    elif op == "trace_on":
+        # the baseline snapshot walks the heap: keep it off the loop
+        await asyncio.to_thread(profiler.trace_on)
+        await _safe_answer(cb, "tracemalloc ON")
+    elif op == "trace_off":
+        profiler.trace_off()
+        await _safe_answer(cb, "tracemalloc OFF")
+    elif op == "mem":
+        await _safe_answer(cb, "Taking snapshot…")
+        if not await profiler.memory_report(cb.bot, cb.from_user.id):
+            await _show(cb, state, "tracemalloc is off.")
+            return
+    elif op == "slow":
+        await _safe_answer(cb)
+        await cb.message.answer_document(
+            BufferedInputFile(slow_log.report().encode(), filename=f"eclis-slow-{int(time.time())}.txt"),
+            caption=f"🐢 {len(slow_log.entries)} slow entr{'y' if len(slow_log.entries) == 1 else 'ies'}",
+        )
+    else:
+        await _safe_answer(cb)
+    text, markup = _profiling_view(cb.bot)
+    await _show(cb, state, text, reply_markup=markup)
+
+
+# =========================
+# SPAM FILTER (TARGET)
+# =========================
+
+async def _spam_view(chat_id: int):
+    rows = await db.list_block_patterns(chat_id)
+    lines = [f"🧹 Spam filter for {chat_id}: {len(rows)} pattern(s)"]
+    for kind, pattern in rows[:40]:
+        lines.append(f"{kind}: {html.escape(pattern)}")
+    if len(rows) > 40:
+        lines.append("...")
+    lines.append("")
+    lines.append("پیام‌هایی که با این لیست match شوند پاک می‌شوند و فرستنده بن می‌شود.")
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="➕ Add patterns", callback_data="spam:add")
+    if rows:
+        kb.button(text="➖ Remove patterns", callback_data="spam:remove")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+    return "\n".join(lines), kb.as_markup()
+
+
+@cbs.on("owner:spam", "admin:spam")
+async def spam_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        return
+    text, markup = await _spam_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup, disable_web_page_preview=True)
+
+
+@cbs.on("spam:add", "spam:remove")
+async def spam_edit(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
     if not chat_id:
         return
-    await cb.message.answer("📂 Folders: زیرساخت DB آماده شد. UI کاملش مرحله بعد.")
+    adding = cb.data == "spam:add"
+    await state.set_state(AdminStates.waiting_for_block_add if adding else AdminStates.waiting_for_block_remove)
+    await _show(
+        cb, state,
+        ("Send patterns to add" if adding else "Send patterns to remove") + ", one per line:\n"
+        "<code>crypto signal</code>  (word/phrase)\n"
+        "<code>url bit.ly</code>  (link or domain)\n"
+        "<code>invite *</code>  (any Telegram invite link)",
+    )
+
+
+@router.message(IsAdminOrOwner(), StateFilter(AdminStates.waiting_for_block_add, AdminStates.waiting_for_block_remove))
+async def spam_receive(message: Message, state: FSMContext):
+    data = await state.get_data()
+    chat_id = _get_ctx_chat_id(data)
+    if not chat_id:
+        await _send(message, state, "Target انتخاب نشده.")
+        return
+
+    try:
+        rows = parse_blocklist_text(message.text or "")
+    except BlocklistError as e:
+        await _send(message, state, f"❌ {html.escape(str(e))}")
+        return
+
+    if await state.get_state() == AdminStates.waiting_for_block_add.state:
+        n = await db.add_block_patterns(chat_id, rows)
+        await spam_filter.add(chat_id, rows)
+        result = f"✅ {n} pattern(s) added"
+    else:
+        n = await db.remove_block_patterns(chat_id, rows)
+        await spam_filter.remove(chat_id, rows)
+        result = f"✅ {n} pattern(s) removed"
+
+    await state.set_state(None)
+    text, markup = await _spam_view(chat_id)
+    await _send(message, state, f"{result}\n\n{text}", reply_markup=markup, disable_web_page_preview=True)
 
 
-@router.callback_query(IsAdminOrOwner(), F.data.in_({"owner:links", "admin:links"}))
-async def links_placeholder(cb: CallbackQuery, state: FSMContext):
+# =========================
+# OWNER: JOIN REQUEST GATE
+# =========================
+
+def _join_gate_view(chat_id: int):
+    on = join_gate.enabled(chat_id)
+    text = (
+        f"🚪 Join Requests Gate — {chat_id}\n\n"
+        f"Status: {'✅ ON' if on else '⛔ OFF'}\n\n"
+        "وقتی روشن باشد، درخواست‌های عضویت (join request) همین گروه را بات خودش "
+        "قبل از ورود جواب می‌دهد: SAFE تایید، بن‌شده‌ها و کسانی که policy بن می‌کند رد.\n"
+        "برای کار کردن، گروه باید «Approve new members» روشن داشته باشد و بات ادمین با "
+        "دسترسی Invite Users باشد."
+    )
+    kb = InlineKeyboardBuilder()
+    kb.button(text="⛔ Turn OFF" if on else "✅ Turn ON", callback_data="jg:off" if on else "jg:on")
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+    return text, kb.as_markup()
+
+
+@cbs.on("owner:join_gate", role=OWNER)
+async def join_gate_menu(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     chat_id = await _require_ctx(cb, state)
     if not chat_id:
         return
-    await cb.message.answer("🔗 Links: زیرساخت DB آماده شد. UI کاملش مرحله بعد.")
+    text, markup = _join_gate_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup)
+
+
+@cbs.on("jg:on", "jg:off", role=OWNER)
+async def join_gate_toggle(cb: CallbackQuery, state: FSMContext):
+    chat_id = await _require_ctx(cb, state)
+    if not chat_id:
+        await _safe_answer(cb)
+        return
+    enabled = cb.data == "jg:on"
+    await db.set_join_gate(chat_id, enabled)
+    join_gate.set_enabled(chat_id, enabled)
+    await _safe_answer(cb, "✅ Gate ON" if enabled else "⛔ Gate OFF")
+    text, markup = _join_gate_view(chat_id)
+    await _show(cb, state, text, reply_markup=markup)
+
+
+# =========================
+# OWNER: BACKUP / RESTORE
+# =========================
+
+@cbs.on("owner:backup", role=OWNER)
+async def backup_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    snapshots = list_backups()
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📦 Backup now & export", callback_data="bk:now")
+    for p in snapshots[:10]:
+        kb.button(text=f"♻️ Restore {p.name[len('eclis_guard-'):-len('.sqlite3.gz')]}", callback_data=BackupCb(op="ask", name=p.name))
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+
+    await _show(cb, state, f"💾 Backups: {len(snapshots)}", reply_markup=kb.as_markup())
+
+
+@cbs.on("bk:now", role=OWNER)
+async def backup_now(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb, "Backup started…")
+    try:
+        res = await create_backup()
+    except Exception as e:
+        await _show(cb, state, f"⚠️ Backup failed:\n{html.escape(str(e))}")
+        return
+
+    await cb.message.answer_document(
+        FSInputFile(res.path),
+        caption=(
+            f"✅ {res.path.name}\n"
+            f"{res.size / 1024:.1f} KB, {res.seconds:.2f}s, steps={res.steps}, restarts={res.restarts}\n"
+            f"max write wait {res.max_write_wait_ms:.1f}ms, max loop lag {res.max_loop_lag_ms:.1f}ms"
+        ),
+    )
+
+
+@cbs.on("bk:ask", role=OWNER, parser=BackupCb)
+async def backup_ask_restore(cb: CallbackQuery, state: FSMContext, data: BackupCb):
+    await _safe_answer(cb)
+    name = data.name
+    kb = InlineKeyboardBuilder()
+    kb.button(text="✅ Restore", callback_data=BackupCb(op="do", name=name))
+    kb.button(text="❌ Cancel", callback_data="cancel")
+    await _show(
+        cb, state,
+        f"♻️ Restore `{name}`?\nCurrent data is snapshotted first.",
+        reply_markup=kb.as_markup(),
+    )
 
 
-@router.callback_query(IsAdminOrOwner(), F.data == "clone:menu")
+@cbs.on("bk:do", role=OWNER, parser=BackupCb)
+async def backup_do_restore(cb: CallbackQuery, state: FSMContext, data: BackupCb):
+    await _safe_answer(cb, "Restoring…")
+    name = data.name
+    try:
+        safety = await restore_backup(name)
+    except FileNotFoundError:
+        await _show(cb, state, "Backup not found.")
+        return
+    except Exception as e:
+        await _show(cb, state, f"⚠️ Restore failed:\n{html.escape(str(e))}")
+        return
+
+    # everything cached from the old state is stale now
+    await asyncio.gather(warm_all(), join_gate.load(), spam_filter.load(), flood.load())
+    policies.invalidate()
+    await _show(cb, state, f"✅ Restored {name}.\nPrevious state saved as {safety.path.name}.")
+
+
+# =========================
+# OWNER: BROADCAST
+# =========================
+
+@cbs.on("owner:broadcast", role=OWNER)
+async def broadcast_menu(cb: CallbackQuery, state: FSMContext):
+    await _safe_answer(cb)
+    data = await state.get_data()
+    chat_id = _get_ctx_chat_id(data)
+
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🌍 All registered groups", callback_data=BroadcastCb(op="to", ref=0))
+    # folder-defined subset = the chats that folder is SAFE for
+    if chat_id:
+        for folder_id, name in (await db.list_folders(chat_id))[:20]:
+            kb.button(text=f"📂 Chats of folder {name}", callback_data=BroadcastCb(op="to", ref=folder_id))
+    kb.button(text="Close", callback_data="cancel")
+    kb.adjust(1)
+    await _show(cb, state, "📣 Broadcast to:", reply_markup=kb.as_markup())
+
+
+@cbs.on("bc:to", role=OWNER, parser=BroadcastCb)
+async def broadcast_pick(cb: CallbackQuery, state: FSMContext, data: BroadcastCb):
+    await _safe_answer(cb)
+    await state.update_data(bc_folder_id=data.ref)
+    await state.set_state(OwnerStates.waiting_for_broadcast_message)
+    await _show(cb, state, "Send the message to broadcast (any type; it will be copied as-is):")
+
+
+@router.message(IsOwner(), OwnerStates.waiting_for_broadcast_message)
+async def broadcast_receive(message: Message, state: FSMContext):
+    data = await state.get_data()
+    folder_id = int(data.get("bc_folder_id") or 0)
+
+    if folder_id:
+        chat_ids = await db.list_folder_safe_chats(folder_id)
+    else:
+        chat_ids = [gid for gid, _title, _tp in await db.list_groups()]
+    await state.set_state(None)
+
+    if not chat_ids:
+        await _send(message, state, "هیچ چتی برای ارسال پیدا نشد.")
+        return
+
+    broadcast_id = await db.create_broadcast(message.chat.id, message.message_id, chat_ids)
+    progress = await message.bot.send_message(
+        message.chat.id,
+        f"📣 Broadcast #{broadcast_id} queued for {len(chat_ids)} chat(s)…",
+        reply_markup=cancel_markup(broadcast_id),
+    )
+    await db.set_broadcast_progress_message(broadcast_id, progress.chat.id, progress.message_id)
+    broadcasts.start(message.bot, broadcast_id)
+
+
+@cbs.on("bc:cancel", role=OWNER, parser=BroadcastCb)
+async def broadcast_cancel(cb: CallbackQuery, state: FSMContext, data: BroadcastCb):
+    broadcast_id = data.ref
+    if not broadcasts.cancel(broadcast_id):
+        # not running in this process (e.g. finished, or left over from a crash)
+        job = await db.get_broadcast(broadcast_id)
+        if job and job[3] == "running":
+            await db.set_broadcast_status(broadcast_id, "cancelled")
+    await _safe_answer(cb, "Cancelling…")
+
+
+# =========================
+# CLONE
+# =========================
+
+@cbs.on("clone:menu")
 async def clone_menu(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
     src_chat_id = await _require_ctx(cb, state)
@@ -548,7 +1302,8 @@ async def clone_menu(cb: CallbackQuery, state: FSMContext):
         return
 
     await state.set_state(OwnerStates.waiting_for_clone_target_ids)
-    await cb.message.answer(
+    await _show(
+        cb, state,
         f"🧬 Clone from {src_chat_id}\n"
         "Send target chat_ids separated by space (example: `-1001 -1002 -1003`)"
     )
@@ -559,34 +1314,31 @@ async def clone_receive_targets(message: Message, state: FSMContext):
     data = await state.get_data()
     src_chat_id = data.get("active_chat_id")
     if not src_chat_id:
-        await message.answer("Target (source) انتخاب نشده.")
+        await _send(message, state, "Target (source) انتخاب نشده.")
         return
 
-    parts = (message.text or "").split()
-    targets: list[int] = []
-    for p in parts:
-        try:
-            targets.append(int(p))
-        except Exception:
-            pass
+    targets = _parse_int_list(message.text)
 
     if not targets:
-        await message.answer("هیچ chat_id معتبری پیدا نشد.")
+        await _send(message, state, "هیچ chat_id معتبری پیدا نشد.")
         return
 
     for dst in targets:
         await db.clone_group_data(int(src_chat_id), int(dst))
+        policies.invalidate(int(dst))
+        await spam_filter.refresh(int(dst))
+    await asyncio.gather(folder_index.load(), safe_users.load(), bans.load())
 
-    await state.clear()
-    await message.answer(f"✅ Cloned data from {src_chat_id} to {len(targets)} target(s).")
+    await _finish(state)
+    await _send(message, state, f"✅ Cloned data from {src_chat_id} to {len(targets)} target(s).")
 
 
 # =========================
 # CANCEL
 # =========================
 
-@router.callback_query(F.data == "cancel")
+@cbs.on("cancel", role=PUBLIC)
 async def cancel_action(cb: CallbackQuery, state: FSMContext):
     await _safe_answer(cb)
-    await state.clear()
-    await cb.message.answer("Action cancelled.")
+    await _finish(state)
+    await _show(cb, state, "Action cancelled.")
@@ -2,7 +2,9 @@
 from aiogram import Router
 from aiogram.types import ChatMemberUpdated
 
+from app.chat_admins import chat_admins
 from app.db import db
+from app.flood import flood
 
 router = Router()
 
@@ -19,3 +21,6 @@ async def on_my_chat_member(event: ChatMemberUpdated):
 
     title = getattr(chat, "title", None)
     await db.upsert_group(chat_id=chat.id, title=title, chat_type=chat.type)
+    flood.track_group(chat.id)
+    # the bot's own rights changed; reload the admin list on next use
+    chat_admins.invalidate(chat.id)
@@ -0,0 +1,122 @@
+# app/invite_links.py
+"""
+Invite-link rotation job (opt-in: off unless INVITE_ROTATE_INTERVAL > 0).
+
+Every INVITE_ROTATE_INTERVAL seconds:
+  1) revoke + forget bot-generated links that have expired
+  2) create a fresh link (valid for INVITE_LINK_TTL) for every registered chat
+     that will not have a valid one before the next run
+
+Bot API calls go through `api_limiter` with at most INVITE_CONCURRENCY in flight,
+and results are written to the DB one batch at a time.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.config import INVITE_LINK_TTL, INVITE_ROTATE_INTERVAL, INVITE_CONCURRENCY
+from app.db import db
+from app.log import report
+from app.ratelimit import api_limiter
+
+logger = logging.getLogger("eclis.invite_links")
+
+BATCH_SIZE = 50
+LINK_NAME = "eclis-auto"
+
+
+async def _call(coro_factory):
+    """Rate-limited call with one retry on flood control."""
+    for attempt in (1, 2):
+        await api_limiter.acquire()
+        try:
+            return await coro_factory()
+        except TelegramRetryAfter as e:
+            if attempt == 2:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+async def create_invite_link(bot: Bot, chat_id: int, ttl: int = INVITE_LINK_TTL) -> Tuple[int, str, str, int]:
+    expires_at = int(time.time()) + ttl
+    link = await _call(
+        lambda: bot.create_chat_invite_link(chat_id=chat_id, name=LINK_NAME, expire_date=expires_at)
+    )
+    return chat_id, LINK_NAME, link.invite_link, expires_at
+
+
+async def generate_invite_links(bot: Bot, chat_ids: List[int]) -> int:
+    """Create links for many chats in batches; returns how many were stored."""
+    sem = asyncio.Semaphore(max(1, INVITE_CONCURRENCY))
+
+    async def one(chat_id: int) -> Optional[Tuple[int, str, str, int]]:
+        async with sem:
+            try:
+                return await create_invite_link(bot, chat_id)
+            except Exception as e:
+                # bot not admin / chat gone: skip, next run will try again
+                logger.warning("invite link for %s failed: %s", chat_id, e)
+                return None
+
+    stored = 0
+    for i in range(0, len(chat_ids), BATCH_SIZE):
+        batch = chat_ids[i:i + BATCH_SIZE]
+        rows = [r for r in await asyncio.gather(*(one(c) for c in batch)) if r]
+        if rows:
+            await db.add_invite_links(rows)
+            stored += len(rows)
+    return stored
+
+
+async def revoke_expired_links(bot: Bot) -> int:
+    expired = await db.list_expired_invite_links(int(time.time()))
+    if not expired:
+        return 0
+
+    sem = asyncio.Semaphore(max(1, INVITE_CONCURRENCY))
+
+    async def one(chat_id: int, url: str):
+        async with sem:
+            try:
+                await _call(lambda: bot.revoke_chat_invite_link(chat_id=chat_id, invite_link=url))
+            except Exception as e:
+                # already invalid on Telegram's side; dropping the row is enough
+                report("invite_links.revoke_failed", e, chat_id=chat_id)
+
+    for i in range(0, len(expired), BATCH_SIZE):
+        batch = expired[i:i + BATCH_SIZE]
+        await asyncio.gather(*(one(chat_id, url) for _id, chat_id, url in batch))
+        await db.delete_links([link_id for link_id, _c, _u in batch])
+    return len(expired)
+
+
+async def rotate_once(bot: Bot) -> Tuple[int, int]:
+    revoked = await revoke_expired_links(bot)
+
+    # a link must survive until the next run, otherwise rotate it now
+    valid_until = int(time.time()) + INVITE_ROTATE_INTERVAL
+    covered = set(await db.chats_with_valid_invite(valid_until))
+    todo = [chat_id for chat_id, _t, _tp in await db.list_groups() if chat_id not in covered]
+    created = await generate_invite_links(bot, todo)
+    return revoked, created
+
+
+async def invite_link_loop(bot: Bot):
+    if INVITE_ROTATE_INTERVAL <= 0:
+        return
+    while True:
+        try:
+            revoked, created = await rotate_once(bot)
+            if revoked or created:
+                logger.info("invite links: revoked=%s created=%s", revoked, created)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("invite link rotation failed")
+        await asyncio.sleep(INVITE_ROTATE_INTERVAL)
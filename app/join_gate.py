@@ -0,0 +1,232 @@
+# app/join_gate.py
+"""
+Join-request gate: for chats that use "approve new members", the bot answers
+the request itself, before the user ever becomes a member. A raid then costs
+one declined request per account, with no join, no ban row and no ban call.
+
+The handler only drops the request into an in-memory batch (no DB, no API).
+Every JOIN_BATCH_INTERVAL the worker:
+  1. stores the new requests in `join_requests` (one statement per batch), so
+     anything not answered yet survives a restart,
+  2. decides each one from memory, like the guard does on join:
+       owner / cached chat admin /
+       folder SAFE / SAFE list          -> approve
+       banned (target or global)        -> decline
+       policy allow / mute              -> approve (the guard mutes on join)
+       policy ban                       -> decline
+  3. sends approve/decline calls through `api_limiter`, at most JOIN_CONCURRENCY at once,
+  4. deletes the answered rows in one statement.
+Calls that hit flood control or a network error stay queued for the next pass.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import User
+
+from app.cache import bans, folder_index, safe_users
+from app.chat_admins import chat_admins
+from app.config import JOIN_BATCH_INTERVAL, JOIN_CONCURRENCY, OUTBOX_MAX_ATTEMPTS, OWNER_ID
+from app.db import db
+from app.log import event
+from app.outbox import is_permanent
+from app.policy import BAN, policies
+from app.ratelimit import api_limiter
+from app.startup import startup
+from app.stats import stats
+
+logger = logging.getLogger("eclis.join_gate")
+
+Key = Tuple[int, int]
+
+
+def _unstored(queue: Dict[Key, Tuple[User, bool]]) -> List[Tuple[int, int, str]]:
+    return [
+        (chat_id, user_id, user.model_dump_json(exclude_none=True))
+        for (chat_id, user_id), (user, stored) in queue.items()
+        if not stored
+    ]
+
+
+class JoinGate:
+    def __init__(self, interval: float = JOIN_BATCH_INTERVAL, concurrency: int = JOIN_CONCURRENCY):
+        self.interval = interval
+        self._sem = asyncio.Semaphore(concurrency)
+        self._chats: Set[int] = set()
+        self.loaded = False
+        # key -> (user, already stored in join_requests)
+        self._queue: Dict[Key, Tuple[User, bool]] = {}
+        self._attempts: Dict[Key, int] = {}
+        self._not_before = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.approved = 0
+        self.declined = 0
+        self.failed = 0
+
+    # ----- per-chat switch -----
+    async def load(self) -> None:
+        self._chats = set(await db.join_gate_chats())
+        self.loaded = True
+
+    def enabled(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def set_enabled(self, chat_id: int, enabled: bool) -> None:
+        if enabled:
+            self._chats.add(chat_id)
+        else:
+            self._chats.discard(chat_id)
+
+    # ----- intake -----
+    def submit(self, chat_id: int, user: User) -> None:
+        self._queue[(chat_id, user.id)] = (user, False)
+        self._wake.set()
+
+    async def decide(self, chat_id: int, user: User) -> bool:
+        """True = approve."""
+        if user.id == OWNER_ID or chat_admins.peek(chat_id, user.id):
+            return True
+        if folder_index.is_safe(user.id, chat_id) or await safe_users.check(user.id, chat_id):
+            return True
+        if await bans.check(user.id, chat_id):
+            return False
+        return await policies.decide(chat_id, user) != BAN
+
+    # ----- worker -----
+    async def _answer(self, bot: Bot, chat_id: int, user_id: int, approve: bool) -> None:
+        async with self._sem:
+            await api_limiter.acquire()
+            if approve:
+                await bot.approve_chat_join_request(chat_id=chat_id, user_id=user_id)
+            else:
+                await bot.decline_chat_join_request(chat_id=chat_id, user_id=user_id)
+
+    async def run_once(self, bot: Bot) -> int:
+        """One batch; returns how many requests were settled."""
+        if not self._queue:
+            return 0
+        batch, self._queue = self._queue, {}
+
+        fresh = _unstored(batch)
+        if fresh:
+            try:
+                await db.add_join_requests(fresh)
+            except Exception:
+                # still answer them; only the restart guarantee is lost for this batch
+                logger.exception("could not store %s join request(s)", len(fresh))
+
+        keys: List[Key] = []
+        calls = []
+        skipped: List[Key] = []
+        for (chat_id, user_id), (user, _stored) in batch.items():
+            if not self.enabled(chat_id):
+                # gate switched off meanwhile: leave the request to the chat's admins
+                skipped.append((chat_id, user_id))
+                continue
+            approve = await self.decide(chat_id, user)
+            keys.append((chat_id, user_id))
+            calls.append((approve, self._answer(bot, chat_id, user_id, approve)))
+
+        results = await asyncio.gather(*(c for _a, c in calls), return_exceptions=True)
+
+        done: List[Key] = list(skipped)
+        for key, (approve, _c), res in zip(keys, calls, results):
+            chat_id, _user_id = key
+            if not isinstance(res, BaseException):
+                done.append(key)
+                self._attempts.pop(key, None)
+                event(
+                    "join.decision",
+                    sample=approve,
+                    chat_id=chat_id,
+                    user_id=key[1],
+                    outcome="approve" if approve else "decline",
+                )
+                if approve:
+                    self.approved += 1
+                else:
+                    self.declined += 1
+                    stats.incr(chat_id, "decline")
+                continue
+            attempts = self._attempts.get(key, 0) + 1
+            if isinstance(res, TelegramRetryAfter):
+                self._not_before = max(self._not_before, time.monotonic() + res.retry_after)
+            elif is_permanent(res) or attempts >= OUTBOX_MAX_ATTEMPTS:
+                # already answered by an admin, request expired, user gone, ...
+                logger.warning("join request %s gave up: %s: %s", key, type(res).__name__, res)
+                done.append(key)
+                self._attempts.pop(key, None)
+                self.failed += 1
+                continue
+            self._attempts[key] = attempts
+            # a newer request for the same key wins over the retry
+            self._queue.setdefault(key, (batch[key][0], True))
+
+        if done:
+            await db.finish_join_requests(done)
+        return len(done)
+
+    async def resume(self) -> int:
+        """Queue the requests left unanswered by the last run."""
+        rows = await db.pending_join_requests(limit=100_000)
+        for chat_id, user_id, user_json in rows:
+            self._queue.setdefault((chat_id, user_id), (User.model_validate_json(user_json), True))
+        return len(rows)
+
+    async def run(self, bot: Bot) -> None:
+        # decisions read the caches and the gate switch
+        await startup.ready.wait()
+        if not self.loaded:
+            await self.load()
+        pending = await self.resume()
+        if pending:
+            logger.info("join gate: %s request(s) from last run", pending)
+
+        while not self._stopping:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            # collect the burst into one batch (and respect flood control)
+            await asyncio.sleep(max(self.interval, self._not_before - time.monotonic()))
+            try:
+                await self.run_once(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("join gate pass failed")
+
+    def start(self, bot: Bot) -> asyncio.Task:
+        self._stopping = False
+        self._task = asyncio.create_task(self.run(bot))
+        return self._task
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Let the current batch settle, then store whatever is still only in memory;
+        the next start answers it.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            _done, pending = await asyncio.wait([self._task], timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        fresh = _unstored(self._queue)
+        if fresh:
+            await db.add_join_requests(fresh)
+
+    def stats(self) -> Dict[str, int]:
+        return {"approved": self.approved, "declined": self.declined, "failed": self.failed}
+
+
+join_gate = JoinGate()
@@ -0,0 +1,53 @@
+# app/journal.py
+"""
+Durable local journal (JSON lines) for work that could not finish before
+shutdown. Each record is {"kind": ..., "data": ...}; records are fsync'ed on
+write and handed back exactly once by `take()` on the next start.
+"""
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from app.config import JOURNAL_PATH
+
+
+class Journal:
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = Path(path)
+
+    def append(self, kind: str, records: List[dict]) -> int:
+        if not records:
+            return 0
+        with open(self.path, "a", encoding="utf-8") as f:
+            for data in records:
+                f.write(json.dumps({"kind": kind, "data": data}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return len(records)
+
+    def take(self) -> Dict[str, List[dict]]:
+        """
+        Move the journal aside and return its records grouped by kind.
+        A half-written last line (crash mid-append) is skipped.
+        """
+        if not self.path.exists():
+            return {}
+        replaying = self.path.with_suffix(self.path.suffix + ".replay")
+        os.replace(self.path, replaying)
+
+        out: Dict[str, List[dict]] = {}
+        with open(replaying, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                out.setdefault(rec.get("kind", ""), []).append(rec.get("data"))
+        replaying.unlink()
+        return out
+
+
+journal = Journal()
@@ -1,6 +1,12 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 
+# Panel keyboards only depend on (role, target): build each one once and reuse it.
+# Callers must not mutate the returned markup.
+
+@lru_cache(maxsize=512)
 def owner_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
     label = "🎯 Select Group/Channel" if not active_chat_id else f"🎯 Target: {active_chat_id}"
     return InlineKeyboardMarkup(
@@ -19,6 +25,13 @@ def owner_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
 
             [InlineKeyboardButton(text="📂 Manage Folders", callback_data="owner:folders")],
             [InlineKeyboardButton(text="🔗 Links", callback_data="owner:links")],
+            [InlineKeyboardButton(text="🧹 Spam Filter", callback_data="owner:spam")],
+            [InlineKeyboardButton(text="🛡 Guard Policy", callback_data="owner:policy")],
+            [InlineKeyboardButton(text="🚪 Join Requests Gate", callback_data="owner:join_gate")],
+            [InlineKeyboardButton(text="💾 Backup / Restore", callback_data="owner:backup")],
+            [InlineKeyboardButton(text="📣 Broadcast", callback_data="owner:broadcast")],
+            [InlineKeyboardButton(text="📊 Stats", callback_data="owner:stats")],
+            [InlineKeyboardButton(text="🩺 Profiling", callback_data="owner:profiling")],
 
             [InlineKeyboardButton(text="📋 Lists (Target)", callback_data="owner:lists")],
             [InlineKeyboardButton(text="📋 Lists (Global)", callback_data="owner:lists_global")],
@@ -28,6 +41,7 @@ def owner_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=512)
 def admin_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
     label = "🎯 Select Group/Channel" if not active_chat_id else f"🎯 Target: {active_chat_id}"
     return InlineKeyboardMarkup(
@@ -44,6 +58,7 @@ def admin_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
 
             [InlineKeyboardButton(text="📂 Folders", callback_data="admin:folders")],
             [InlineKeyboardButton(text="🔗 Links", callback_data="admin:links")],
+            [InlineKeyboardButton(text="🧹 Spam Filter", callback_data="admin:spam")],
 
             [InlineKeyboardButton(text="📋 Lists (Target)", callback_data="admin:lists")],
             [InlineKeyboardButton(text="📋 Lists (Global)", callback_data="admin:lists_global")],
@@ -53,6 +68,11 @@ def admin_panel(active_chat_id: int | None = None) -> InlineKeyboardMarkup:
     )
 
 
+def role_panel(is_owner: bool, active_chat_id: int | None = None) -> InlineKeyboardMarkup:
+    return owner_panel(active_chat_id) if is_owner else admin_panel(active_chat_id)
+
+
+@lru_cache(maxsize=64)
 def confirm_keyboard(action: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -0,0 +1,186 @@
+# app/log.py
+"""
+Logging off the event loop.
+
+`setup_logging()` replaces basicConfig: every logger writes into a bounded
+in-memory queue (QueueHandler) and one QueueListener thread formats and writes
+the records. The event loop never waits on log I/O; when the queue is full
+(LOG_QUEUE_SIZE) the oldest record is dropped to make room, and counted.
+
+LOG_FORMAT=text keeps the old line format; LOG_FORMAT=json writes one JSON
+object per line. Structured events carry their fields in both formats:
+
+    event("guard.decision", chat_id=..., user_id=..., outcome="ban")
+    event("guard.decision", sample=True, ...)   # high volume: 1 in LOG_SAMPLE_EVERY
+                                                # (aiogram's per-update lines too)
+    report("panel.answer", e, chat_id=...)      # swallowed error: at most one line
+                                                # per LOG_ERROR_INTERVAL per name
+"""
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from app.config import LOG_ERROR_INTERVAL, LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_EVERY
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+events_logger = logging.getLogger("eclis.events")
+
+# loggers that write a line per update at INFO ("Update id=... is handled")
+SAMPLED_LOGGERS = frozenset({"aiogram.event"})
+
+
+class _DropOldestHandler(logging.handlers.QueueHandler):
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the listener thread formats; the caller only pays for the put
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # the queue may be full; the thread is draining it, so waiting is safe at shutdown
+        self.queue.put(self._sentinel)
+
+
+class _SampleFilter(logging.Filter):
+    """Below WARNING, pass 1 in `every` records of the high-volume loggers."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name not in SAMPLED_LOGGERS or record.levelno >= logging.WARNING:
+            return True
+        self._seen += 1
+        return self._seen % self.every == 1
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " | " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            out.update(fields)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _Pipeline:
+    def __init__(self):
+        self.handler: Optional[_DropOldestHandler] = None
+        self.listener: Optional[_Listener] = None
+        self._sampled: Dict[str, int] = {}
+        # name -> (last emitted at, suppressed since)
+        self._errors: Dict[str, tuple] = {}
+
+    def setup(
+        self,
+        level: str = LOG_LEVEL,
+        fmt: str = LOG_FORMAT,
+        size: int = LOG_QUEUE_SIZE,
+        stream=None,
+    ) -> None:
+        if self.listener is not None:
+            return
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        q: queue.Queue = queue.Queue(maxsize=size)
+        self.handler = _DropOldestHandler(q)
+        if LOG_SAMPLE_EVERY > 1:
+            self.handler.addFilter(_SampleFilter(LOG_SAMPLE_EVERY))
+        self.listener = _Listener(q, target, respect_handler_level=False)
+
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write out what is still queued (call last; later records go nowhere)."""
+        if self.listener is None:
+            return
+        if self.handler.dropped:
+            logging.getLogger("eclis").warning("logging: dropped %s record(s) under load", self.handler.dropped)
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.handler)
+        self.listener = None
+
+    def event(self, name: str, level: int = logging.INFO, sample: bool = False, **fields: Any) -> None:
+        if not events_logger.isEnabledFor(level):
+            return
+        if sample and LOG_SAMPLE_EVERY > 1:
+            n = self._sampled.get(name, 0)
+            self._sampled[name] = n + 1
+            if n % LOG_SAMPLE_EVERY:
+                return
+            fields["sampled"] = LOG_SAMPLE_EVERY
+        events_logger.log(level, name, extra={"fields": fields})
+
+    def report(self, name: str, exc: BaseException, **fields: Any) -> None:
+        now = time.monotonic()
+        last, suppressed = self._errors.get(name, (0.0, 0))
+        if last and now - last < LOG_ERROR_INTERVAL:
+            self._errors[name] = (last, suppressed + 1)
+            return
+        self._errors[name] = (now, 0)
+        if suppressed:
+            fields["suppressed"] = suppressed
+        fields["error"] = f"{type(exc).__name__}: {exc}"
+        events_logger.warning(name, extra={"fields": fields})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "dropped": self.handler.dropped if self.handler else 0,
+            "queued": self.handler.queue.qsize() if self.handler else 0,
+        }
+
+
+pipeline = _Pipeline()
+setup_logging = pipeline.setup
+stop_logging = pipeline.stop
+event = pipeline.event
+report = pipeline.report
@@ -1,52 +1,194 @@
 # app/main.py
 import asyncio
 import logging
+from typing import Optional, Tuple
+
+# first app import: its clock is the reference for every startup mark
+from app.startup import startup
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from app.config import BOT_TOKEN
+from app.config import BOT_TOKEN, RECORD_DIR
 from app.db import db
+from app.cache import warm_all
+from app.changefeed import changefeed, changefeed_loop
+from app.chat_admins import chat_admins
+from app.flood import flood
+from app.actions import actions
+from app.bot_session import TunedSession
+from app.join_gate import join_gate
+from app.log import setup_logging, stop_logging
+from app.outbox import outbox
+from app.profiler import slow_log
+from app.serializer import member_lanes
+from app.spam_filter import spam_filter
+from app.shutdown import coordinator, wait_tasks
+from app.middlewares import (
+    PrefilterMiddleware,
+    ReadinessGate,
+    SlowUpdateMiddleware,
+    UpdateRecorder,
+    install_before_fsm,
+)
+from app.handlers import include_all_routers
 
-# routers
-from app.handlers.private_panel import router as private_panel_router
-from app.handlers.register_group import router as register_group_router
-# اگر بعداً group_guard اضافه شد:
-# from app.handlers.group_guard import router as group_guard_router
+logger = logging.getLogger("eclis")
 
 
-async def main() -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+async def warm_caches() -> None:
+    """Phase 2 (background): load in-memory indexes, then open the readiness gate."""
+    try:
+        with startup.phase("warm_caches"):
+            # feed position first: edits made during the load are replayed, not lost
+            await changefeed.mark()
+            await asyncio.gather(warm_all(), join_gate.load(), spam_filter.load(), flood.load())
+    except Exception:
+        # handlers keep using the DB fallbacks; the gate must still open
+        logger.exception("cache warmup failed")
+    startup.ready.set()
+    startup.mark("ready")
+
+
+def build_dispatcher(recorder: Optional[UpdateRecorder] = None) -> Tuple[Dispatcher, ReadinessGate, PrefilterMiddleware]:
+    """The production update pipeline; app.replay builds the same one."""
+    dp = Dispatcher()
+    gate = ReadinessGate(startup.ready)
+    # group messages only reach the dispatcher for chats with a blocklist or flood watch
+    prefilter = PrefilterMiddleware(
+        route_group_messages=lambda chat_id: spam_filter.watches(chat_id) or flood.watches(chat_id)
     )
-    logger = logging.getLogger("eclis")
+    # prefilter before the gate: during warm-up the gate only holds updates a handler
+    # will act on (chats not known to be watched yet are dropped, not buffered), so
+    # group traffic cannot fill it and push out panel updates.
+    # slow-update timing starts after the gate: time spent held there is not handler time
+    middlewares = (prefilter, gate, SlowUpdateMiddleware())
+    if recorder is not None:
+        middlewares = (recorder, *middlewares)
+    install_before_fsm(dp, *middlewares)
+    include_all_routers(dp)
+    return dp, gate, prefilter
 
-    # 1) init database (tables)
-    await db.init()
+
+async def main() -> None:
+    # records are written by a background thread, never on the event loop
+    setup_logging()
+
+    # storage calls slower than SLOW_DB_MS go to the slow log (owner panel)
+    slow_log.instrument(db)
+
+    # 1) init database (DDL only when the schema version changed)
+    with startup.phase("db_init"):
+        migrated = await db.init()
+    if migrated:
+        logger.info("database schema created/migrated")
 
     # 2) init bot
     bot = Bot(
         token=BOT_TOKEN,
+        session=TunedSession(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
-    # 3) dispatcher
-    dp = Dispatcher()
+    # opt-in traffic recording for app.replay
+    recorder = UpdateRecorder() if RECORD_DIR else None
+    if recorder is not None:
+        bot.session.middleware(recorder.request_middleware())
+        recorder.start()
+        logger.info("recording updates to %s", RECORD_DIR)
+
+    # 3) dispatcher + routers (imported lazily, guard first)
+    with startup.phase("routers"):
+        dp, gate, prefilter = build_dispatcher(recorder)
+
+        # feature modules are imported by the routers above
+        from app.backup import backup_loop
+        from app.broadcast import broadcasts
+        from app.invite_links import invite_link_loop
+        from app.stats import stats, stats_loop
+
+    # 4) background: cache warmup + jobs
+    jobs = [
+        asyncio.create_task(warm_caches()),
+        asyncio.create_task(invite_link_loop(bot)),
+        asyncio.create_task(backup_loop()),
+        asyncio.create_task(stats_loop()),
+        asyncio.create_task(changefeed_loop()),
+    ]
+
+    # outbound actions; anything journaled at the last shutdown is re-queued
+    actions.start(bot)
+    outbox.start(bot)
+    join_gate.start(bot)
+    spam_filter.start(bot)
+
+    async def drain_handlers(timeout: float) -> None:
+        await wait_tasks(list(dp._handle_update_tasks), timeout)
+
+    async def drain_broadcasts(timeout: float) -> None:
+        # progress is already persisted per batch; resume_all picks it up
+        await asyncio.wait_for(broadcasts.stop(), timeout)
+
+    async def replay_actions(records) -> int:
+        return actions.replay(records)
+
+    # drain order matters: handlers may still submit actions
+    coordinator.register("handlers", drain_handlers)
+    # unanswered join requests are stored in the DB and answered next start
+    coordinator.register("join_gate", join_gate.stop)
+    coordinator.register("broadcasts", drain_broadcasts)
+
+    async def drain_spam_deletes(timeout: float) -> None:
+        await spam_filter.stop(bot, timeout)
+
+    coordinator.register("spam_deletes", drain_spam_deletes)
+    coordinator.register("actions", actions.drain, replay_actions)
+    # outbox entries live in the DB; stopping only lets the current batch settle
+    coordinator.register("outbox", outbox.stop)
+
+    async def flush_stats(timeout: float) -> None:
+        await asyncio.wait_for(stats.flush(), timeout)
+
+    coordinator.register("stats", flush_stats)
+    if recorder is not None:
+        # last: records the calls the drainers above still make
+        coordinator.register("recorder", recorder.stop)
+    await coordinator.replay()
 
-    # 4) routers
-    dp.include_router(private_panel_router)
-    dp.include_router(register_group_router)
-    # dp.include_router(group_guard_router)
+    @dp.startup()
+    async def on_polling_started():
+        startup.mark("polling")
 
     # 5) start polling
     try:
         await bot.delete_webhook(drop_pending_updates=True)
+        resumed = await broadcasts.resume_all(bot)
+        if resumed:
+            logger.info("resumed %s broadcast(s)", resumed)
         logger.info("ECLIS Guard Bot started")
-        await dp.start_polling(bot)
+        # chat_member updates are not delivered unless explicitly requested
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        # polling has stopped, so no new intake: drain, journal the rest
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        await coordinator.shutdown()
+        await member_lanes.stop()
+        logger.info("outbox: %s", outbox.stats())
+        logger.info("join gate: %s", join_gate.stats())
+        logger.info("spam filter: %s", spam_filter.stats())
+        logger.info("flood detector: %s", flood.stats())
+        logger.info("chat admins cache: %s", chat_admins.stats())
+        logger.info("prefilter: %s", prefilter.stats())
+        logger.info("readiness gate: held=%s dropped=%s", gate.held, gate.dropped)
+        if recorder is not None:
+            logger.info("recorder: %s", recorder.stats())
+        logger.info("bot api session: %s", bot.session.stats())
         await bot.session.close()
+        await db.close()
+        stop_logging()
 
 
 if __name__ == "__main__":
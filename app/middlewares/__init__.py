@@ -0,0 +1,20 @@
+from aiogram import BaseMiddleware, Dispatcher
+
+from app.middlewares.prefilter import PrefilterMiddleware
+from app.middlewares.readiness import ReadinessGate
+from app.middlewares.recorder import UpdateRecorder
+from app.middlewares.slow import SlowUpdateMiddleware
+
+__all__ = ["PrefilterMiddleware", "ReadinessGate", "SlowUpdateMiddleware", "UpdateRecorder", "install_before_fsm"]
+
+
+def install_before_fsm(dp: Dispatcher, *middlewares: BaseMiddleware) -> None:
+    """
+    Register update outer middlewares (in order) so they run *before* aiogram's
+    FSMContextMiddleware, which reads the FSM state for every update.
+    """
+    outer = dp.update.outer_middleware
+    outer.unregister(dp.fsm)
+    for middleware in middlewares:
+        outer.register(middleware)
+    outer.register(dp.fsm)
@@ -0,0 +1,91 @@
+# app/middlewares/prefilter.py
+"""
+Outer update middleware that drops updates no handler can act on, before
+filters run and before FSM state is loaded.
+
+Rules (all in-memory, no I/O):
+  - private messages: owner/admins pass; everyone else only for /start, /admin
+  - private callback queries: owner/admins only
+  - group/channel messages: only when some router consumes them
+    (`route_group_messages`: True, or a per-chat predicate such as
+    "this chat has a spam blocklist")
+  - everything else (chat_member, my_chat_member, ...) passes
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from app.cache import admins
+from app.config import OWNER_ID
+
+PUBLIC_COMMANDS = frozenset({"/start", "/admin"})
+
+
+class PrefilterMiddleware(BaseMiddleware):
+    def __init__(self, route_group_messages: Union[bool, Callable[[int], bool]] = False):
+        self.route_group_messages = route_group_messages
+        self.routed = 0
+        self.dropped = 0
+        self.reasons: Counter[str] = Counter()
+        self.classify_ns = 0
+
+    def _is_staff(self, user_id: int) -> bool:
+        if user_id == OWNER_ID:
+            return True
+        # cache not warm yet: let the real filters decide
+        return user_id in admins if admins.loaded else True
+
+    def classify(self, update: Update) -> str | None:
+        """Returns a drop reason, or None to route the update."""
+        message = update.message or update.edited_message
+        if message is not None:
+            if message.chat.type != "private":
+                route = self.route_group_messages
+                if route is True or (callable(route) and route(message.chat.id)):
+                    return None
+                return "group_message"
+            user = message.from_user
+            if user is None:
+                return "no_user"
+            if self._is_staff(user.id) or (message.text or "").strip() in PUBLIC_COMMANDS:
+                return None
+            return "private_stranger"
+
+        cb = update.callback_query
+        if cb is not None:
+            return None if self._is_staff(cb.from_user.id) else "callback_stranger"
+
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        t0 = time.perf_counter_ns()
+        reason = self.classify(event)
+        self.classify_ns += time.perf_counter_ns() - t0
+
+        if reason is not None:
+            self.dropped += 1
+            self.reasons[reason] += 1
+            return None
+
+        self.routed += 1
+        return await handler(event, data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.routed + self.dropped
+        return {
+            "routed": self.routed,
+            "dropped": self.dropped,
+            "reasons": dict(self.reasons),
+            "avg_classify_us": (self.classify_ns / total / 1000) if total else 0.0,
+        }
+
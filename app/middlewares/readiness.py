@@ -0,0 +1,56 @@
+# app/middlewares/readiness.py
+"""
+Holds updates that need warm caches (panel messages / callbacks) until
+`ready` is set. Guard updates (chat_member, ...) are never held: the guard
+falls back to DB lookups while caches are cold.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+GATED = ("message", "edited_message", "callback_query")
+
+
+class ReadinessGate(BaseMiddleware):
+    def __init__(
+        self,
+        ready: asyncio.Event,
+        gated: Iterable[str] = GATED,
+        timeout: float = 30.0,
+        max_waiting: int = 1000,
+    ):
+        self.ready = ready
+        self.gated = frozenset(gated)
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.held = 0
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.ready.is_set() or event.event_type not in self.gated:
+            return await handler(event, data)
+
+        if self.waiting >= self.max_waiting:
+            self.dropped += 1
+            return None
+
+        self.waiting += 1
+        self.held += 1
+        try:
+            await asyncio.wait_for(self.ready.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            # still cold: let it through, filters fall back to the DB
+            pass
+        finally:
+            self.waiting -= 1
+        return await handler(event, data)
@@ -0,0 +1,230 @@
+# app/middlewares/recorder.py
+"""
+Opt-in traffic recorder (RECORD_DIR set): raw incoming updates and the
+moderation calls the bot made, as gzip'ed JSON lines, for `python -m app.replay`.
+
+Line kinds (all carry "at" = wall clock seconds):
+  {"kind": "update", "at": ..., "ms": handler time, "update": {...raw Update...}}
+  {"kind": "call",   "at": ..., "decision": ["banChatMember", chat_id, user_id]}
+
+Registered as the outermost update middleware, so it sees every update
+(including the ones the prefilter drops) and times the whole handler chain.
+Nothing touches the disk on the event loop: lines go to a bounded buffer that
+a background task hands to a worker thread every RECORD_FLUSH_INTERVAL; when
+the buffer is full new lines are dropped (and counted), never waited for.
+
+Segments are named updates-<YYYYmmdd-HHMMSS>.jsonl.gz and rotated after
+RECORD_SEGMENT_MB of JSON or RECORD_SEGMENT_SECONDS; only the newest
+RECORD_KEEP are kept.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from app.config import (
+    RECORD_DIR,
+    RECORD_FLUSH_INTERVAL,
+    RECORD_KEEP,
+    RECORD_SEGMENT_MB,
+    RECORD_SEGMENT_SECONDS,
+)
+
+logger = logging.getLogger("eclis.recorder")
+
+MAX_BUFFER = 50_000
+SEGMENT_GLOB = "updates-*.jsonl.gz"
+
+# API calls that are moderation decisions; replay compares these
+DECISION_METHODS = frozenset({
+    "banChatMember",
+    "unbanChatMember",
+    "restrictChatMember",
+    "approveChatJoinRequest",
+    "declineChatJoinRequest",
+    "deleteMessage",
+    "deleteMessages",
+})
+
+Decision = Tuple[Any, ...]
+
+
+def decisions_of(method: TelegramMethod) -> List[Decision]:
+    """The decisions one API call carries (a delete_messages call is one per message)."""
+    name = method.__api_method__
+    if name not in DECISION_METHODS:
+        return []
+    chat_id = getattr(method, "chat_id", None)
+    if name == "deleteMessages":
+        return [(name, chat_id, m) for m in method.message_ids]
+    if name == "deleteMessage":
+        return [(name, chat_id, method.message_id)]
+    return [(name, chat_id, getattr(method, "user_id", None))]
+
+
+def read_segments(paths: List[Path]) -> Iterator[Dict[str, Any]]:
+    """Lines of the given segments in time order; a segment cut off by a crash ends early."""
+    for path in sorted(paths):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.warning("recording %s is truncated: %s", path, e)
+
+
+def find_segments(target: str) -> List[Path]:
+    path = Path(target)
+    return sorted(path.glob(SEGMENT_GLOB)) if path.is_dir() else [path]
+
+
+class _Segments:
+    """The writer side; runs in worker threads (a flush cut off by stop() may still be writing)."""
+
+    def __init__(self, directory: Path, max_bytes: int, max_age: float, keep: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self._file: Optional[IO[str]] = None
+        self._bytes = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, lines: List[str]) -> None:
+        with self._lock:
+            self._write(lines)
+
+    def _write(self, lines: List[str]) -> None:
+        if self._file is None or self._bytes >= self.max_bytes or time.monotonic() - self._opened >= self.max_age:
+            self._rotate()
+        for line in lines:
+            self._file.write(line)
+            self._bytes += len(line)
+        # a crash loses at most one flush interval, not the whole segment
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / time.strftime("updates-%Y%m%d-%H%M%S.jsonl.gz")
+        if path.exists():
+            path = path.with_name(path.name.replace(".jsonl.gz", f"-{time.monotonic_ns()}.jsonl.gz"))
+        self._file = gzip.open(path, "at", encoding="utf-8", compresslevel=6)
+        self._bytes = 0
+        self._opened = time.monotonic()
+        for old in sorted(self.directory.glob(SEGMENT_GLOB))[:-self.keep]:
+            old.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class UpdateRecorder(BaseMiddleware):
+    def __init__(
+        self,
+        directory: str = RECORD_DIR,
+        interval: float = RECORD_FLUSH_INTERVAL,
+        segment_mb: float = RECORD_SEGMENT_MB,
+        segment_seconds: float = RECORD_SEGMENT_SECONDS,
+        keep: int = RECORD_KEEP,
+    ):
+        self.interval = interval
+        self._segments = _Segments(Path(directory), int(segment_mb * 1024 * 1024), segment_seconds, max(1, keep))
+        self._buffer: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.calls = 0
+        self.dropped = 0
+
+    def _push(self, record: Dict[str, Any]) -> None:
+        if len(self._buffer) >= MAX_BUFFER:
+            self.dropped += 1
+            return
+        self._buffer.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        at = time.time()
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.recorded += 1
+            self._push({
+                "kind": "update",
+                "at": at,
+                "ms": round((time.perf_counter() - t0) * 1000, 3),
+                "update": event.model_dump(mode="json", by_alias=True, exclude_none=True),
+            })
+
+    def request_middleware(self) -> BaseRequestMiddleware:
+        """Session middleware that records the moderation calls the bot makes."""
+        recorder = self
+
+        class _RecordCalls(BaseRequestMiddleware):
+            async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+                result = await make_request(bot, method)
+                for decision in decisions_of(method):
+                    recorder.calls += 1
+                    recorder._push({"kind": "call", "at": time.time(), "decision": list(decision)})
+                return result
+
+        return _RecordCalls()
+
+    async def flush(self) -> int:
+        if not self._buffer:
+            return 0
+        lines, self._buffer = self._buffer, []
+        await asyncio.to_thread(self._segments.write, lines)
+        return len(lines)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("recorder flush failed")
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self, timeout: float) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # the tail of the recording is the part worth keeping: allow it a second past the deadline
+        await asyncio.wait_for(self.flush(), max(timeout, 1.0))
+        await asyncio.to_thread(self._segments.close)
+
+    def stats(self) -> Dict[str, int]:
+        return {"updates": self.recorded, "calls": self.calls, "dropped": self.dropped}
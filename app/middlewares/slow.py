@@ -0,0 +1,77 @@
+# app/middlewares/slow.py
+"""
+Records updates whose handling takes longer than SLOW_HANDLER_MS in the slow
+log (app/profiler.py). A timer fires at the threshold and takes the stack of
+the update's task while it is still running, so the entry shows where the
+handler was waiting, not just that it was slow. Fast updates cost one
+call_later/cancel.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from app.profiler import SlowLog, format_frames, slow_log
+
+
+def _describe(update: Update) -> str:
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    user = getattr(event, "from_user", None)
+    parts = [update.event_type]
+    if chat is not None:
+        parts.append(f"chat={chat.id}")
+    if user is not None:
+        parts.append(f"user={user.id}")
+    data = getattr(event, "data", None)
+    if isinstance(data, str):
+        parts.append(f"data={data[:32]}")
+    return " ".join(parts)
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    # Task.get_stack() stops at the outermost coroutine; follow the await chain instead
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is not None:
+            frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return format_frames(frames)
+
+
+class SlowUpdateMiddleware(BaseMiddleware):
+    def __init__(self, log: SlowLog = slow_log):
+        self.log = log
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self.log.handler_ms <= 0:
+            return await handler(event, data)
+
+        task = asyncio.current_task()
+        stack: List[str] = []
+
+        def capture() -> None:
+            if task is not None and not task.done():
+                stack.extend(_task_stack(task))
+
+        timer = asyncio.get_running_loop().call_later(self.log.handler_ms / 1000, capture)
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            timer.cancel()
+            ms = (time.perf_counter() - t0) * 1000
+            if ms >= self.log.handler_ms:
+                # the timer only fires at an await: no stack = it held the event loop itself
+                self.log.add("update", _describe(event), ms, stack or ["  (blocked the event loop, no await reached)\n"])
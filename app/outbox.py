@@ -0,0 +1,163 @@
+# app/outbox.py
+"""
+Outbox worker: applies queued Telegram moderation calls (see `Database.add_ban(enforce=True)`).
+
+Entries are written in the same transaction as the DB change they enforce, so
+after a crash the worker simply picks up whatever is still pending and the
+Telegram state converges to the DB.
+
+Each pass takes up to OUTBOX_BATCH due entries and hands them, in order, to
+their (chat, user) lane of `member_lanes` (so per-member order is kept). Each
+entry waits for its `api_limiter` token *before* it takes the lane: the lane
+workers are shared with the join guard and the panel, and must never sit idle
+on the outbox's rate limit. The whole batch settles in one transaction:
+  - success                       -> done
+  - flood control                 -> retry after the server's retry_after
+  - network/server errors, or the
+    bot lacking rights (yet)      -> retry with exponential backoff
+  - other 4xx (user/chat invalid) -> failed
+  - OUTBOX_MAX_ATTEMPTS reached   -> failed
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from app.config import OUTBOX_BATCH, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_BACKOFF
+from app.db import db
+from app.ratelimit import api_limiter
+from app.serializer import member_lanes
+
+logger = logging.getLogger("eclis.outbox")
+
+BASE_BACKOFF = 2
+IDLE_INTERVAL = 5
+RETRYABLE_HINTS = ("not enough rights", "chat_admin_required", "need administrator rights")
+
+
+def backoff(attempts: int) -> int:
+    return min(OUTBOX_MAX_BACKOFF, BASE_BACKOFF * (2 ** attempts))
+
+
+def is_permanent(e: Exception) -> bool:
+    if not isinstance(e, (TelegramBadRequest, TelegramForbiddenError)):
+        return False
+    text = str(e).lower()
+    return not any(hint in text for hint in RETRYABLE_HINTS)
+
+
+class OutboxWorker:
+    def __init__(self, batch: int = OUTBOX_BATCH, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+    def notify(self) -> None:
+        """New entries were committed: run a pass now instead of at the next tick."""
+        self._wake.set()
+
+    async def backlog(self) -> int:
+        return (await db.outbox_counts()).get("pending", 0)
+
+    def _apply(self, bot: Bot, method: str, payload: dict) -> Awaitable[None]:
+        # same (chat, user) lane as the guard: a ban and a later unban land in order
+        key = (payload.get("chat_id"), payload.get("user_id"))
+        return member_lanes.run(key, lambda: getattr(bot, method)(**payload))
+
+    async def run_once(self, bot: Bot) -> int:
+        """One batch; returns how many entries were settled."""
+        now = int(time.time())
+        rows = await db.due_outbox(now, self.batch)
+        if not rows:
+            return 0
+
+        # tokens first, in row order: a job that reaches a lane worker calls the API at once
+        jobs = []
+        for _id, method, payload, _a in rows:
+            await api_limiter.acquire()
+            jobs.append(self._apply(bot, method, payload))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        done: List[int] = []
+        retry: List[Tuple[int, int, str]] = []
+        failed: List[Tuple[int, str]] = []
+        for (entry_id, method, _payload, attempts), res in zip(rows, results):
+            if not isinstance(res, BaseException):
+                done.append(entry_id)
+                continue
+            err = f"{type(res).__name__}: {res}"
+            if isinstance(res, TelegramRetryAfter):
+                retry.append((entry_id, now + res.retry_after, err))
+            elif is_permanent(res) or attempts + 1 >= self.max_attempts:
+                logger.warning("outbox #%s %s gave up: %s", entry_id, method, err)
+                failed.append((entry_id, err))
+            else:
+                retry.append((entry_id, now + backoff(attempts), err))
+
+        await db.finish_outbox(done, retry, failed)
+        self.done += len(done)
+        self.retried += len(retry)
+        self.failed += len(failed)
+        return len(rows)
+
+    async def run(self, bot: Bot) -> None:
+        await db.purge_outbox()
+        pending = await self.backlog()
+        if pending:
+            logger.info("outbox: %s pending entr%s from last run", pending, "y" if pending == 1 else "ies")
+        while not self._stopping:
+            try:
+                # a full batch means there may be more due right now
+                if await self.run_once(bot) >= self.batch and not self._stopping:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("outbox pass failed")
+            if self._stopping:
+                break
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), IDLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot: Bot) -> asyncio.Task:
+        self._stopping = False
+        self._task = asyncio.create_task(self.run(bot))
+        return self._task
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Entries are durable; just let the current batch settle, then stop.
+        A batch cut off by the deadline is re-run next start (bans are idempotent).
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        _done, pending = await asyncio.wait([self._task], timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"done": self.done, "retried": self.retried, "failed": self.failed}
+
+
+outbox = OutboxWorker()
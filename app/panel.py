@@ -0,0 +1,122 @@
+# app/panel.py
+"""
+One live panel message per admin, edited in place.
+
+- render(): remember the wanted (text, keyboard) for that chat and edit the
+  panel message after a short debounce; a burst of clicks ends in one edit.
+- identical content is never re-sent (Telegram would reject it anyway).
+- send(): post a fresh panel message (used for /start and after the admin typed
+  something, so the panel is back at the bottom of the chat).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+logger = logging.getLogger("eclis.panel")
+
+DEBOUNCE = 0.25
+MAX_PANELS = 4096
+
+
+def _markup_key(markup: Optional[InlineKeyboardMarkup]) -> str:
+    return markup.model_dump_json(exclude_none=True) if markup else ""
+
+
+class PanelRenderer:
+    def __init__(self, debounce: float = DEBOUNCE):
+        self.debounce = debounce
+        self._message_id: Dict[int, int] = {}
+        self._shown: Dict[int, Tuple[str, str]] = {}
+        self._wanted: Dict[int, Tuple[str, Optional[InlineKeyboardMarkup], dict]] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+        self.edits = 0
+        self.skipped = 0
+
+    def _remember(self, chat_id: int, message_id: int) -> None:
+        if self._message_id.get(chat_id) != message_id:
+            self._message_id[chat_id] = message_id
+            self._shown.pop(chat_id, None)
+        if len(self._message_id) > MAX_PANELS:
+            # oldest admin first (dicts keep insertion order)
+            oldest = next(iter(self._message_id))
+            self._message_id.pop(oldest, None)
+            self._shown.pop(oldest, None)
+
+    async def render(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        markup: Optional[InlineKeyboardMarkup] = None,
+        message_id: Optional[int] = None,
+        **kwargs,
+    ) -> None:
+        if message_id is not None:
+            self._remember(chat_id, message_id)
+        self._wanted[chat_id] = (text, markup, kwargs)
+        if chat_id not in self._timers:
+            self._timers[chat_id] = asyncio.create_task(self._flush_later(bot, chat_id))
+
+    async def send(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        markup: Optional[InlineKeyboardMarkup] = None,
+        **kwargs,
+    ) -> None:
+        timer = self._timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        self._wanted.pop(chat_id, None)
+        msg = await bot.send_message(chat_id, text, reply_markup=markup, **kwargs)
+        self._remember(msg.chat.id, msg.message_id)
+        self._shown[chat_id] = (text, _markup_key(markup))
+
+    async def _flush_later(self, bot: Bot, chat_id: int) -> None:
+        try:
+            await asyncio.sleep(self.debounce)
+        finally:
+            self._timers.pop(chat_id, None)
+        wanted = self._wanted.pop(chat_id, None)
+        if wanted is None:
+            return
+        text, markup, kwargs = wanted
+        try:
+            await self._apply(bot, chat_id, text, markup, kwargs)
+        except Exception:
+            logger.exception("panel render failed for %s", chat_id)
+
+    async def _apply(self, bot: Bot, chat_id: int, text: str, markup, kwargs) -> None:
+        key = (text, _markup_key(markup))
+        if self._shown.get(chat_id) == key:
+            self.skipped += 1
+            return
+
+        message_id = self._message_id.get(chat_id)
+        if message_id is None:
+            await self.send(bot, chat_id, text, markup, **kwargs)
+            return
+
+        try:
+            await bot.edit_message_text(
+                text=text, chat_id=chat_id, message_id=message_id, reply_markup=markup, **kwargs
+            )
+            self.edits += 1
+        except TelegramBadRequest as e:
+            if "not modified" in str(e):
+                self.skipped += 1
+            else:
+                # panel message deleted / too old to edit: start a new one
+                await self.send(bot, chat_id, text, markup, **kwargs)
+                return
+        self._shown[chat_id] = key
+
+
+panel = PanelRenderer()
@@ -0,0 +1,239 @@
+# app/policy.py
+"""
+Per-chat guard policy.
+
+A policy is an ordered list of rules stored as JSON in `guard_policies`.
+The first matching rule decides; if nothing matches, `default_action` applies.
+
+Rule format (one dict per rule):
+    {"match": "user",        "value": [123, 456],    "action": "allow"}
+    {"match": "folder",      "value": "staff",       "action": "allow"}
+    {"match": "username",    "value": "(?i)bot$",    "action": "ban"}
+    {"match": "name",        "value": "crypto|usdt", "action": "ban"}
+    {"match": "no_username", "value": true,          "action": "mute"}
+    {"match": "bot",         "value": true,          "action": "ban"}
+    {"match": "new_account", "value": 7000000000,    "action": "mute"}
+
+`new_account` is a heuristic: Telegram hands out user ids roughly in
+increasing order, so ids >= value are treated as recently created accounts.
+
+Policies are compiled once into a plain function (regexes precompiled,
+user/folder rules folded into one dict) and cached until invalidated.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.db import db
+
+ALLOW = "allow"
+BAN = "ban"
+MUTE = "mute"
+ACTIONS = (ALLOW, BAN, MUTE)
+
+ID_KINDS = ("user", "folder")
+REGEX_KINDS = ("username", "name")
+KINDS = ID_KINDS + REGEX_KINDS + ("no_username", "bot", "new_account")
+
+Decision = Callable[[Any], str]
+
+
+class PolicyError(ValueError):
+    pass
+
+
+def _parse_rule(idx: int, rule: Any) -> Tuple[str, Any, str]:
+    if not isinstance(rule, dict):
+        raise PolicyError(f"rule #{idx}: must be an object")
+    kind = rule.get("match")
+    action = rule.get("action")
+    if kind not in KINDS:
+        raise PolicyError(f"rule #{idx}: unknown match {kind!r}")
+    if action not in ACTIONS:
+        raise PolicyError(f"rule #{idx}: unknown action {action!r}")
+    if "value" not in rule:
+        raise PolicyError(f"rule #{idx}: missing value")
+    return kind, rule["value"], action
+
+
+def _predicate(kind: str, value: Any) -> Callable[[Any], bool]:
+    if kind == "no_username":
+        want = bool(value)
+        return lambda u: (not u.username) is want
+    if kind == "bot":
+        want = bool(value)
+        return lambda u: bool(u.is_bot) is want
+    if kind == "new_account":
+        threshold = int(value)
+        return lambda u: u.id >= threshold
+    raise PolicyError(f"no predicate for {kind!r}")
+
+
+_GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+
+def _group(pattern: str) -> str:
+    # "(?i)bot$" is only valid at the start of a whole regex; scope it to its own group
+    m = _GLOBAL_FLAGS.match(pattern)
+    if m:
+        return f"(?{m.group(1)}:{pattern[m.end():]})"
+    return f"(?:{pattern})"
+
+
+def _regex_predicate(kind: str, patterns: List[str]) -> Callable[[Any], bool]:
+    try:
+        rx = re.compile("|".join(map(_group, patterns)))
+    except re.error as e:
+        raise PolicyError(f"bad regex in {kind} rules: {e}") from e
+    search = rx.search
+    if kind == "username":
+        return lambda u: search(u.username or "") is not None
+    return lambda u: search(u.full_name or "") is not None
+
+
+def compile_policy(
+    rules: List[dict],
+    default_action: str = BAN,
+    folders: Optional[Dict[str, Iterable[int]]] = None,
+) -> Decision:
+    """
+    Compile rules into `decide(user) -> action`.
+
+    user/folder rules are folded into a single `user_id -> (rule_index, action)`
+    dict, so any number of them costs one lookup. Consecutive regex rules with the
+    same kind and action are merged into one alternation. The remaining checks
+    only run while their index is below the first id-based hit, which keeps
+    first-match semantics exact.
+    """
+    if default_action not in ACTIONS:
+        raise PolicyError(f"unknown default action {default_action!r}")
+    if not isinstance(rules, list):
+        raise PolicyError("rules must be a list")
+
+    folders = folders or {}
+    by_id: Dict[int, Tuple[int, str]] = {}
+    # (first_index, kind, action, patterns or predicate)
+    checks: List[list] = []
+
+    for idx, rule in enumerate(rules):
+        kind, value, action = _parse_rule(idx, rule)
+
+        if kind in ID_KINDS:
+            if kind == "user":
+                ids = value if isinstance(value, list) else [value]
+            else:
+                ids = folders.get(str(value), ())
+            try:
+                ids = [int(uid) for uid in ids]
+            except (TypeError, ValueError) as e:
+                raise PolicyError(f"rule #{idx}: user ids must be integers ({e})") from e
+            for uid in ids:
+                by_id.setdefault(uid, (idx, action))
+            continue
+
+        if kind in REGEX_KINDS:
+            if not isinstance(value, str):
+                raise PolicyError(f"rule #{idx}: regex must be a string")
+            last = checks[-1] if checks else None
+            if last and last[1] == kind and last[2] == action and last[4] == idx - 1:
+                last[3].append(value)
+                last[4] = idx
+            else:
+                checks.append([idx, kind, action, [value], idx])
+            continue
+
+        try:
+            pred = _predicate(kind, value)
+        except (TypeError, ValueError) as e:
+            raise PolicyError(f"rule #{idx}: bad {kind} value {value!r}") from e
+        checks.append([idx, kind, action, pred, idx])
+
+    compiled: List[Tuple[int, Callable[[Any], bool], str]] = []
+    for first, kind, action, payload, _last in checks:
+        pred = _regex_predicate(kind, payload) if kind in REGEX_KINDS else payload
+        compiled.append((first, pred, action))
+
+    no_limit = len(rules)
+
+    def decide(user: Any) -> str:
+        hit = by_id.get(user.id)
+        limit = hit[0] if hit else no_limit
+        for first, pred, action in compiled:
+            if first >= limit:
+                break
+            if pred(user):
+                return action
+        return hit[1] if hit else default_action
+
+    return decide
+
+
+def parse_policy_text(text: str) -> Tuple[List[dict], str]:
+    """
+    Accepts either a JSON list of rules or {"default": "...", "rules": [...]}.
+    """
+    try:
+        raw = json.loads(text)
+    except ValueError as e:
+        raise PolicyError(f"invalid JSON: {e}") from e
+
+    if isinstance(raw, list):
+        rules, default_action = raw, BAN
+    elif isinstance(raw, dict):
+        rules, default_action = raw.get("rules", []), raw.get("default", BAN)
+    else:
+        raise PolicyError("policy must be a list or an object")
+
+    # validate now so bad input never reaches the DB
+    compile_policy(rules, default_action)
+    return rules, default_action
+
+
+def _ban_everyone(user: Any) -> str:
+    return BAN
+
+
+class PolicyEngine:
+    """
+    Compiled-policy cache. One compiled function per chat, built on first use
+    and dropped by `invalidate()` whenever the policy or its folders change.
+    """
+
+    def __init__(self, database):
+        self._db = database
+        self._compiled: Dict[int, Decision] = {}
+
+    async def decide(self, chat_id: int, user: Any) -> str:
+        fn = self._compiled.get(chat_id)
+        if fn is None:
+            fn = await self._load(chat_id)
+        return fn(user)
+
+    async def _load(self, chat_id: int) -> Decision:
+        row = await self._db.get_policy(chat_id)
+        if row is None:
+            fn = _ban_everyone
+        else:
+            rules_json, default_action = row
+            rules = json.loads(rules_json)
+            folders = None
+            if any(isinstance(r, dict) and r.get("match") == "folder" for r in rules):
+                folders = await self._db.folder_members_map(chat_id)
+            try:
+                fn = compile_policy(rules, default_action, folders)
+            except PolicyError:
+                # a stored policy that no longer compiles must not open the gate
+                fn = _ban_everyone
+        self._compiled[chat_id] = fn
+        return fn
+
+    def invalidate(self, chat_id: Optional[int] = None) -> None:
+        if chat_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(chat_id, None)
+
+
+policies = PolicyEngine(db)
@@ -0,0 +1,290 @@
+# app/profiler.py
+"""
+On-demand profiling for the owner panel, plus a ring buffer of slow work.
+
+Profiler (one session at a time, results sent to the owner as a file):
+  - "sample":   a background thread samples the event-loop thread's stack every
+                SAMPLE_INTERVAL; output is collapsed stacks ("a;b;c count"),
+                readable by flamegraph.pl / speedscope. Negligible overhead.
+  - "cprofile": cProfile on the event-loop thread; exact call counts and times,
+                but every call pays for it (expect the bot to run slower).
+  - tracemalloc: switched on with a baseline snapshot; a snapshot report shows
+                what grew since, by line.
+
+SlowLog keeps the last SLOW_LOG_SIZE entries for
+  - updates whose handling took longer than SLOW_HANDLER_MS; the stack is taken
+    from the update's task when the threshold passes, i.e. where it was stuck
+  - storage calls slower than SLOW_DB_MS, with the caller's stack
+Fast work costs one timer (updates) or one clock read (DB calls); stacks are
+only taken for slow entries.
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from app.config import SLOW_DB_MS, SLOW_HANDLER_MS, SLOW_LOG_SIZE
+from app.ratelimit import api_limiter
+
+logger = logging.getLogger("eclis.profiler")
+
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 64
+TRACEMALLOC_FRAMES = 10
+STACK_LIMIT = 12
+CAPTION_LIMIT = 1000
+
+
+def format_frames(frames) -> List[str]:
+    """Oldest first; asyncio's own frames are left out, they are the same in every entry."""
+    summary = traceback.StackSummary.extract(
+        ((f, f.f_lineno) for f in frames if "/asyncio/" not in f.f_code.co_filename),
+        lookup_lines=True,
+    )
+    return summary.format()[-STACK_LIMIT:]
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="eclis-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names: List[str] = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+class Profiler:
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    # ----- CPU -----
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, chat_id: int, mode: str, seconds: float) -> bool:
+        """False when a session is already running."""
+        if self.running:
+            return False
+        self.mode = mode
+        self.until = time.monotonic() + seconds
+        self._task = asyncio.create_task(self._session(bot, chat_id, mode, seconds))
+        return True
+
+    async def _session(self, bot: Bot, chat_id: int, mode: str, seconds: float) -> None:
+        try:
+            if mode == "cprofile":
+                name, data, caption = await self._cprofile(seconds)
+            else:
+                name, data, caption = await self._sample(seconds)
+            await _send_file(bot, chat_id, name, data, caption)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("profiling session failed")
+        finally:
+            self.mode = None
+
+    async def _sample(self, seconds: float) -> Tuple[str, bytes, str]:
+        # the event loop runs in this thread
+        sampler = _Sampler(threading.get_ident(), SAMPLE_INTERVAL)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+
+        leaves: Counter[str] = Counter()
+        for stack, n in sampler.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        total = max(1, sampler.samples)
+        top = "\n".join(f"{n * 100 / total:5.1f}% {name}" for name, n in leaves.most_common(8))
+        body = "".join(f"{stack} {n}\n" for stack, n in sampler.stacks.most_common())
+        caption = f"🔬 CPU samples: {sampler.samples} in {seconds:.0f}s (collapsed stacks)\n{top}"
+        return f"eclis-sample-{int(time.time())}.txt", body.encode(), caption
+
+    async def _cprofile(self, seconds: float) -> Tuple[str, bytes, str]:
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+
+        out = io.StringIO()
+        stats = pstats.Stats(prof, stream=out)
+        stats.sort_stats("cumulative").print_stats(80)
+        out.write("\n\n=== by own time ===\n")
+        stats.sort_stats("tottime").print_stats(40)
+        caption = f"🔬 cProfile {seconds:.0f}s: {stats.total_calls} calls, {stats.total_tt:.2f}s CPU"
+        return f"eclis-cprofile-{int(time.time())}.txt", out.getvalue().encode(), caption
+
+    def cancel(self) -> None:
+        if self.running:
+            self._task.cancel()
+
+    # ----- memory -----
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def trace_on(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def trace_off(self) -> None:
+        tracemalloc.stop()
+        self._baseline = None
+
+    async def memory_report(self, bot: Bot, chat_id: int) -> bool:
+        """False when tracemalloc is off."""
+        if not tracemalloc.is_tracing():
+            return False
+        # snapshots walk the whole traced heap: not on the loop
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        baseline = self._baseline
+        current, peak = tracemalloc.get_traced_memory()
+
+        def build() -> str:
+            out = io.StringIO()
+            out.write(f"traced now {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n")
+            if baseline is not None:
+                out.write("\n=== growth since tracing started (by line) ===\n")
+                for stat in snapshot.compare_to(baseline, "lineno")[:40]:
+                    out.write(f"{stat}\n")
+            out.write("\n=== largest now (by traceback) ===\n")
+            for stat in snapshot.statistics("traceback")[:10]:
+                out.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                out.write("\n".join(stat.traceback.format()) + "\n")
+            return out.getvalue()
+
+        text = await asyncio.to_thread(build)
+        caption = f"🧠 tracemalloc: {current / 2**20:.1f} MiB traced, peak {peak / 2**20:.1f} MiB"
+        await _send_file(bot, chat_id, f"eclis-memory-{int(time.time())}.txt", text.encode(), caption)
+        return True
+
+
+async def _send_file(bot: Bot, chat_id: int, name: str, data: bytes, caption: str) -> None:
+    await api_limiter.acquire()
+    await bot.send_document(
+        chat_id=chat_id,
+        document=BufferedInputFile(data, filename=name),
+        caption=caption[:CAPTION_LIMIT],
+        parse_mode=None,
+    )
+
+
+# ----- slow work -----
+@dataclass
+class SlowEntry:
+    at: float
+    kind: str
+    name: str
+    ms: float
+    stack: List[str] = field(default_factory=list)
+
+
+class SlowLog:
+    def __init__(self, size: int = SLOW_LOG_SIZE, handler_ms: float = SLOW_HANDLER_MS, db_ms: float = SLOW_DB_MS):
+        self.entries: Deque[SlowEntry] = deque(maxlen=max(1, size))
+        self.handler_ms = handler_ms
+        self.db_ms = db_ms
+        self.total = 0
+
+    def add(self, kind: str, name: str, ms: float, stack: List[str]) -> None:
+        self.total += 1
+        self.entries.append(SlowEntry(time.time(), kind, name, ms, stack))
+
+    def instrument(self, backend: Any) -> int:
+        """Time every public coroutine method of a storage backend (instance attributes)."""
+        if self.db_ms <= 0:
+            return 0
+        wrapped = 0
+        for name, method in inspect.getmembers(backend, inspect.iscoroutinefunction):
+            if name.startswith("_"):
+                continue
+            setattr(backend, name, self._timed(name, method))
+            wrapped += 1
+        return wrapped
+
+    def _timed(self, name: str, method):
+        threshold = self.db_ms / 1000
+
+        @functools.wraps(method)
+        async def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                took = time.perf_counter() - t0
+                if took >= threshold:
+                    # still inside the caller's coroutine chain: this is who waited
+                    frames = []
+                    frame = sys._getframe(1)
+                    while frame is not None:
+                        frames.append(frame)
+                        frame = frame.f_back
+                    stack = format_frames(reversed(frames))
+                    self.add("db", name, took * 1000, stack)
+
+        return timed
+
+    def report(self) -> str:
+        out = io.StringIO()
+        for e in reversed(self.entries):
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e.at))
+            out.write(f"{when} {e.kind} {e.name} {e.ms:.1f} ms\n")
+            out.write("".join(e.stack))
+            out.write("\n")
+        return out.getvalue()
+
+    def summary(self, limit: int = 10) -> List[str]:
+        return [
+            f"{time.strftime('%H:%M:%S', time.localtime(e.at))} {e.kind} {e.name} {e.ms:.0f}ms"
+            for e in list(self.entries)[-limit:][::-1]
+        ]
+
+
+profiler = Profiler()
+slow_log = SlowLog()
@@ -0,0 +1,70 @@
+# app/ratelimit.py
+"""
+Async token bucket shared by background jobs that fan out Bot API calls.
+Telegram allows roughly 30 requests/second per bot; jobs stay under that so
+interactive handlers (panel, guard) still have headroom.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # the lock keeps waiters FIFO instead of all waking up on the same token
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class PerKeyLimiter:
+    """
+    Minimum interval between calls for the same key (e.g. one chat).
+    Entries older than the interval are pruned, so memory follows the number of
+    keys touched recently rather than every key ever seen.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = float(min_interval)
+        self._next: dict = {}
+        self._pruned_at = 0.0
+
+    def _prune(self, now: float) -> None:
+        if len(self._next) > 1024 and now - self._pruned_at >= self.min_interval:
+            self._next = {k: t for k, t in self._next.items() if t > now}
+            self._pruned_at = now
+
+    async def acquire(self, key) -> None:
+        now = time.monotonic()
+        self._prune(now)
+        at = max(now, self._next.get(key, 0.0))
+        self._next[key] = at + self.min_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+# shared by all background fan-out jobs
+api_limiter = RateLimiter(rate=20, burst=5)
@@ -0,0 +1,230 @@
+# app/replay.py
+"""
+Replay a traffic recording (see app/middlewares/recorder.py) through the real
+update pipeline, against a fake Bot API and a scratch database.
+
+    python -m app.replay RECORDING [--speed 1] [--seed-db FILE] [--api-latency MS]
+
+RECORDING is a segment file or a RECORD_DIR (all segments, in order).
+  --speed 1     original pacing; N = N times faster; 0 = as fast as possible
+  --seed-db     SQLite file (e.g. a backup) copied into the scratch DB first, so
+                groups/SAFE/bans/policies match the recorded run
+  --api-latency milliseconds every fake API call takes
+
+Reports the handler latency distribution per update type (recorded vs replayed)
+and the moderation decisions (bans, restricts, join answers, deletes) that
+differ between the recording and the replay.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, get_origin
+
+SHOW_DIVERGENT = 20
+DRAIN_TIMEOUT = 30.0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.replay", description="Replay recorded updates.")
+    parser.add_argument("recording", help="segment file or recording directory")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x faster, 0 = max")
+    parser.add_argument("--seed-db", help="SQLite file to start the scratch DB from")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="ms per fake API call")
+    return parser.parse_args(argv)
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return f"n={len(values)} p50={pick(0.5):.2f} p90={pick(0.9):.2f} p99={pick(0.99):.2f} max={values[-1]:.2f} ms"
+
+
+def make_session(latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, ChatInviteLink, Message, User
+
+    from app.middlewares.recorder import decisions_of
+
+    class ReplaySession(BaseSession):
+        """Fake Bot API: every call succeeds locally; decisions are counted."""
+
+        def __init__(self):
+            super().__init__()
+            self.calls: Counter[str] = Counter()
+            self.decisions: Counter[Tuple[Any, ...]] = Counter()
+            self._message_id = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[method.__api_method__] += 1
+            self.decisions.update(decisions_of(method))
+            if latency:
+                await asyncio.sleep(latency / 1000)
+            return self._result(bot, method)
+
+        def _result(self, bot, method):
+            returning = method.__returning__
+            if returning is bool:
+                return True
+            if get_origin(returning) is list:
+                return []
+            me = User(id=bot.id, is_bot=True, first_name="replay", username="replay_bot")
+            if returning is User:
+                return me
+            if returning is Message:
+                self._message_id += 1
+                chat_id = getattr(method, "chat_id", 0)
+                return Message(
+                    message_id=self._message_id,
+                    date=datetime.now(timezone.utc),
+                    chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private"),
+                )
+            if returning is ChatInviteLink:
+                return ChatInviteLink(
+                    invite_link=f"https://t.me/+replay{self._message_id}",
+                    creator=me,
+                    creates_join_request=False,
+                    is_primary=False,
+                    is_revoked=False,
+                )
+            return None
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            if False:
+                yield b""
+
+        async def close(self) -> None:
+            pass
+
+    return ReplaySession()
+
+
+async def replay(args: argparse.Namespace) -> None:
+    from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.types import Update
+
+    from app.actions import actions
+    from app.db import db
+    from app.join_gate import join_gate
+    from app.main import build_dispatcher, warm_caches
+    from app.middlewares.recorder import find_segments, read_segments
+    from app.outbox import outbox
+    from app.serializer import member_lanes
+    from app.spam_filter import spam_filter
+
+    updates: List[Tuple[float, Update, str]] = []
+    recorded_ms: Dict[str, List[float]] = {}
+    original: Counter[Tuple[Any, ...]] = Counter()
+    for rec in read_segments(find_segments(args.recording)):
+        if rec.get("kind") == "call":
+            original[tuple(rec["decision"])] += 1
+        elif rec.get("kind") == "update":
+            update = Update.model_validate(rec["update"])
+            kind = update.event_type
+            updates.append((rec["at"], update, kind))
+            recorded_ms.setdefault(kind, []).append(rec["ms"])
+    if not updates:
+        print("no updates in", args.recording)
+        return
+    updates.sort(key=lambda u: u[0])
+
+    await db.init()
+    session = make_session(args.api_latency)
+    bot = Bot(token="123456:replay", session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp, _gate, prefilter = build_dispatcher()
+    await warm_caches()
+    actions.start(bot)
+    outbox.start(bot)
+    join_gate.start(bot)
+    spam_filter.start(bot)
+
+    replayed_ms: Dict[str, List[float]] = {}
+
+    async def feed(update: Update, kind: str) -> None:
+        t = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        finally:
+            replayed_ms.setdefault(kind, []).append((time.perf_counter() - t) * 1000)
+
+    first = updates[0][0]
+    started = time.monotonic()
+    tasks = []
+    for at, update, kind in updates:
+        if args.speed > 0:
+            delay = (at - first) / args.speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # concurrent, like polling (handle_as_tasks)
+        tasks.append(asyncio.create_task(feed(update, kind)))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    fed = time.monotonic() - started
+
+    # let the batched/queued work run out: join answers, deletes, actions, outbox bans
+    await join_gate.stop(DRAIN_TIMEOUT)
+    await spam_filter.stop(bot, DRAIN_TIMEOUT)
+    await actions.drain(DRAIN_TIMEOUT)
+    await outbox.stop(DRAIN_TIMEOUT)
+    while await outbox.run_once(bot):
+        pass
+    await member_lanes.stop()
+    await db.close()
+
+    print(f"replayed {len(updates)} update(s) in {fed:.2f}s ({len(updates) / max(fed, 1e-9):.0f}/s), "
+          f"recorded span {updates[-1][0] - first:.2f}s, speed {'max' if args.speed <= 0 else args.speed}")
+    print("prefilter:", prefilter.stats())
+    print("\nhandler latency (recorded | replayed):")
+    for kind in sorted(set(recorded_ms) | set(replayed_ms)):
+        print(f"  {kind}:\n    recorded  {percentiles(recorded_ms.get(kind, []))}"
+              f"\n    replayed  {percentiles(replayed_ms.get(kind, []))}")
+
+    print("\ndecisions (recorded -> replayed):")
+    methods = sorted({d[0] for d in original} | {d[0] for d in session.decisions})
+    for method in methods:
+        a = sum(n for d, n in original.items() if d[0] == method)
+        b = sum(n for d, n in session.decisions.items() if d[0] == method)
+        print(f"  {method}: {a} -> {b}")
+    missing = original - session.decisions
+    extra = session.decisions - original
+    if not missing and not extra:
+        print("\nno divergent decisions")
+        return
+    print(f"\ndivergent: {sum(missing.values())} only recorded, {sum(extra.values())} only replayed")
+    for label, diff in (("only recorded", missing), ("only replayed", extra)):
+        for decision, n in list(diff.items())[:SHOW_DIVERGENT]:
+            print(f"  {label}: {list(decision)}" + (f" x{n}" if n > 1 else ""))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    scratch = tempfile.mkdtemp(prefix="eclis-replay-")
+    db_path = os.path.join(scratch, "replay.sqlite3")
+    if args.seed_db:
+        shutil.copyfile(args.seed_db, db_path)
+    # before any app import: app.config reads the environment once
+    os.environ.update(
+        DB_BACKEND="sqlite",
+        DB_PATH=db_path,
+        JOURNAL_PATH=os.path.join(scratch, "journal.jsonl"),
+        BACKUP_DIR=os.path.join(scratch, "backups"),
+        RECORD_DIR="",
+    )
+    os.environ.setdefault("BOT_TOKEN", "123456:replay")
+    try:
+        asyncio.run(replay(args))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# app/serializer.py
+"""
+Keyed serializer: jobs with the same key run one at a time, in submission
+order; jobs with different keys run in parallel on a bounded worker pool.
+
+A lane (FIFO of jobs for one key) exists only while it has queued or running
+work and is dropped as soon as it drains, so memory is bounded by the number
+of keys with pending jobs — there is no ever-growing dict of locks.
+
+Submission order is the order of `run()` calls; call it before the first
+await in a handler so it matches update arrival order.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger("eclis.serializer")
+
+Job = Tuple[Callable[[], Awaitable[Any]], asyncio.Future]
+
+
+class KeyedSerializer:
+    def __init__(self, workers: int = 32):
+        self.workers = workers
+        self._lanes: Dict[Hashable, Deque[Job]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self.peak_lanes = 0
+
+    def __len__(self) -> int:
+        return len(self._lanes)
+
+    def _ensure_workers(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Queue `fn()` on `key`'s lane; the returned future resolves to its result."""
+        self._ensure_workers()
+        fut = asyncio.get_running_loop().create_future()
+        lane = self._lanes.get(key)
+        if lane is None:
+            # new lane: nothing running for this key, hand it to a worker
+            self._lanes[key] = deque([(fn, fut)])
+            self._ready.put_nowait(key)
+            self.peak_lanes = max(self.peak_lanes, len(self._lanes))
+        else:
+            lane.append((fn, fut))
+        return fut
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            fn, fut = lane[0]
+            try:
+                if not fut.cancelled():
+                    result = await fn()
+                    if not fut.done():
+                        fut.set_result(result)
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.cancel()
+                raise
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                lane.popleft()
+                if lane:
+                    # back of the ready queue: one job per turn keeps busy keys fair
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# (chat_id, user_id) lanes for member updates, bans and unbans
+member_lanes = KeyedSerializer()
@@ -0,0 +1,74 @@
+# app/shutdown.py
+"""
+Graceful shutdown.
+
+Once polling has stopped (no new intake), registered drainers run in
+registration order, all sharing one SHUTDOWN_DEADLINE. A drainer returns the
+records it could not finish; they are written to the journal under the
+drainer's name and handed to the matching replayer on the next start.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import SHUTDOWN_DEADLINE
+from app.journal import Journal, journal
+
+logger = logging.getLogger("eclis.shutdown")
+
+Drainer = Callable[[float], Awaitable[Optional[List[dict]]]]
+Replayer = Callable[[List[dict]], Awaitable[int]]
+
+
+class ShutdownCoordinator:
+    def __init__(self, journal: Journal = journal, deadline: float = SHUTDOWN_DEADLINE):
+        self.journal = journal
+        self.deadline = deadline
+        self._drainers: List[Tuple[str, Drainer]] = []
+        self._replayers: Dict[str, Replayer] = {}
+
+    def register(self, name: str, drain: Drainer, replay: Optional[Replayer] = None) -> None:
+        self._drainers.append((name, drain))
+        if replay is not None:
+            self._replayers[name] = replay
+
+    async def replay(self) -> Dict[str, int]:
+        done: Dict[str, int] = {}
+        for kind, records in self.journal.take().items():
+            replayer = self._replayers.get(kind)
+            if replayer is None:
+                logger.warning("journal: no replayer for %s, keeping %s record(s)", kind, len(records))
+                self.journal.append(kind, records)
+                continue
+            done[kind] = await replayer(records)
+        if done:
+            logger.info("journal replayed: %s", done)
+        return done
+
+    async def shutdown(self) -> Dict[str, int]:
+        end = time.monotonic() + self.deadline
+        journaled: Dict[str, int] = {}
+        for name, drain in self._drainers:
+            left_time = max(0.0, end - time.monotonic())
+            try:
+                leftovers = await drain(left_time) or []
+            except Exception:
+                logger.exception("drain %s failed", name)
+                continue
+            if leftovers:
+                journaled[name] = self.journal.append(name, leftovers)
+        logger.info("shutdown drained in %.2fs, journaled: %s", self.deadline - max(0.0, end - time.monotonic()), journaled or "nothing")
+        return journaled
+
+
+async def wait_tasks(tasks, timeout: float) -> None:
+    """Let in-flight tasks (e.g. update handlers) finish, up to `timeout`."""
+    pending = [t for t in tasks if not t.done()]
+    if pending:
+        await asyncio.wait(pending, timeout=timeout)
+
+
+coordinator = ShutdownCoordinator()
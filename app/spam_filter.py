@@ -0,0 +1,333 @@
+# app/spam_filter.py
+"""
+Group message spam filter.
+
+Each chat has a blocklist (`blocklist` table) of:
+  word    whole words/phrases, case-insensitive           e.g. "crypto signal"
+  url     substrings of links/domains                     e.g. "bit.ly"
+  invite  Telegram invite links; "*" = any invite link    e.g. "t.me/+", "*"
+
+A chat's list is compiled into ONE regex whose alternatives are laid out as a
+trie ("abc|abd" -> "ab[cd]"), so matching costs roughly one pass over the text
+whatever the number of patterns. Edits apply the delta to that chat's pattern
+set and recompile only that chat, in a worker thread (10k patterns take a few
+hundred ms); the old regex keeps serving until the new one is ready.
+
+On a hit the message id goes into a per-chat batch that is removed with one
+`delete_messages` call (up to 100 ids) every SPAM_FLUSH_INTERVAL. After
+SPAM_STRIKES hits within SPAM_STRIKE_WINDOW the sender goes down the guard's
+ban path (DB ban + outbox).
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from app.actions import actions
+from app.cache import bans
+from app.config import OWNER_ID, SPAM_FLUSH_INTERVAL, SPAM_STRIKES, SPAM_STRIKE_WINDOW
+from app.db import db
+from app.log import event
+from app.outbox import outbox
+from app.ratelimit import api_limiter
+from app.serializer import member_lanes
+from app.stats import stats
+
+logger = logging.getLogger("eclis.spam")
+
+KINDS = ("word", "url", "invite")
+ANY_INVITE = r"(?:t|telegram)\.me/(?:\+|joinchat/)"
+DELETE_CHUNK = 100
+MAX_STRIKE_KEYS = 50_000
+
+
+class BlocklistError(ValueError):
+    pass
+
+
+_escape = lru_cache(maxsize=4096)(re.escape)
+
+
+def _trie(words: Iterable[str]) -> Optional[str]:
+    """Regex matching any of `words`, shaped as a trie (shared prefixes factored out)."""
+    root: dict = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = None
+    if not root:
+        return None
+
+    def build(node: dict) -> str:
+        alts: List[str] = []
+        chars: List[str] = []
+        for ch in sorted(k for k in node if k):
+            child = node[ch]
+            if list(child) == [""]:
+                chars.append(_escape(ch))
+            else:
+                alts.append(_escape(ch) + build(child))
+        if chars:
+            alts.append(chars[0] if len(chars) == 1 else "[" + "".join(chars) + "]")
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # a word may also end here
+        return f"(?:{body})?" if "" in node else body
+
+    return build(root)
+
+
+def compile_blocklist(patterns: Iterable[Tuple[str, str]]) -> Optional[re.Pattern]:
+    words: Set[str] = set()
+    urls: Set[str] = set()
+    any_invite = False
+    for kind, pattern in patterns:
+        if kind == "word":
+            words.add(pattern)
+        elif kind == "invite" and pattern == "*":
+            any_invite = True
+        else:
+            urls.add(pattern)
+
+    parts = []
+    word_re = _trie(words)
+    if word_re:
+        parts.append(rf"(?<!\w){word_re}(?!\w)")
+    url_re = _trie(urls)
+    if url_re:
+        parts.append(url_re)
+    if any_invite:
+        parts.append(ANY_INVITE)
+    if not parts:
+        return None
+    return re.compile("|".join(parts))
+
+
+def normalize(kind: str, pattern: str) -> str:
+    pattern = " ".join(pattern.split()).casefold()
+    if kind != "word":
+        for prefix in ("https://", "http://"):
+            if pattern.startswith(prefix):
+                pattern = pattern[len(prefix):]
+    return pattern
+
+
+def parse_blocklist_text(text: str) -> List[Tuple[str, str]]:
+    """
+    One entry per line: "<kind> <pattern>" or just "<pattern>" (= word).
+    Example:
+        crypto signal
+        url bit.ly
+        invite *
+    """
+    rows: List[Tuple[str, str]] = []
+    for idx, line in enumerate((text or "").splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        head, _, rest = line.partition(" ")
+        kind, pattern = (head.lower(), rest) if head.lower() in KINDS and rest.strip() else ("word", line)
+        pattern = normalize(kind, pattern)
+        if not pattern:
+            raise BlocklistError(f"line {idx}: empty pattern")
+        rows.append((kind, pattern))
+    if not rows:
+        raise BlocklistError("nothing to add")
+    return rows
+
+
+def message_text(message: Message) -> str:
+    """Text/caption plus the hidden URLs of text links, casefolded, whitespace collapsed."""
+    parts = [message.text or message.caption or ""]
+    for entity in (message.entities or message.caption_entities or ()):
+        if entity.url:
+            parts.append(entity.url)
+    return " ".join(" ".join(parts).split()).casefold()
+
+
+class SpamFilter:
+    def __init__(self, interval: float = SPAM_FLUSH_INTERVAL):
+        self.interval = interval
+        self._patterns: Dict[int, Set[Tuple[str, str]]] = {}
+        self._compiled: Dict[int, re.Pattern] = {}
+        self._versions: Dict[int, int] = {}
+        self._deletes: Dict[int, List[int]] = {}
+        self._strikes: Dict[Tuple[int, int], Tuple[int, float]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.hits = 0
+        self.deleted = 0
+        self.banned = 0
+
+    # ----- blocklist -----
+    async def _rebuild(self, chat_id: int) -> None:
+        version = self._versions.get(chat_id, 0) + 1
+        self._versions[chat_id] = version
+        snapshot = list(self._patterns.get(chat_id, ()))
+        compiled = await asyncio.to_thread(compile_blocklist, snapshot)
+        if self._versions.get(chat_id) != version:
+            # a newer edit is compiling; it wins
+            return
+        if compiled is None:
+            self._compiled.pop(chat_id, None)
+            self._patterns.pop(chat_id, None)
+        else:
+            self._compiled[chat_id] = compiled
+
+    async def load(self, database=db) -> None:
+        patterns: Dict[int, Set[Tuple[str, str]]] = {}
+        for chat_id, kind, pattern in await database.all_block_patterns():
+            patterns.setdefault(chat_id, set()).add((kind, pattern))
+        for chat_id in set(self._patterns) - set(patterns):
+            patterns[chat_id] = set()
+        self._patterns = patterns
+        await asyncio.gather(*(self._rebuild(chat_id) for chat_id in list(patterns)))
+
+    async def refresh(self, chat_id: int, database=db) -> None:
+        """Reload one chat's list (edit made by another instance, clone, ...)."""
+        self._patterns[chat_id] = set(await database.list_block_patterns(chat_id))
+        await self._rebuild(chat_id)
+
+    async def add(self, chat_id: int, rows: Iterable[Tuple[str, str]]) -> None:
+        self._patterns.setdefault(chat_id, set()).update(rows)
+        await self._rebuild(chat_id)
+
+    async def remove(self, chat_id: int, rows: Iterable[Tuple[str, str]]) -> None:
+        self._patterns.get(chat_id, set()).difference_update(rows)
+        await self._rebuild(chat_id)
+
+    def watches(self, chat_id: int) -> bool:
+        return chat_id in self._compiled
+
+    def size(self, chat_id: int) -> int:
+        return len(self._patterns.get(chat_id, ()))
+
+    # ----- message path -----
+    def check(self, message: Message) -> Optional[str]:
+        """The matched fragment, or None."""
+        compiled = self._compiled.get(message.chat.id)
+        if compiled is None:
+            return None
+        m = compiled.search(message_text(message))
+        return m.group(0) if m else None
+
+    def _strike(self, chat_id: int, user_id: int) -> int:
+        now = time.monotonic()
+        count, since = self._strikes.get((chat_id, user_id), (0, now))
+        if now - since > SPAM_STRIKE_WINDOW:
+            count, since = 0, now
+        self._strikes[(chat_id, user_id)] = (count + 1, since)
+        return count + 1
+
+    async def punish(self, message: Message, hit: str) -> None:
+        chat_id = message.chat.id
+        self.hits += 1
+        stats.incr(chat_id, "spam")
+        self.delete(chat_id, [message.message_id])
+
+        user = message.from_user
+        # channel/anonymous posts: the message goes, there is no member to ban
+        if message.sender_chat is not None or user is None or user.id == OWNER_ID:
+            return
+        if self._strike(chat_id, user.id) < SPAM_STRIKES:
+            return
+        self._strikes.pop((chat_id, user.id), None)
+        await member_lanes.run((chat_id, user.id), lambda: self._ban(chat_id, user.id, hit))
+
+    async def _ban(self, chat_id: int, user_id: int, hit: str) -> None:
+        if bans.contains(user_id, chat_id):
+            return
+        # same path as the join guard: DB ban + queued Telegram ban in one transaction
+        await db.add_ban(user_id, chat_id, enforce=True)
+        outbox.notify()
+        bans.add(user_id, chat_id)
+        stats.incr(chat_id, "ban")
+        self.banned += 1
+        event("spam.ban", chat_id=chat_id, user_id=user_id, hit=hit[:64])
+        actions.submit(
+            "send_message",
+            chat_id=OWNER_ID,
+            text=f"این کاربر به خاطر اسپم بن شد : {user_id}\nچت: {chat_id}\nمورد: {html.escape(hit[:64])}",
+        )
+
+    # ----- delete batches -----
+    def delete(self, chat_id: int, message_ids: Iterable[int]) -> None:
+        """Queue messages for the next batched delete_messages call."""
+        self._deletes.setdefault(chat_id, []).extend(message_ids)
+        self._wake.set()
+
+    async def flush(self, bot: Bot) -> int:
+        if not self._deletes:
+            return 0
+        pending, self._deletes = self._deletes, {}
+
+        async def delete(chat_id: int, ids: List[int]) -> int:
+            done = 0
+            for i in range(0, len(ids), DELETE_CHUNK):
+                chunk = ids[i:i + DELETE_CHUNK]
+                await api_limiter.acquire()
+                try:
+                    await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                    done += len(chunk)
+                except Exception as e:
+                    # too old / already gone / no rights: nothing to retry
+                    logger.warning("delete_messages in %s failed: %s", chat_id, e)
+            return done
+
+        counts = await asyncio.gather(*(delete(c, sorted(set(ids))) for c, ids in pending.items()))
+        self.deleted += sum(counts)
+        self._prune_strikes()
+        return sum(counts)
+
+    def _prune_strikes(self) -> None:
+        if len(self._strikes) <= MAX_STRIKE_KEYS:
+            return
+        cutoff = time.monotonic() - SPAM_STRIKE_WINDOW
+        self._strikes = {k: v for k, v in self._strikes.items() if v[1] >= cutoff}
+
+    async def run(self, bot: Bot) -> None:
+        while not self._stopping:
+            self._wake.clear()
+            await self._wake.wait()
+            # gather the burst into one call per chat
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("spam delete pass failed")
+
+    def start(self, bot: Bot) -> asyncio.Task:
+        self._stopping = False
+        self._task = asyncio.create_task(self.run(bot))
+        return self._task
+
+    async def stop(self, bot: Bot, timeout: float) -> None:
+        """Send the deletes still batched; they cannot wait for the next start."""
+        end = time.monotonic() + timeout
+        if self._task is not None:
+            # a pass in flight holds its batch (possibly waiting on api_limiter): let it finish
+            self._stopping = True
+            self._wake.set()
+            _done, pending = await asyncio.wait([self._task], timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.wait_for(self.flush(bot), max(0.0, end - time.monotonic()))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "deleted": self.deleted, "banned": self.banned}
+
+
+spam_filter = SpamFilter()
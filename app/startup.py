@@ -0,0 +1,49 @@
+# app/startup.py
+"""
+Startup phases and readiness.
+
+Polling starts as soon as the DB schema is checked; caches are warmed in the
+background and `startup.ready` is set when they are. Phase durations and
+milestones (first poll, caches ready, first ban) are logged relative to
+process start so time-to-first-ban can be tracked across releases.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger("eclis.startup")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.t0 = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.ready = asyncio.Event()
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            took = time.monotonic() - t
+            self.phases[name] = took
+            logger.info("startup phase %s: %.1f ms", name, took * 1000)
+
+    def mark(self, name: str) -> float:
+        at = time.monotonic() - self.t0
+        self.marks[name] = at
+        logger.info("startup mark %s: +%.1f ms", name, at * 1000)
+        return at
+
+    def mark_once(self, name: str) -> None:
+        if name not in self.marks:
+            self.mark(name)
+
+
+startup = StartupTimer()
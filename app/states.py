@@ -5,6 +5,8 @@ class OwnerStates(StatesGroup):
     waiting_for_admin_id = State()
     waiting_for_clone_target_ids = State()
     waiting_for_set_context_chat_id = State()
+    waiting_for_policy_json = State()
+    waiting_for_broadcast_message = State()
 
 
 class AdminStates(StatesGroup):
@@ -14,3 +16,7 @@ class AdminStates(StatesGroup):
     waiting_for_create_folder_name = State()
     waiting_for_folder_add_user_id = State()
     waiting_for_folder_remove_user_id = State()
+    waiting_for_folder_safe_chat_ids = State()
+    waiting_for_link = State()
+    waiting_for_block_add = State()
+    waiting_for_block_remove = State()
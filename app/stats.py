@@ -0,0 +1,96 @@
+# app/stats.py
+"""
+Guard statistics.
+
+The join path only bumps an in-memory Counter keyed by (chat_id, minute, event);
+`stats_loop` flushes it to `stats_rollup` in one batch every STATS_FLUSH_INTERVAL
+and periodically compacts old rows:
+  - minute rows older than MINUTE_KEEP -> hour rows
+  - hour rows older than HOUR_KEEP     -> day rows
+so reading "last 24h / 7 days" touches at most a few hundred rows per chat, no
+matter how much history exists. All-time totals live in one row per event.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from app.config import STATS_COMPACT_INTERVAL, STATS_FLUSH_INTERVAL
+from app.db import db
+
+logger = logging.getLogger("eclis.stats")
+
+EVENTS = ("join", "safe", "allow", "mute", "ban", "request", "decline", "spam", "flood")
+
+MINUTE_KEEP = 2 * 3600
+HOUR_KEEP = 2 * 86400
+
+
+class StatsCounter:
+    def __init__(self):
+        self._counts: Counter[Tuple[int, int, str]] = Counter()
+
+    def incr(self, chat_id: int, event: str, n: int = 1) -> None:
+        now = int(time.time())
+        self._counts[(chat_id, now - now % 60, event)] += n
+
+    async def flush(self) -> int:
+        if not self._counts:
+            return 0
+        # swap first: increments during the write go to the next batch
+        counts, self._counts = self._counts, Counter()
+        rows = [(chat_id, bucket, event, n) for (chat_id, bucket, event), n in counts.items()]
+        try:
+            await db.add_stats(rows)
+        except Exception:
+            # keep them for the next flush
+            self._counts.update(counts)
+            raise
+        return len(rows)
+
+    async def compact(self) -> int:
+        now = int(time.time())
+        return await db.compact_stats(now - MINUTE_KEEP, now - HOUR_KEEP)
+
+    async def summary(self, chat_id: Optional[int]) -> Dict[str, Dict[str, int]]:
+        """Flushes pending counts, then returns {"24h": ..., "7d": ..., "all": ...}."""
+        await self.flush()
+        now = int(time.time())
+        day, week, total = await asyncio.gather(
+            db.stats_since(chat_id, now - 86400),
+            db.stats_since(chat_id, now - 7 * 86400),
+            db.stats_total(chat_id),
+        )
+        return {"24h": day, "7d": week, "all": total}
+
+
+def format_summary(chat_id: Optional[int], summary: Dict[str, Dict[str, int]]) -> str:
+    title = f"📊 Stats — {chat_id}" if chat_id else "📊 Stats — all groups"
+    lines = [title, "", "event: 24h / 7d / all"]
+    for event in EVENTS:
+        lines.append(
+            f"{event}: {summary['24h'].get(event, 0)} / "
+            f"{summary['7d'].get(event, 0)} / {summary['all'].get(event, 0)}"
+        )
+    return "\n".join(lines)
+
+
+async def stats_loop() -> None:
+    last_compact = float("-inf")
+    while True:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        try:
+            await stats.flush()
+            if time.monotonic() - last_compact >= STATS_COMPACT_INTERVAL:
+                changed = await stats.compact()
+                last_compact = time.monotonic()
+                if changed:
+                    logger.info("stats compacted (%s row changes)", changed)
+        except Exception:
+            logger.exception("stats flush failed")
+
+
+stats = StatsCounter()
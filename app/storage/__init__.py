@@ -0,0 +1,21 @@
+# app/storage/__init__.py
+"""Storage backends behind the `StorageBackend` protocol; `create_backend` picks one."""
+from app.storage.base import SCHEMA_VERSION, StorageBackend
+from app.storage.sqlite import SQLiteBackend
+
+
+def create_backend(name: str = "sqlite", **options) -> StorageBackend:
+    """
+    sqlite:   options path (default eclis_guard.sqlite3)
+    postgres: options dsn, min_size, max_size (needs asyncpg)
+    """
+    if name == "sqlite":
+        return SQLiteBackend(**options)
+    if name == "postgres":
+        # imported lazily: asyncpg is only needed for this backend
+        from app.storage.postgres import PostgresBackend
+        return PostgresBackend(**options)
+    raise ValueError(f"unknown DB_BACKEND: {name!r} (expected sqlite or postgres)")
+
+
+__all__ = ["SCHEMA_VERSION", "StorageBackend", "SQLiteBackend", "create_backend"]
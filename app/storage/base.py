@@ -0,0 +1,310 @@
+# app/storage/base.py
+"""
+Storage backend protocol. `app.db.db` is whichever implementation DB_BACKEND
+selects; everything else in the bot only talks to these methods.
+
+Backends must keep the same semantics (see app/storage/sqlite.py):
+  - chat_id None on safe/ban rows means GLOBAL
+  - every mutating method on guard data writes its `changes` row in the same
+    transaction; enforce=True bans/unbans write their outbox entry likewise
+  - bulk methods are a single transaction
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+# bump whenever a backend's init() gains DDL; boots on an up-to-date DB skip all DDL
+SCHEMA_VERSION = 8
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    name: str
+    origin: str
+
+    async def close(self):
+        ...
+
+    async def init(self) -> bool:
+        """Create/migrate the schema. Returns False (and does nothing) if it is current."""
+        ...
+
+    # ---------- Admins ----------
+    async def add_admin(self, user_id: int):
+        ...
+
+    async def is_admin(self, user_id: int) -> bool:
+        ...
+
+    async def list_admins(self) -> List[int]:
+        ...
+
+    # ---------- Groups ----------
+    async def upsert_group(self, chat_id: int, title: Optional[str], chat_type: str = "group"):
+        ...
+
+    async def list_groups(self) -> List[Tuple[int, Optional[str], str]]:
+        ...
+
+    async def set_join_gate(self, chat_id: int, enabled: bool):
+        ...
+
+    async def join_gate_chats(self) -> List[int]:
+        ...
+
+    # ---------- SAFE ----------
+    async def add_safe(self, user_id: int, chat_id: Optional[int] = None):
+        ...
+
+    async def remove_safe(self, user_id: int, chat_id: Optional[int] = None):
+        ...
+
+    async def list_safe(self, chat_id: Optional[int] = None) -> List[int]:
+        ...
+
+    async def all_safe(self) -> List[Tuple[int, Optional[int]]]:
+        ...
+
+    async def is_safe(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        ...
+
+    # ---------- BANS ----------
+    async def add_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        """
+        enforce=True (chat-specific bans only): also queue ban_chat_member in the
+        outbox, in the same transaction as the ban row.
+        """
+        ...
+
+    async def add_bans(self, rows: List[Tuple[int, Optional[int]]], enforce: List[Tuple[int, int]] = ()):
+        """
+        Bulk add_ban in one transaction. rows: (user_id, chat_id or None for GLOBAL);
+        enforce: (user_id, chat_id) pairs that also get a queued ban_chat_member.
+        """
+        ...
+
+    async def remove_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        """enforce=True: also queue unban_chat_member in the outbox (same transaction)."""
+        ...
+
+    async def list_bans(self, chat_id: Optional[int] = None) -> List[Tuple[int, Optional[int]]]:
+        ...
+
+    async def all_bans(self) -> List[Tuple[int, Optional[int]]]:
+        ...
+
+    async def is_banned(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        ...
+
+    # ---------- Folders ----------
+    async def create_folder(self, chat_id: int, name: str):
+        ...
+
+    async def list_folders(self, chat_id: int) -> List[Tuple[int, str]]:
+        ...
+
+    async def folder_add_user(self, chat_id: int, folder_name: str, user_id: int):
+        ...
+
+    async def folder_remove_user(self, chat_id: int, folder_name: str, user_id: int):
+        ...
+
+    async def list_folder_members(self, chat_id: int, folder_name: str) -> List[int]:
+        ...
+
+    async def get_folder(self, folder_id: int) -> Optional[Tuple[int, int, str]]:
+        ...
+
+    async def delete_folder(self, folder_id: int):
+        ...
+
+    async def folder_add_users(self, folder_id: int, user_ids: List[int]) -> int:
+        ...
+
+    async def folder_remove_users(self, folder_id: int, user_ids: List[int]) -> int:
+        ...
+
+    async def list_folder_members_by_id(self, folder_id: int) -> List[int]:
+        ...
+
+    async def set_folder_safe_chats(self, folder_id: int, chat_ids: List[int]):
+        ...
+
+    async def list_folder_safe_chats(self, folder_id: int) -> List[int]:
+        ...
+
+    async def folder_safe_state(
+        self, folder_id: Optional[int] = None
+    ) -> Dict[int, Tuple[List[int], List[int]]]:
+        """
+        folder_id -> (member user_ids, safe chat_ids), only for folders marked SAFE somewhere.
+        folder_id=None => every such folder (used to build the in-memory reverse index).
+        """
+        ...
+
+    async def folder_members_map(self, chat_id: int) -> Dict[str, List[int]]:
+        ...
+
+    # ---------- Guard policy ----------
+    async def get_policy(self, chat_id: int) -> Optional[Tuple[str, str]]:
+        ...
+
+    async def set_policy(self, chat_id: int, rules: str, default_action: str = "ban"):
+        ...
+
+    async def delete_policy(self, chat_id: int):
+        ...
+
+    # ---------- Links ----------
+    async def add_link(self, chat_id: int, name: str, url: str) -> bool:
+        ...
+
+    async def add_invite_links(self, rows: List[Tuple[int, str, str, Optional[int]]]):
+        """rows: (chat_id, name, url, expires_at) — stored in one transaction."""
+        ...
+
+    async def list_links(self, chat_id: int) -> List[Tuple[int, str, str, str]]:
+        ...
+
+    async def get_link(self, link_id: int) -> Optional[Tuple[int, int, str, str, int]]:
+        ...
+
+    async def delete_link(self, link_id: int):
+        ...
+
+    async def delete_links(self, link_ids: List[int]):
+        ...
+
+    async def list_expired_invite_links(self, now: int) -> List[Tuple[int, int, str]]:
+        ...
+
+    async def chats_with_valid_invite(self, valid_until: int) -> List[int]:
+        ...
+
+    # ---------- Broadcasts ----------
+    async def create_broadcast(self, from_chat_id: int, message_id: int, chat_ids: List[int]) -> int:
+        ...
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Tuple[int, int, int, str, Optional[int], Optional[int]]]:
+        ...
+
+    async def list_running_broadcasts(self) -> List[int]:
+        ...
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        ...
+
+    async def set_broadcast_progress_message(self, broadcast_id: int, chat_id: int, message_id: int):
+        ...
+
+    async def pending_deliveries(self, broadcast_id: int) -> List[int]:
+        ...
+
+    async def record_deliveries(self, broadcast_id: int, results: List[Tuple[int, str, Optional[str]]]):
+        """results: (chat_id, status, error) — written in one transaction."""
+        ...
+
+    async def broadcast_counts(self, broadcast_id: int) -> Dict[str, int]:
+        ...
+
+    # ---------- Outbox ----------
+    async def enqueue_action(self, method: str, payload: dict):
+        ...
+
+    async def due_outbox(self, now: int, limit: int) -> List[Tuple[int, str, dict, int]]:
+        """
+        (id, method, payload, attempts) of pending entries whose next_at has passed.
+        An entry waits while an older one for the same (chat, user) is still pending,
+        so a retried ban can never land after a later unban. Entries without a
+        (chat, user) are not ordered.
+        """
+        ...
+
+    async def finish_outbox(
+        self,
+        done: List[int],
+        retry: List[Tuple[int, int, str]],
+        failed: List[Tuple[int, str]],
+    ):
+        """
+        Settle one batch in one transaction.
+        retry: (id, next_at, error), failed: (id, error)
+        """
+        ...
+
+    async def outbox_counts(self) -> Dict[str, int]:
+        ...
+
+    async def purge_outbox(self, keep_days: int = 7) -> int:
+        """Drop settled entries older than keep_days."""
+        ...
+
+    # ---------- Spam blocklist ----------
+    async def add_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        """rows: (kind, pattern), kind in word/url/invite. Returns how many were new."""
+        ...
+
+    async def remove_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        ...
+
+    async def list_block_patterns(self, chat_id: int) -> List[Tuple[str, str]]:
+        ...
+
+    async def all_block_patterns(self) -> List[Tuple[int, str, str]]:
+        ...
+
+    # ---------- Join requests ----------
+    async def add_join_requests(self, rows: List[Tuple[int, int, str]]):
+        """rows: (chat_id, user_id, user_json); a repeated request replaces the stored user."""
+        ...
+
+    async def pending_join_requests(self, limit: int = 1000) -> List[Tuple[int, int, str]]:
+        """(chat_id, user_id, user_json), oldest first."""
+        ...
+
+    async def finish_join_requests(self, keys: List[Tuple[int, int]]):
+        ...
+
+    # ---------- Stats ----------
+    async def add_stats(self, rows: List[Tuple[int, int, str, int]]):
+        """rows: (chat_id, minute_bucket, event, count); also bumps the all-time row."""
+        ...
+
+    async def compact_stats(self, minutes_before: int, hours_before: int) -> int:
+        """
+        Fold minute rows older than `minutes_before` into hour rows and hour rows
+        older than `hours_before` into day rows, in one transaction.
+        """
+        ...
+
+    async def stats_since(self, chat_id: Optional[int], since: int) -> Dict[str, int]:
+        """
+        Event counts since `since` (bucket-aligned, so approximate at the edge).
+        Only rows inside the retention windows are read, not the whole history.
+        chat_id None => all chats.
+        """
+        ...
+
+    async def stats_total(self, chat_id: Optional[int]) -> Dict[str, int]:
+        ...
+
+    # ---------- Change feed ----------
+    async def change_bounds(self) -> Tuple[int, int]:
+        """
+        (oldest seq still stored, last seq ever issued). The head must survive
+        pruning; when nothing is stored, oldest = head + 1.
+        """
+        ...
+
+    async def changes_since(
+        self, seq: int, limit: int = 500
+    ) -> List[Tuple[int, str, str, str, Optional[int], Optional[int], Optional[int]]]:
+        """(seq, origin, kind, op, user_id, chat_id, ref) after `seq`, oldest first."""
+        ...
+
+    async def prune_changes(self, before: int) -> int:
+        ...
+
+    # ---------- Clone (copy settings from src_chat to dst_chat) ----------
+    async def clone_group_data(self, src_chat_id: int, dst_chat_id: int):
+        ...
@@ -0,0 +1,967 @@
+# app/storage/postgres.py
+"""
+PostgreSQL backend (DB_BACKEND=postgres), for fleets where SQLite's single
+writer becomes the ceiling during simultaneous raids.
+
+  - one asyncpg pool (DB_POOL_MIN..DB_POOL_MAX connections), created on first use
+  - statements are prepared once per connection by asyncpg's statement cache
+  - bulk inserts go through COPY into a per-session temp table, then one
+    INSERT .. SELECT .. ON CONFLICT, so they keep the backend's dedupe rules
+  - bulk updates/deletes are single statements over unnest()/ANY() arrays
+
+Same semantics as app/storage/sqlite.py. GLOBAL rows (chat_id NULL) are kept
+unique through an expression index on COALESCE(chat_id, 0).
+
+asyncpg is optional: it is only imported when this backend is selected.
+"""
+from __future__ import annotations
+
+import json
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - optional dependency
+    asyncpg = None
+
+from app.storage.base import SCHEMA_VERSION
+
+# ON CONFLICT target matching the GLOBAL-aware unique indexes below
+USER_CHAT_CONFLICT = "(user_id, (COALESCE(chat_id, 0)))"
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS schema_meta(
+        key TEXT PRIMARY KEY,
+        value BIGINT NOT NULL
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS admins(user_id BIGINT PRIMARY KEY)",
+    """
+    CREATE TABLE IF NOT EXISTS groups(
+        chat_id BIGINT PRIMARY KEY,
+        title TEXT,
+        chat_type TEXT DEFAULT 'group'
+    )
+    """,
+    # safe list / bans: chat_id NULL => GLOBAL
+    "CREATE TABLE IF NOT EXISTS safe_users(user_id BIGINT NOT NULL, chat_id BIGINT NULL)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS safe_users_uniq ON safe_users(user_id, (COALESCE(chat_id, 0)))",
+    "CREATE TABLE IF NOT EXISTS bans(user_id BIGINT NOT NULL, chat_id BIGINT NULL)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS bans_uniq ON bans(user_id, (COALESCE(chat_id, 0)))",
+    """
+    CREATE TABLE IF NOT EXISTS folders(
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        name TEXT NOT NULL,
+        UNIQUE(chat_id, name)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS folder_members(
+        folder_id BIGINT NOT NULL REFERENCES folders(id) ON DELETE CASCADE,
+        user_id BIGINT NOT NULL,
+        PRIMARY KEY(folder_id, user_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS folder_safe_chats(
+        folder_id BIGINT NOT NULL REFERENCES folders(id) ON DELETE CASCADE,
+        chat_id BIGINT NOT NULL,
+        PRIMARY KEY(folder_id, chat_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS links(
+        id BIGSERIAL PRIMARY KEY,
+        chat_id BIGINT NOT NULL,
+        name TEXT NOT NULL,
+        url TEXT NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        expires_at BIGINT NULL,
+        is_invite INTEGER NOT NULL DEFAULT 0,
+        UNIQUE(chat_id, url)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS links_invite_expiry ON links(is_invite, expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS guard_policies(
+        chat_id BIGINT PRIMARY KEY,
+        rules TEXT NOT NULL DEFAULT '[]',
+        default_action TEXT NOT NULL DEFAULT 'ban',
+        updated_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    # join-request gate (app/join_gate.py)
+    "ALTER TABLE groups ADD COLUMN IF NOT EXISTS join_gate INTEGER NOT NULL DEFAULT 0",
+    """
+    CREATE TABLE IF NOT EXISTS join_requests(
+        chat_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        "user" TEXT NOT NULL,
+        created_at BIGINT NOT NULL DEFAULT extract(epoch FROM now())::bigint,
+        PRIMARY KEY(chat_id, user_id)
+    )
+    """,
+    # message spam filter (app/spam_filter.py)
+    """
+    CREATE TABLE IF NOT EXISTS blocklist(
+        chat_id BIGINT NOT NULL,
+        kind TEXT NOT NULL,
+        pattern TEXT NOT NULL,
+        PRIMARY KEY(chat_id, kind, pattern)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcasts(
+        id BIGSERIAL PRIMARY KEY,
+        from_chat_id BIGINT NOT NULL,
+        message_id BIGINT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        progress_chat_id BIGINT NULL,
+        progress_message_id BIGINT NULL,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS broadcast_deliveries(
+        broadcast_id BIGINT NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+        chat_id BIGINT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT NULL,
+        PRIMARY KEY(broadcast_id, chat_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS outbox(
+        id BIGSERIAL PRIMARY KEY,
+        method TEXT NOT NULL,
+        payload JSONB NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_at BIGINT NOT NULL DEFAULT 0,
+        last_error TEXT NULL,
+        created_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_at)",
+    "ALTER TABLE outbox ADD COLUMN IF NOT EXISTS chat_id BIGINT NULL",
+    "ALTER TABLE outbox ADD COLUMN IF NOT EXISTS user_id BIGINT NULL",
+    """
+    UPDATE outbox SET chat_id=(payload->>'chat_id')::bigint, user_id=(payload->>'user_id')::bigint
+    WHERE status='pending' AND chat_id IS NULL AND user_id IS NULL
+    """,
+    "CREATE INDEX IF NOT EXISTS outbox_member ON outbox(status, chat_id, user_id, id)",
+    """
+    CREATE TABLE IF NOT EXISTS stats_rollup(
+        chat_id BIGINT NOT NULL,
+        grain TEXT NOT NULL,
+        bucket BIGINT NOT NULL,
+        event TEXT NOT NULL,
+        count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY(chat_id, grain, bucket, event)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS stats_rollup_grain ON stats_rollup(grain, bucket)",
+    """
+    CREATE TABLE IF NOT EXISTS changes(
+        seq BIGSERIAL PRIMARY KEY,
+        origin TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        op TEXT NOT NULL,
+        user_id BIGINT NULL,
+        chat_id BIGINT NULL,
+        ref BIGINT NULL,
+        created_at BIGINT NOT NULL DEFAULT extract(epoch FROM now())::bigint
+    )
+    """,
+]
+
+
+def _status_count(status: str) -> int:
+    # "INSERT 0 12" / "DELETE 3" / "UPDATE 5"
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except (ValueError, AttributeError):
+        return 0
+
+
+def _tuples(rows: Iterable[Any]) -> List[tuple]:
+    return [tuple(r) for r in rows]
+
+
+class PostgresBackend:
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("DB_BACKEND=postgres needs the asyncpg package (pip install asyncpg)")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.origin = uuid.uuid4().hex[:12]
+        self._pool: Optional["asyncpg.Pool"] = None
+
+    async def _get_pool(self) -> "asyncpg.Pool":
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                self.dsn, min_size=self.min_size, max_size=self.max_size
+            )
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @asynccontextmanager
+    async def _conn(self) -> AsyncIterator["asyncpg.Connection"]:
+        pool = await self._get_pool()
+        async with pool.acquire() as con:
+            yield con
+
+    @asynccontextmanager
+    async def _tx(self) -> AsyncIterator["asyncpg.Connection"]:
+        async with self._conn() as con:
+            async with con.transaction():
+                yield con
+
+    async def _fetch(self, query: str, *args) -> List[tuple]:
+        async with self._conn() as con:
+            return _tuples(await con.fetch(query, *args))
+
+    async def _fetchrow(self, query: str, *args) -> Optional[tuple]:
+        async with self._conn() as con:
+            row = await con.fetchrow(query, *args)
+            return tuple(row) if row is not None else None
+
+    async def _column(self, query: str, *args) -> List[Any]:
+        async with self._conn() as con:
+            return [r[0] for r in await con.fetch(query, *args)]
+
+    async def _execute(self, query: str, *args) -> str:
+        async with self._conn() as con:
+            return await con.execute(query, *args)
+
+    async def _copy_insert(
+        self,
+        con: "asyncpg.Connection",
+        table: str,
+        columns: Sequence[str],
+        records: List[tuple],
+        on_conflict: str = "ON CONFLICT DO NOTHING",
+    ) -> int:
+        """COPY records into a session temp table, then merge them in one statement."""
+        if not records:
+            return 0
+        cols = ", ".join(columns)
+        tmp = f"_copy_{table}_{'_'.join(columns)}"
+        await con.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {tmp} ON COMMIT DELETE ROWS "
+            f"AS SELECT {cols} FROM {table} WITH NO DATA"
+        )
+        await con.execute(f"TRUNCATE {tmp}")
+        await con.copy_records_to_table(tmp, records=records, columns=list(columns))
+        status = await con.execute(f"INSERT INTO {table}({cols}) SELECT {cols} FROM {tmp} {on_conflict}")
+        return _status_count(status)
+
+    async def _changed(
+        self,
+        con: "asyncpg.Connection",
+        kind: str,
+        op: str,
+        user_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        ref: Optional[int] = None,
+    ):
+        # change feed row; runs inside the caller's transaction
+        await con.execute(
+            "INSERT INTO changes(origin, kind, op, user_id, chat_id, ref) VALUES ($1,$2,$3,$4,$5,$6)",
+            self.origin, kind, op, user_id, chat_id, ref,
+        )
+
+    async def init(self) -> bool:
+        async with self._tx() as con:
+            # several instances may boot at once: one migrates, the others wait
+            await con.execute("SELECT pg_advisory_xact_lock(hashtext('eclis_schema'))")
+            await con.execute(DDL[0])
+            version = await con.fetchval("SELECT value FROM schema_meta WHERE key='version'")
+            if version is not None and version >= SCHEMA_VERSION:
+                return False
+            for stmt in DDL[1:]:
+                await con.execute(stmt)
+            await con.execute(
+                "INSERT INTO schema_meta(key, value) VALUES ('version', $1) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                SCHEMA_VERSION,
+            )
+            return True
+
+    # ---------- Admins ----------
+    async def add_admin(self, user_id: int):
+        async with self._tx() as con:
+            await con.execute("INSERT INTO admins(user_id) VALUES ($1) ON CONFLICT DO NOTHING", user_id)
+            await self._changed(con, "admin", "add", user_id=user_id)
+
+    async def is_admin(self, user_id: int) -> bool:
+        return await self._fetchrow("SELECT 1 FROM admins WHERE user_id=$1", user_id) is not None
+
+    async def list_admins(self) -> List[int]:
+        return await self._column("SELECT user_id FROM admins ORDER BY user_id ASC")
+
+    # ---------- Groups ----------
+    async def upsert_group(self, chat_id: int, title: Optional[str], chat_type: str = "group"):
+        async with self._tx() as con:
+            # called on every join: an unchanged group writes nothing
+            status = await con.execute(
+                "INSERT INTO groups(chat_id,title,chat_type) VALUES ($1,$2,$3) "
+                "ON CONFLICT(chat_id) DO UPDATE SET title=excluded.title, chat_type=excluded.chat_type "
+                "WHERE groups.title IS DISTINCT FROM excluded.title "
+                "OR groups.chat_type IS DISTINCT FROM excluded.chat_type",
+                chat_id, title, chat_type,
+            )
+            if _status_count(status):
+                await self._changed(con, "group", "upsert", chat_id=chat_id)
+
+    async def list_groups(self) -> List[Tuple[int, Optional[str], str]]:
+        return await self._fetch("SELECT chat_id, title, chat_type FROM groups ORDER BY title ASC")
+
+    async def set_join_gate(self, chat_id: int, enabled: bool):
+        async with self._tx() as con:
+            await con.execute(
+                "UPDATE groups SET join_gate=$2 WHERE chat_id=$1", chat_id, 1 if enabled else 0
+            )
+            await self._changed(con, "gate", "on" if enabled else "off", chat_id=chat_id)
+
+    async def join_gate_chats(self) -> List[int]:
+        return await self._column("SELECT chat_id FROM groups WHERE join_gate=1")
+
+    # ---------- SAFE ----------
+    async def add_safe(self, user_id: int, chat_id: Optional[int] = None):
+        async with self._tx() as con:
+            await con.execute(
+                f"INSERT INTO safe_users(user_id, chat_id) VALUES ($1, $2) ON CONFLICT {USER_CHAT_CONFLICT} DO NOTHING",
+                user_id, chat_id,
+            )
+            await self._changed(con, "safe", "add", user_id=user_id, chat_id=chat_id)
+
+    async def remove_safe(self, user_id: int, chat_id: Optional[int] = None):
+        async with self._tx() as con:
+            await con.execute(
+                "DELETE FROM safe_users WHERE user_id=$1 AND chat_id IS NOT DISTINCT FROM $2",
+                user_id, chat_id,
+            )
+            await self._changed(con, "safe", "remove", user_id=user_id, chat_id=chat_id)
+
+    async def list_safe(self, chat_id: Optional[int] = None) -> List[int]:
+        return await self._column(
+            "SELECT user_id FROM safe_users WHERE chat_id IS NOT DISTINCT FROM $1 ORDER BY user_id ASC",
+            chat_id,
+        )
+
+    async def all_safe(self) -> List[Tuple[int, Optional[int]]]:
+        return await self._fetch("SELECT user_id, chat_id FROM safe_users")
+
+    async def is_safe(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        row = await self._fetchrow(
+            "SELECT 1 FROM safe_users WHERE user_id=$1 AND (chat_id IS NOT DISTINCT FROM $2 OR chat_id IS NULL)",
+            user_id, chat_id,
+        )
+        return row is not None
+
+    # ---------- BANS ----------
+    async def _enqueue(self, con: "asyncpg.Connection", method: str, payload: dict):
+        await con.execute(
+            "INSERT INTO outbox(method, payload, chat_id, user_id) VALUES ($1, $2::jsonb, $3, $4)",
+            method, json.dumps(payload), payload.get("chat_id"), payload.get("user_id"),
+        )
+
+    async def add_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        async with self._tx() as con:
+            await con.execute(
+                f"INSERT INTO bans(user_id, chat_id) VALUES ($1, $2) ON CONFLICT {USER_CHAT_CONFLICT} DO NOTHING",
+                user_id, chat_id,
+            )
+            if enforce and chat_id is not None:
+                await self._enqueue(con, "ban_chat_member", {"chat_id": chat_id, "user_id": user_id})
+            await self._changed(con, "ban", "add", user_id=user_id, chat_id=chat_id)
+
+    async def add_bans(self, rows: List[Tuple[int, Optional[int]]], enforce: List[Tuple[int, int]] = ()):
+        rows = list(dict.fromkeys(rows))
+        async with self._tx() as con:
+            await self._copy_insert(
+                con, "bans", ("user_id", "chat_id"), rows, f"ON CONFLICT {USER_CHAT_CONFLICT} DO NOTHING"
+            )
+            if enforce:
+                await con.executemany(
+                    "INSERT INTO outbox(method, payload, chat_id, user_id) VALUES ('ban_chat_member', $1::jsonb, $2, $3)",
+                    [
+                        (json.dumps({"chat_id": chat_id, "user_id": user_id}), chat_id, user_id)
+                        for user_id, chat_id in enforce
+                    ],
+                )
+            if rows:
+                user_ids, chat_ids = map(list, zip(*rows))
+                await con.execute(
+                    "INSERT INTO changes(origin, kind, op, user_id, chat_id) "
+                    "SELECT $1, 'ban', 'add', u, c FROM unnest($2::bigint[], $3::bigint[]) AS v(u, c)",
+                    self.origin, user_ids, chat_ids,
+                )
+
+    async def remove_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        async with self._tx() as con:
+            await con.execute(
+                "DELETE FROM bans WHERE user_id=$1 AND chat_id IS NOT DISTINCT FROM $2",
+                user_id, chat_id,
+            )
+            if enforce and chat_id is not None:
+                await self._enqueue(
+                    con, "unban_chat_member",
+                    {"chat_id": chat_id, "user_id": user_id, "only_if_banned": True},
+                )
+            await self._changed(con, "ban", "remove", user_id=user_id, chat_id=chat_id)
+
+    async def list_bans(self, chat_id: Optional[int] = None) -> List[Tuple[int, Optional[int]]]:
+        return await self._fetch(
+            "SELECT user_id, chat_id FROM bans WHERE chat_id IS NOT DISTINCT FROM $1 ORDER BY user_id ASC",
+            chat_id,
+        )
+
+    async def all_bans(self) -> List[Tuple[int, Optional[int]]]:
+        return await self._fetch("SELECT user_id, chat_id FROM bans")
+
+    async def is_banned(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        row = await self._fetchrow(
+            "SELECT 1 FROM bans WHERE user_id=$1 AND (chat_id IS NOT DISTINCT FROM $2 OR chat_id IS NULL)",
+            user_id, chat_id,
+        )
+        return row is not None
+
+    # ---------- Folders ----------
+    async def create_folder(self, chat_id: int, name: str):
+        async with self._tx() as con:
+            await con.execute(
+                "INSERT INTO folders(chat_id, name) VALUES ($1,$2) ON CONFLICT DO NOTHING",
+                chat_id, name.strip(),
+            )
+            await self._changed(con, "folder", "create", chat_id=chat_id)
+
+    async def list_folders(self, chat_id: int) -> List[Tuple[int, str]]:
+        return await self._fetch("SELECT id, name FROM folders WHERE chat_id=$1 ORDER BY name ASC", chat_id)
+
+    async def _folder_member_op(self, chat_id: int, folder_name: str, user_id: int, query: str) -> bool:
+        async with self._tx() as con:
+            folder_id = await con.fetchval(
+                "SELECT id FROM folders WHERE chat_id=$1 AND name=$2", chat_id, folder_name
+            )
+            if folder_id is None:
+                return False
+            await con.execute(query, folder_id, user_id)
+            await self._changed(con, "folder", "members", chat_id=chat_id, ref=folder_id)
+            return True
+
+    async def folder_add_user(self, chat_id: int, folder_name: str, user_id: int):
+        return await self._folder_member_op(
+            chat_id, folder_name, user_id,
+            "INSERT INTO folder_members(folder_id, user_id) VALUES ($1,$2) ON CONFLICT DO NOTHING",
+        )
+
+    async def folder_remove_user(self, chat_id: int, folder_name: str, user_id: int):
+        return await self._folder_member_op(
+            chat_id, folder_name, user_id,
+            "DELETE FROM folder_members WHERE folder_id=$1 AND user_id=$2",
+        )
+
+    async def list_folder_members(self, chat_id: int, folder_name: str) -> List[int]:
+        return await self._column(
+            "SELECT fm.user_id FROM folder_members fm "
+            "JOIN folders f ON f.id=fm.folder_id "
+            "WHERE f.chat_id=$1 AND f.name=$2 "
+            "ORDER BY fm.user_id ASC",
+            chat_id, folder_name,
+        )
+
+    async def get_folder(self, folder_id: int) -> Optional[Tuple[int, int, str]]:
+        return await self._fetchrow("SELECT id, chat_id, name FROM folders WHERE id=$1", folder_id)
+
+    async def delete_folder(self, folder_id: int):
+        async with self._tx() as con:
+            await con.execute("DELETE FROM folders WHERE id=$1", folder_id)
+            await self._changed(con, "folder", "delete", ref=folder_id)
+
+    async def folder_add_users(self, folder_id: int, user_ids: List[int]) -> int:
+        async with self._tx() as con:
+            added = await self._copy_insert(
+                con, "folder_members", ("folder_id", "user_id"),
+                [(folder_id, uid) for uid in user_ids],
+            )
+            await self._changed(con, "folder", "members", ref=folder_id)
+            return added
+
+    async def folder_remove_users(self, folder_id: int, user_ids: List[int]) -> int:
+        async with self._tx() as con:
+            status = await con.execute(
+                "DELETE FROM folder_members WHERE folder_id=$1 AND user_id = ANY($2::bigint[])",
+                folder_id, list(user_ids),
+            )
+            await self._changed(con, "folder", "members", ref=folder_id)
+            return _status_count(status)
+
+    async def list_folder_members_by_id(self, folder_id: int) -> List[int]:
+        return await self._column(
+            "SELECT user_id FROM folder_members WHERE folder_id=$1 ORDER BY user_id ASC", folder_id
+        )
+
+    async def set_folder_safe_chats(self, folder_id: int, chat_ids: List[int]):
+        async with self._tx() as con:
+            await con.execute("DELETE FROM folder_safe_chats WHERE folder_id=$1", folder_id)
+            await con.execute(
+                "INSERT INTO folder_safe_chats(folder_id, chat_id) "
+                "SELECT $1::bigint, unnest($2::bigint[]) ON CONFLICT DO NOTHING",
+                folder_id, list(chat_ids),
+            )
+            await self._changed(con, "folder", "safe_chats", ref=folder_id)
+
+    async def list_folder_safe_chats(self, folder_id: int) -> List[int]:
+        return await self._column(
+            "SELECT chat_id FROM folder_safe_chats WHERE folder_id=$1 ORDER BY chat_id ASC", folder_id
+        )
+
+    async def folder_safe_state(
+        self, folder_id: Optional[int] = None
+    ) -> Dict[int, Tuple[List[int], List[int]]]:
+        async with self._conn() as con:
+            if folder_id is None:
+                chats = await con.fetch("SELECT folder_id, chat_id FROM folder_safe_chats")
+                members = await con.fetch(
+                    "SELECT folder_id, user_id FROM folder_members "
+                    "WHERE folder_id IN (SELECT folder_id FROM folder_safe_chats)"
+                )
+            else:
+                chats = await con.fetch(
+                    "SELECT folder_id, chat_id FROM folder_safe_chats WHERE folder_id=$1", folder_id
+                )
+                members = await con.fetch(
+                    "SELECT folder_id, user_id FROM folder_members WHERE folder_id=$1", folder_id
+                )
+
+        out: Dict[int, Tuple[List[int], List[int]]] = {}
+        for fid, cid in chats:
+            out.setdefault(fid, ([], []))[1].append(cid)
+        for fid, uid in members:
+            if fid in out:
+                out[fid][0].append(uid)
+        return out
+
+    async def folder_members_map(self, chat_id: int) -> Dict[str, List[int]]:
+        rows = await self._fetch(
+            "SELECT f.name, fm.user_id FROM folders f "
+            "JOIN folder_members fm ON fm.folder_id=f.id "
+            "WHERE f.chat_id=$1",
+            chat_id,
+        )
+        out: Dict[str, List[int]] = {}
+        for name, user_id in rows:
+            out.setdefault(name, []).append(user_id)
+        return out
+
+    # ---------- Guard policy ----------
+    async def get_policy(self, chat_id: int) -> Optional[Tuple[str, str]]:
+        return await self._fetchrow(
+            "SELECT rules, default_action FROM guard_policies WHERE chat_id=$1", chat_id
+        )
+
+    async def set_policy(self, chat_id: int, rules: str, default_action: str = "ban"):
+        async with self._tx() as con:
+            await con.execute(
+                "INSERT INTO guard_policies(chat_id, rules, default_action) VALUES ($1,$2,$3) "
+                "ON CONFLICT(chat_id) DO UPDATE SET rules=excluded.rules, "
+                "default_action=excluded.default_action, updated_at=now()",
+                chat_id, rules, default_action,
+            )
+            await self._changed(con, "policy", "set", chat_id=chat_id)
+
+    async def delete_policy(self, chat_id: int):
+        async with self._tx() as con:
+            await con.execute("DELETE FROM guard_policies WHERE chat_id=$1", chat_id)
+            await self._changed(con, "policy", "delete", chat_id=chat_id)
+
+    # ---------- Links ----------
+    async def add_link(self, chat_id: int, name: str, url: str) -> bool:
+        async with self._tx() as con:
+            link_id = await con.fetchval(
+                "INSERT INTO links(chat_id,name,url) VALUES ($1,$2,$3) "
+                "ON CONFLICT(chat_id, url) DO NOTHING RETURNING id",
+                chat_id, name.strip(), url.strip(),
+            )
+            await self._changed(con, "link", "add", chat_id=chat_id)
+            return link_id is not None
+
+    async def add_invite_links(self, rows: List[Tuple[int, str, str, Optional[int]]]):
+        async with self._tx() as con:
+            await self._copy_insert(
+                con, "links", ("chat_id", "name", "url", "expires_at", "is_invite"),
+                [(chat_id, name, url, expires_at, 1) for chat_id, name, url, expires_at in rows],
+                "ON CONFLICT(chat_id, url) DO NOTHING",
+            )
+            await self._changed(con, "link", "add")
+
+    async def list_links(self, chat_id: int) -> List[Tuple[int, str, str, str]]:
+        return await self._fetch(
+            "SELECT id, name, url, to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') "
+            "FROM links WHERE chat_id=$1 ORDER BY id DESC",
+            chat_id,
+        )
+
+    async def get_link(self, link_id: int) -> Optional[Tuple[int, int, str, str, int]]:
+        return await self._fetchrow(
+            "SELECT id, chat_id, name, url, is_invite FROM links WHERE id=$1", link_id
+        )
+
+    async def delete_link(self, link_id: int):
+        async with self._tx() as con:
+            await con.execute("DELETE FROM links WHERE id=$1", link_id)
+            await self._changed(con, "link", "delete", ref=link_id)
+
+    async def delete_links(self, link_ids: List[int]):
+        async with self._tx() as con:
+            await con.execute("DELETE FROM links WHERE id = ANY($1::bigint[])", list(link_ids))
+            await self._changed(con, "link", "delete")
+
+    async def list_expired_invite_links(self, now: int) -> List[Tuple[int, int, str]]:
+        return await self._fetch(
+            "SELECT id, chat_id, url FROM links "
+            "WHERE is_invite=1 AND expires_at IS NOT NULL AND expires_at<=$1",
+            now,
+        )
+
+    async def chats_with_valid_invite(self, valid_until: int) -> List[int]:
+        return await self._column(
+            "SELECT DISTINCT chat_id FROM links "
+            "WHERE is_invite=1 AND (expires_at IS NULL OR expires_at>$1)",
+            valid_until,
+        )
+
+    # ---------- Broadcasts ----------
+    async def create_broadcast(self, from_chat_id: int, message_id: int, chat_ids: List[int]) -> int:
+        async with self._tx() as con:
+            broadcast_id = await con.fetchval(
+                "INSERT INTO broadcasts(from_chat_id, message_id) VALUES ($1,$2) RETURNING id",
+                from_chat_id, message_id,
+            )
+            await self._copy_insert(
+                con, "broadcast_deliveries", ("broadcast_id", "chat_id"),
+                [(broadcast_id, cid) for cid in dict.fromkeys(chat_ids)],
+            )
+            return broadcast_id
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Tuple[int, int, int, str, Optional[int], Optional[int]]]:
+        return await self._fetchrow(
+            "SELECT id, from_chat_id, message_id, status, progress_chat_id, progress_message_id "
+            "FROM broadcasts WHERE id=$1",
+            broadcast_id,
+        )
+
+    async def list_running_broadcasts(self) -> List[int]:
+        return await self._column("SELECT id FROM broadcasts WHERE status='running' ORDER BY id ASC")
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        await self._execute("UPDATE broadcasts SET status=$1 WHERE id=$2", status, broadcast_id)
+
+    async def set_broadcast_progress_message(self, broadcast_id: int, chat_id: int, message_id: int):
+        await self._execute(
+            "UPDATE broadcasts SET progress_chat_id=$1, progress_message_id=$2 WHERE id=$3",
+            chat_id, message_id, broadcast_id,
+        )
+
+    async def pending_deliveries(self, broadcast_id: int) -> List[int]:
+        return await self._column(
+            "SELECT chat_id FROM broadcast_deliveries WHERE broadcast_id=$1 AND status='pending'",
+            broadcast_id,
+        )
+
+    async def record_deliveries(self, broadcast_id: int, results: List[Tuple[int, str, Optional[str]]]):
+        if not results:
+            return
+        chat_ids, statuses, errors = map(list, zip(*results))
+        await self._execute(
+            "UPDATE broadcast_deliveries AS d SET status=v.status, error=v.error "
+            "FROM unnest($2::bigint[], $3::text[], $4::text[]) AS v(chat_id, status, error) "
+            "WHERE d.broadcast_id=$1 AND d.chat_id=v.chat_id",
+            broadcast_id, chat_ids, statuses, errors,
+        )
+
+    async def broadcast_counts(self, broadcast_id: int) -> Dict[str, int]:
+        rows = await self._fetch(
+            "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE broadcast_id=$1 GROUP BY status",
+            broadcast_id,
+        )
+        return {status: n for status, n in rows}
+
+    # ---------- Outbox ----------
+    async def enqueue_action(self, method: str, payload: dict):
+        async with self._tx() as con:
+            await self._enqueue(con, method, payload)
+
+    async def due_outbox(self, now: int, limit: int) -> List[Tuple[int, str, dict, int]]:
+        rows = await self._fetch(
+            """
+            SELECT id, method, payload::text, attempts FROM outbox AS o
+            WHERE status='pending' AND next_at<=$1
+              AND NOT EXISTS (
+                SELECT 1 FROM outbox AS p
+                WHERE p.status='pending' AND p.id < o.id
+                  AND p.chat_id = o.chat_id AND p.user_id = o.user_id
+              )
+            ORDER BY id LIMIT $2
+            """,
+            now, limit,
+        )
+        return [(i, m, json.loads(p), a) for i, m, p, a in rows]
+
+    async def finish_outbox(
+        self,
+        done: List[int],
+        retry: List[Tuple[int, int, str]],
+        failed: List[Tuple[int, str]],
+    ):
+        async with self._tx() as con:
+            if done:
+                await con.execute(
+                    "UPDATE outbox SET status='done', attempts=attempts+1, last_error=NULL "
+                    "WHERE id = ANY($1::bigint[])",
+                    list(done),
+                )
+            if retry:
+                ids, next_ats, errs = map(list, zip(*retry))
+                await con.execute(
+                    "UPDATE outbox AS o SET attempts=o.attempts+1, next_at=v.next_at, last_error=v.err "
+                    "FROM unnest($1::bigint[], $2::bigint[], $3::text[]) AS v(id, next_at, err) "
+                    "WHERE o.id=v.id",
+                    ids, next_ats, errs,
+                )
+            if failed:
+                ids, errs = map(list, zip(*failed))
+                await con.execute(
+                    "UPDATE outbox AS o SET status='failed', attempts=o.attempts+1, last_error=v.err "
+                    "FROM unnest($1::bigint[], $2::text[]) AS v(id, err) WHERE o.id=v.id",
+                    ids, errs,
+                )
+
+    async def outbox_counts(self) -> Dict[str, int]:
+        rows = await self._fetch("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+        return {status: n for status, n in rows}
+
+    async def purge_outbox(self, keep_days: int = 7) -> int:
+        status = await self._execute(
+            "DELETE FROM outbox WHERE status IN ('done','failed') "
+            "AND created_at < now() - make_interval(days => $1)",
+            int(keep_days),
+        )
+        return _status_count(status)
+
+    # ---------- Spam blocklist ----------
+    async def add_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        async with self._tx() as con:
+            added = await self._copy_insert(
+                con, "blocklist", ("chat_id", "kind", "pattern"),
+                [(chat_id, kind, pattern) for kind, pattern in rows],
+            )
+            await self._changed(con, "block", "add", chat_id=chat_id)
+            return added
+
+    async def remove_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        if not rows:
+            return 0
+        kinds, patterns = map(list, zip(*rows))
+        async with self._tx() as con:
+            status = await con.execute(
+                "DELETE FROM blocklist AS b USING unnest($2::text[], $3::text[]) AS v(kind, pattern) "
+                "WHERE b.chat_id=$1 AND b.kind=v.kind AND b.pattern=v.pattern",
+                chat_id, kinds, patterns,
+            )
+            await self._changed(con, "block", "remove", chat_id=chat_id)
+            return _status_count(status)
+
+    async def list_block_patterns(self, chat_id: int) -> List[Tuple[str, str]]:
+        return await self._fetch(
+            "SELECT kind, pattern FROM blocklist WHERE chat_id=$1 ORDER BY kind, pattern", chat_id
+        )
+
+    async def all_block_patterns(self) -> List[Tuple[int, str, str]]:
+        return await self._fetch("SELECT chat_id, kind, pattern FROM blocklist")
+
+    # ---------- Join requests ----------
+    async def add_join_requests(self, rows: List[Tuple[int, int, str]]):
+        if not rows:
+            return
+        # one INSERT .. SELECT may not hit the same key twice: keep the latest per key
+        latest = {(chat_id, user_id): user for chat_id, user_id, user in rows}
+        chat_ids, user_ids = map(list, zip(*latest))
+        await self._execute(
+            'INSERT INTO join_requests(chat_id, user_id, "user") '
+            "SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[]) "
+            'ON CONFLICT(chat_id, user_id) DO UPDATE SET "user"=excluded."user"',
+            chat_ids, user_ids, list(latest.values()),
+        )
+
+    async def pending_join_requests(self, limit: int = 1000) -> List[Tuple[int, int, str]]:
+        return await self._fetch(
+            'SELECT chat_id, user_id, "user" FROM join_requests ORDER BY created_at LIMIT $1', limit
+        )
+
+    async def finish_join_requests(self, keys: List[Tuple[int, int]]):
+        if not keys:
+            return
+        chat_ids, user_ids = map(list, zip(*keys))
+        await self._execute(
+            "DELETE FROM join_requests AS j USING unnest($1::bigint[], $2::bigint[]) AS k(chat_id, user_id) "
+            "WHERE j.chat_id=k.chat_id AND j.user_id=k.user_id",
+            chat_ids, user_ids,
+        )
+
+    # ---------- Stats ----------
+    async def add_stats(self, rows: List[Tuple[int, int, str, int]]):
+        # one INSERT .. SELECT may not hit the same key twice: pre-sum the all-time rows
+        totals: Dict[Tuple[int, str], int] = {}
+        for chat_id, _bucket, event, n in rows:
+            totals[(chat_id, event)] = totals.get((chat_id, event), 0) + n
+        upsert = (
+            "ON CONFLICT(chat_id, grain, bucket, event) "
+            "DO UPDATE SET count = stats_rollup.count + excluded.count"
+        )
+        columns = ("chat_id", "grain", "bucket", "event", "count")
+        async with self._tx() as con:
+            await self._copy_insert(
+                con, "stats_rollup", columns, [(c, "m", b, e, n) for c, b, e, n in rows], upsert
+            )
+            await self._copy_insert(
+                con, "stats_rollup", columns, [(c, "a", 0, e, n) for (c, e), n in totals.items()], upsert
+            )
+
+    async def compact_stats(self, minutes_before: int, hours_before: int) -> int:
+        changed = 0
+        async with self._tx() as con:
+            for src, dst, size, cutoff in (("m", "h", 3600, minutes_before), ("h", "d", 86400, hours_before)):
+                changed += _status_count(await con.execute(
+                    """
+                    INSERT INTO stats_rollup(chat_id, grain, bucket, event, count)
+                    SELECT chat_id, $1::text, bucket - bucket % $2::bigint, event, SUM(count)
+                    FROM stats_rollup WHERE grain=$3 AND bucket<$4
+                    GROUP BY chat_id, bucket - bucket % $2::bigint, event
+                    ON CONFLICT(chat_id, grain, bucket, event)
+                    DO UPDATE SET count = stats_rollup.count + excluded.count
+                    """,
+                    dst, size, src, cutoff,
+                ))
+                changed += _status_count(await con.execute(
+                    "DELETE FROM stats_rollup WHERE grain=$1 AND bucket<$2", src, cutoff
+                ))
+        return changed
+
+    async def stats_since(self, chat_id: Optional[int], since: int) -> Dict[str, int]:
+        if chat_id is None:
+            rows = await self._fetch(
+                "SELECT event, SUM(count)::bigint FROM stats_rollup "
+                "WHERE grain IN ('m','h','d') AND bucket>=$1 GROUP BY event",
+                since,
+            )
+        else:
+            rows = await self._fetch(
+                "SELECT event, SUM(count)::bigint FROM stats_rollup "
+                "WHERE chat_id=$1 AND grain IN ('m','h','d') AND bucket>=$2 GROUP BY event",
+                chat_id, since,
+            )
+        return {event: n for event, n in rows}
+
+    async def stats_total(self, chat_id: Optional[int]) -> Dict[str, int]:
+        if chat_id is None:
+            rows = await self._fetch(
+                "SELECT event, SUM(count)::bigint FROM stats_rollup WHERE grain='a' GROUP BY event"
+            )
+        else:
+            rows = await self._fetch(
+                "SELECT event, count FROM stats_rollup WHERE chat_id=$1 AND grain='a' AND bucket=0",
+                chat_id,
+            )
+        return {event: n for event, n in rows}
+
+    # ---------- Change feed ----------
+    async def change_bounds(self) -> Tuple[int, int]:
+        async with self._conn() as con:
+            last, called = await con.fetchrow("SELECT last_value, is_called FROM changes_seq_seq")
+            hi = last if called else 0
+            lo = await con.fetchval("SELECT MIN(seq) FROM changes")
+        return (lo if lo is not None else hi + 1), hi
+
+    async def changes_since(
+        self, seq: int, limit: int = 500
+    ) -> List[Tuple[int, str, str, str, Optional[int], Optional[int], Optional[int]]]:
+        return await self._fetch(
+            "SELECT seq, origin, kind, op, user_id, chat_id, ref FROM changes "
+            "WHERE seq>$1 ORDER BY seq LIMIT $2",
+            seq, limit,
+        )
+
+    async def prune_changes(self, before: int) -> int:
+        return _status_count(await self._execute("DELETE FROM changes WHERE created_at<$1", before))
+
+    # ---------- Clone (copy settings from src_chat to dst_chat) ----------
+    async def clone_group_data(self, src_chat_id: int, dst_chat_id: int):
+        async with self._tx() as con:
+            for table in ("safe_users", "bans"):
+                await con.execute(
+                    f"INSERT INTO {table}(user_id, chat_id) "
+                    f"SELECT user_id, $2::bigint FROM {table} WHERE chat_id=$1 "
+                    f"ON CONFLICT {USER_CHAT_CONFLICT} DO NOTHING",
+                    src_chat_id, dst_chat_id,
+                )
+
+            # folders + members, matched by name
+            await con.execute(
+                "INSERT INTO folders(chat_id, name) SELECT $2::bigint, name FROM folders WHERE chat_id=$1 "
+                "ON CONFLICT DO NOTHING",
+                src_chat_id, dst_chat_id,
+            )
+            await con.execute(
+                "INSERT INTO folder_members(folder_id, user_id) "
+                "SELECT d.id, fm.user_id FROM folders s "
+                "JOIN folder_members fm ON fm.folder_id=s.id "
+                "JOIN folders d ON d.chat_id=$2 AND d.name=s.name "
+                "WHERE s.chat_id=$1 ON CONFLICT DO NOTHING",
+                src_chat_id, dst_chat_id,
+            )
+            # folder SAFE for its own chat => SAFE for the clone's chat too
+            await con.execute(
+                "INSERT INTO folder_safe_chats(folder_id, chat_id) "
+                "SELECT d.id, $2::bigint FROM folders s "
+                "JOIN folder_safe_chats fs ON fs.folder_id=s.id AND fs.chat_id=$1 "
+                "JOIN folders d ON d.chat_id=$2 AND d.name=s.name "
+                "WHERE s.chat_id=$1 ON CONFLICT DO NOTHING",
+                src_chat_id, dst_chat_id,
+            )
+
+            await con.execute(
+                "INSERT INTO links(chat_id, name, url) "
+                "SELECT $2::bigint, name, url FROM links WHERE chat_id=$1 AND is_invite=0 "
+                "ON CONFLICT(chat_id, url) DO NOTHING",
+                src_chat_id, dst_chat_id,
+            )
+
+            await con.execute(
+                "INSERT INTO blocklist(chat_id, kind, pattern) "
+                "SELECT $2::bigint, kind, pattern FROM blocklist WHERE chat_id=$1 "
+                "ON CONFLICT DO NOTHING",
+                src_chat_id, dst_chat_id,
+            )
+
+            await con.execute(
+                "INSERT INTO guard_policies(chat_id, rules, default_action) "
+                "SELECT $2::bigint, rules, default_action FROM guard_policies WHERE chat_id=$1 "
+                "ON CONFLICT(chat_id) DO UPDATE SET rules=excluded.rules, "
+                "default_action=excluded.default_action, updated_at=now()",
+                src_chat_id, dst_chat_id,
+            )
+            await self._changed(con, "chat", "reload", chat_id=dst_chat_id, ref=src_chat_id)
@@ -0,0 +1,1183 @@
+# app/storage/sqlite.py
+"""SQLite backend (default): one short-lived aiosqlite connection per call, WAL mode."""
+import json
+import uuid
+import aiosqlite
+from typing import Optional, List, Tuple, Dict
+from pathlib import Path
+
+from app.storage.base import SCHEMA_VERSION
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str = "eclis_guard.sqlite3"):
+        self.path = path
+        # tags rows in `changes`, so an instance can skip its own edits
+        self.origin = uuid.uuid4().hex[:12]
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+    async def close(self):
+        # connections are per call; nothing to release
+        pass
+
+    def connect(self) -> aiosqlite.Connection:
+        # مهم: await نکن. این یک async context manager برمی‌گرداند که داخل async with await می‌شود.
+        return aiosqlite.connect(self.path)
+
+    async def _prepare(self, db: aiosqlite.Connection):
+        # تنظیمات پیشنهادی برای sqlite در اپ async
+        await db.execute("PRAGMA foreign_keys = ON;")
+        await db.execute("PRAGMA journal_mode = WAL;")
+        await db.execute("PRAGMA synchronous = NORMAL;")
+
+    async def _ensure_column(self, db: aiosqlite.Connection, table: str, column: str, decl: str):
+        cur = await db.execute(f"PRAGMA table_info({table})")
+        if column not in {r[1] for r in await cur.fetchall()}:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    async def _changed(
+        self,
+        db: aiosqlite.Connection,
+        kind: str,
+        op: str,
+        user_id: Optional[int] = None,
+        chat_id: Optional[int] = None,
+        ref: Optional[int] = None,
+    ):
+        # change feed row; caller commits, so it lands in the same transaction
+        await db.execute(
+            "INSERT INTO changes(origin, kind, op, user_id, chat_id, ref) VALUES (?,?,?,?,?,?)",
+            (self.origin, kind, op, user_id, chat_id, ref),
+        )
+
+    async def init(self) -> bool:
+        """
+        Create/migrate tables. Returns False (and does nothing) if the schema is current.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+
+            cur = await db.execute("PRAGMA user_version")
+            if (await cur.fetchone())[0] >= SCHEMA_VERSION:
+                return False
+
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS admins(
+                    user_id INTEGER PRIMARY KEY
+                )
+            """)
+
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS groups(
+                    chat_id INTEGER PRIMARY KEY,
+                    title TEXT,
+                    chat_type TEXT DEFAULT 'group'
+                )
+            """)
+
+            # safe list: chat_id NULL => GLOBAL safe
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS safe_users(
+                    user_id INTEGER NOT NULL,
+                    chat_id INTEGER NULL,
+                    PRIMARY KEY (user_id, chat_id)
+                )
+            """)
+
+            # bans: chat_id NULL => GLOBAL ban
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS bans(
+                    user_id INTEGER NOT NULL,
+                    chat_id INTEGER NULL,
+                    PRIMARY KEY (user_id, chat_id)
+                )
+            """)
+
+            # a NULL chat_id never conflicts in a PRIMARY KEY: GLOBAL rows need their own
+            # unique index (Postgres does the same with COALESCE(chat_id, 0))
+            for table in ("safe_users", "bans"):
+                await db.execute(
+                    f"DELETE FROM {table} WHERE chat_id IS NULL AND rowid NOT IN "
+                    f"(SELECT MIN(rowid) FROM {table} WHERE chat_id IS NULL GROUP BY user_id)"
+                )
+                await db.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_global ON {table}(user_id) WHERE chat_id IS NULL"
+                )
+
+            # folders per chat
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS folders(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    UNIQUE(chat_id, name)
+                )
+            """)
+
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS folder_members(
+                    folder_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    PRIMARY KEY(folder_id, user_id),
+                    FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE CASCADE
+                )
+            """)
+
+            # folder marked SAFE for one or more chats (usually its own chat)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS folder_safe_chats(
+                    folder_id INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    PRIMARY KEY(folder_id, chat_id),
+                    FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE CASCADE
+                )
+            """)
+
+            # stored links per chat (optional)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS links(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # bot-generated invite links carry an expiry (unix ts) so they can be rotated
+            await self._ensure_column(db, "links", "expires_at", "INTEGER NULL")
+            await self._ensure_column(db, "links", "is_invite", "INTEGER NOT NULL DEFAULT 0")
+
+            # old clones duplicated every link; drop the dupes before enforcing uniqueness
+            await db.execute(
+                "DELETE FROM links WHERE id NOT IN "
+                "(SELECT MIN(id) FROM links GROUP BY chat_id, url)"
+            )
+            await db.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS links_chat_url ON links(chat_id, url)"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS links_invite_expiry ON links(is_invite, expires_at)"
+            )
+
+            # guard policy per chat: rules = JSON list (see app/policy.py)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS guard_policies(
+                    chat_id INTEGER PRIMARY KEY,
+                    rules TEXT NOT NULL DEFAULT '[]',
+                    default_action TEXT NOT NULL DEFAULT 'ban',
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # join-request gate (app/join_gate.py): per-chat switch + requests not answered yet
+            await self._ensure_column(db, "groups", "join_gate", "INTEGER NOT NULL DEFAULT 0")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS join_requests(
+                    chat_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    user TEXT NOT NULL,
+                    created_at INTEGER NOT NULL DEFAULT (strftime('%s','now')),
+                    PRIMARY KEY(chat_id, user_id)
+                )
+            """)
+
+            # message spam filter (app/spam_filter.py): kind = word/url/invite
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS blocklist(
+                    chat_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    pattern TEXT NOT NULL,
+                    PRIMARY KEY(chat_id, kind, pattern)
+                )
+            """)
+
+            # broadcasts: one row per job + one per target chat (resumable)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcasts(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    from_chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    progress_chat_id INTEGER NULL,
+                    progress_message_id INTEGER NULL,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries(
+                    broadcast_id INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT NULL,
+                    PRIMARY KEY(broadcast_id, chat_id),
+                    FOREIGN KEY(broadcast_id) REFERENCES broadcasts(id) ON DELETE CASCADE
+                )
+            """)
+
+            # transactional outbox: Telegram calls that must eventually match DB state
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    method TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_at INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT NULL,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_at)"
+            )
+            # the (chat, user) an entry acts on, as columns: due_outbox's ordering check is an index probe
+            await self._ensure_column(db, "outbox", "chat_id", "INTEGER NULL")
+            await self._ensure_column(db, "outbox", "user_id", "INTEGER NULL")
+            await db.execute(
+                "UPDATE outbox SET chat_id=json_extract(payload, '$.chat_id'), "
+                "user_id=json_extract(payload, '$.user_id') "
+                "WHERE status='pending' AND chat_id IS NULL AND user_id IS NULL"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_member ON outbox(status, chat_id, user_id, id)"
+            )
+
+            # guard counters: grain m/h/d = minute/hour/day bucket (epoch start), a = all time (bucket 0)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS stats_rollup(
+                    chat_id INTEGER NOT NULL,
+                    grain TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY(chat_id, grain, bucket, event)
+                )
+            """)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS stats_rollup_grain ON stats_rollup(grain, bucket)"
+            )
+
+            # change feed for other instances sharing this DB (see app/changefeed.py)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS changes(
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    user_id INTEGER NULL,
+                    chat_id INTEGER NULL,
+                    ref INTEGER NULL,
+                    created_at INTEGER NOT NULL DEFAULT (strftime('%s','now'))
+                )
+            """)
+
+            await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            await db.commit()
+            return True
+
+    # ---------- Admins ----------
+    async def add_admin(self, user_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute("INSERT OR IGNORE INTO admins(user_id) VALUES (?)", (user_id,))
+            await self._changed(db, "admin", "add", user_id=user_id)
+            await db.commit()
+
+    async def is_admin(self, user_id: int) -> bool:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT 1 FROM admins WHERE user_id=?", (user_id,))
+            row = await cur.fetchone()
+            return row is not None
+
+    async def list_admins(self) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT user_id FROM admins ORDER BY user_id ASC")
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    # ---------- Groups ----------
+    async def upsert_group(self, chat_id: int, title: Optional[str], chat_type: str = "group"):
+        async with self.connect() as db:
+            await self._prepare(db)
+            # called on every join: an unchanged group writes nothing
+            cur = await db.execute(
+                "INSERT INTO groups(chat_id,title,chat_type) VALUES (?,?,?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET title=excluded.title, chat_type=excluded.chat_type "
+                "WHERE title IS NOT excluded.title OR chat_type IS NOT excluded.chat_type",
+                (chat_id, title, chat_type),
+            )
+            if cur.rowcount > 0:
+                await self._changed(db, "group", "upsert", chat_id=chat_id)
+                await db.commit()
+
+    async def list_groups(self) -> List[Tuple[int, Optional[str], str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT chat_id, title, chat_type FROM groups ORDER BY title ASC")
+            return await cur.fetchall()
+
+    async def set_join_gate(self, chat_id: int, enabled: bool):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "UPDATE groups SET join_gate=? WHERE chat_id=?",
+                (1 if enabled else 0, chat_id),
+            )
+            await self._changed(db, "gate", "on" if enabled else "off", chat_id=chat_id)
+            await db.commit()
+
+    async def join_gate_chats(self) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT chat_id FROM groups WHERE join_gate=1")
+            return [r[0] for r in await cur.fetchall()]
+
+    # ---------- SAFE ----------
+    async def add_safe(self, user_id: int, chat_id: Optional[int] = None):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "INSERT OR IGNORE INTO safe_users(user_id, chat_id) VALUES (?, ?)",
+                (user_id, chat_id),
+            )
+            await self._changed(db, "safe", "add", user_id=user_id, chat_id=chat_id)
+            await db.commit()
+
+    async def remove_safe(self, user_id: int, chat_id: Optional[int] = None):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "DELETE FROM safe_users WHERE user_id=? AND chat_id IS ?",
+                (user_id, chat_id),
+            )
+            await self._changed(db, "safe", "remove", user_id=user_id, chat_id=chat_id)
+            await db.commit()
+
+    async def list_safe(self, chat_id: Optional[int] = None) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT user_id FROM safe_users WHERE chat_id IS ? ORDER BY user_id ASC",
+                (chat_id,),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def all_safe(self) -> List[Tuple[int, Optional[int]]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT user_id, chat_id FROM safe_users")
+            return await cur.fetchall()
+
+    async def is_safe(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT 1 FROM safe_users WHERE user_id=? AND (chat_id IS ? OR chat_id IS NULL)",
+                (user_id, chat_id),
+            )
+            row = await cur.fetchone()
+            return row is not None
+
+    # ---------- BANS ----------
+    async def add_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        """
+        enforce=True (chat-specific bans only): also queue ban_chat_member in the
+        outbox, in the same transaction as the ban row.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "INSERT OR IGNORE INTO bans(user_id, chat_id) VALUES (?, ?)",
+                (user_id, chat_id),
+            )
+            if enforce and chat_id is not None:
+                await self._enqueue(db, "ban_chat_member", {"chat_id": chat_id, "user_id": user_id})
+            await self._changed(db, "ban", "add", user_id=user_id, chat_id=chat_id)
+            await db.commit()
+
+    async def add_bans(self, rows: List[Tuple[int, Optional[int]]], enforce: List[Tuple[int, int]] = ()):
+        """
+        Bulk add_ban in one transaction. rows: (user_id, chat_id or None for GLOBAL);
+        enforce: (user_id, chat_id) pairs that also get a queued ban_chat_member.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany("INSERT OR IGNORE INTO bans(user_id, chat_id) VALUES (?, ?)", rows)
+            await db.executemany(
+                "INSERT INTO outbox(method, payload, chat_id, user_id) VALUES ('ban_chat_member', ?, ?, ?)",
+                [
+                    (json.dumps({"chat_id": chat_id, "user_id": user_id}), chat_id, user_id)
+                    for user_id, chat_id in enforce
+                ],
+            )
+            await db.executemany(
+                "INSERT INTO changes(origin, kind, op, user_id, chat_id) VALUES (?, 'ban', 'add', ?, ?)",
+                [(self.origin, user_id, chat_id) for user_id, chat_id in rows],
+            )
+            await db.commit()
+
+    async def remove_ban(self, user_id: int, chat_id: Optional[int] = None, enforce: bool = False):
+        """enforce=True: also queue unban_chat_member in the outbox (same transaction)."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "DELETE FROM bans WHERE user_id=? AND chat_id IS ?",
+                (user_id, chat_id),
+            )
+            if enforce and chat_id is not None:
+                await self._enqueue(
+                    db, "unban_chat_member",
+                    {"chat_id": chat_id, "user_id": user_id, "only_if_banned": True},
+                )
+            await self._changed(db, "ban", "remove", user_id=user_id, chat_id=chat_id)
+            await db.commit()
+
+    async def list_bans(self, chat_id: Optional[int] = None) -> List[Tuple[int, Optional[int]]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT user_id, chat_id FROM bans WHERE chat_id IS ? ORDER BY user_id ASC",
+                (chat_id,),
+            )
+            return await cur.fetchall()
+
+    async def all_bans(self) -> List[Tuple[int, Optional[int]]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT user_id, chat_id FROM bans")
+            return await cur.fetchall()
+
+    async def is_banned(self, user_id: int, chat_id: Optional[int] = None) -> bool:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT 1 FROM bans WHERE user_id=? AND (chat_id IS ? OR chat_id IS NULL)",
+                (user_id, chat_id),
+            )
+            row = await cur.fetchone()
+            return row is not None
+
+    # ---------- Folders ----------
+    async def create_folder(self, chat_id: int, name: str):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "INSERT OR IGNORE INTO folders(chat_id, name) VALUES (?,?)",
+                (chat_id, name.strip()),
+            )
+            await self._changed(db, "folder", "create", chat_id=chat_id)
+            await db.commit()
+
+    async def list_folders(self, chat_id: int) -> List[Tuple[int, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, name FROM folders WHERE chat_id=? ORDER BY name ASC",
+                (chat_id,),
+            )
+            return await cur.fetchall()
+
+    async def folder_add_user(self, chat_id: int, folder_name: str, user_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id FROM folders WHERE chat_id=? AND name=?",
+                (chat_id, folder_name),
+            )
+            row = await cur.fetchone()
+            if not row:
+                return False
+            folder_id = row[0]
+            await db.execute(
+                "INSERT OR IGNORE INTO folder_members(folder_id, user_id) VALUES (?,?)",
+                (folder_id, user_id),
+            )
+            await self._changed(db, "folder", "members", chat_id=chat_id, ref=folder_id)
+            await db.commit()
+            return True
+
+    async def folder_remove_user(self, chat_id: int, folder_name: str, user_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id FROM folders WHERE chat_id=? AND name=?",
+                (chat_id, folder_name),
+            )
+            row = await cur.fetchone()
+            if not row:
+                return False
+            folder_id = row[0]
+            await db.execute(
+                "DELETE FROM folder_members WHERE folder_id=? AND user_id=?",
+                (folder_id, user_id),
+            )
+            await self._changed(db, "folder", "members", chat_id=chat_id, ref=folder_id)
+            await db.commit()
+            return True
+
+    async def list_folder_members(self, chat_id: int, folder_name: str) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT fm.user_id FROM folder_members fm "
+                "JOIN folders f ON f.id=fm.folder_id "
+                "WHERE f.chat_id=? AND f.name=? "
+                "ORDER BY fm.user_id ASC",
+                (chat_id, folder_name),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def get_folder(self, folder_id: int) -> Optional[Tuple[int, int, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, chat_id, name FROM folders WHERE id=?",
+                (folder_id,),
+            )
+            return await cur.fetchone()
+
+    async def delete_folder(self, folder_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            # members + safe chats go with it (ON DELETE CASCADE)
+            await db.execute("DELETE FROM folders WHERE id=?", (folder_id,))
+            await self._changed(db, "folder", "delete", ref=folder_id)
+            await db.commit()
+
+    async def folder_add_users(self, folder_id: int, user_ids: List[int]) -> int:
+        async with self.connect() as db:
+            await self._prepare(db)
+            before = db.total_changes
+            await db.executemany(
+                "INSERT OR IGNORE INTO folder_members(folder_id, user_id) VALUES (?,?)",
+                [(folder_id, uid) for uid in user_ids],
+            )
+            # counted before the change-feed row
+            n = db.total_changes - before
+            await self._changed(db, "folder", "members", ref=folder_id)
+            await db.commit()
+            return n
+
+    async def folder_remove_users(self, folder_id: int, user_ids: List[int]) -> int:
+        async with self.connect() as db:
+            await self._prepare(db)
+            before = db.total_changes
+            await db.executemany(
+                "DELETE FROM folder_members WHERE folder_id=? AND user_id=?",
+                [(folder_id, uid) for uid in user_ids],
+            )
+            # counted before the change-feed row
+            n = db.total_changes - before
+            await self._changed(db, "folder", "members", ref=folder_id)
+            await db.commit()
+            return n
+
+    async def list_folder_members_by_id(self, folder_id: int) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT user_id FROM folder_members WHERE folder_id=? ORDER BY user_id ASC",
+                (folder_id,),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def set_folder_safe_chats(self, folder_id: int, chat_ids: List[int]):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute("DELETE FROM folder_safe_chats WHERE folder_id=?", (folder_id,))
+            await db.executemany(
+                "INSERT OR IGNORE INTO folder_safe_chats(folder_id, chat_id) VALUES (?,?)",
+                [(folder_id, cid) for cid in chat_ids],
+            )
+            await self._changed(db, "folder", "safe_chats", ref=folder_id)
+            await db.commit()
+
+    async def list_folder_safe_chats(self, folder_id: int) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT chat_id FROM folder_safe_chats WHERE folder_id=? ORDER BY chat_id ASC",
+                (folder_id,),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def folder_safe_state(
+        self, folder_id: Optional[int] = None
+    ) -> Dict[int, Tuple[List[int], List[int]]]:
+        """
+        folder_id -> (member user_ids, safe chat_ids), only for folders marked SAFE somewhere.
+        folder_id=None => every such folder (used to build the in-memory reverse index).
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            where = "" if folder_id is None else " WHERE folder_id=?"
+            args = () if folder_id is None else (folder_id,)
+
+            out: Dict[int, Tuple[List[int], List[int]]] = {}
+            cur = await db.execute("SELECT folder_id, chat_id FROM folder_safe_chats" + where, args)
+            for fid, cid in await cur.fetchall():
+                out.setdefault(fid, ([], []))[1].append(cid)
+
+            cur = await db.execute(
+                "SELECT folder_id, user_id FROM folder_members"
+                + (where or " WHERE folder_id IN (SELECT folder_id FROM folder_safe_chats)"),
+                args,
+            )
+            for fid, uid in await cur.fetchall():
+                if fid in out:
+                    out[fid][0].append(uid)
+            return out
+
+    async def folder_members_map(self, chat_id: int) -> Dict[str, List[int]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT f.name, fm.user_id FROM folders f "
+                "JOIN folder_members fm ON fm.folder_id=f.id "
+                "WHERE f.chat_id=?",
+                (chat_id,),
+            )
+            out: Dict[str, List[int]] = {}
+            for name, user_id in await cur.fetchall():
+                out.setdefault(name, []).append(user_id)
+            return out
+
+    # ---------- Guard policy ----------
+    async def get_policy(self, chat_id: int) -> Optional[Tuple[str, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT rules, default_action FROM guard_policies WHERE chat_id=?",
+                (chat_id,),
+            )
+            return await cur.fetchone()
+
+    async def set_policy(self, chat_id: int, rules: str, default_action: str = "ban"):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "INSERT INTO guard_policies(chat_id, rules, default_action) VALUES (?,?,?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET rules=excluded.rules, "
+                "default_action=excluded.default_action, updated_at=CURRENT_TIMESTAMP",
+                (chat_id, rules, default_action),
+            )
+            await self._changed(db, "policy", "set", chat_id=chat_id)
+            await db.commit()
+
+    async def delete_policy(self, chat_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute("DELETE FROM guard_policies WHERE chat_id=?", (chat_id,))
+            await self._changed(db, "policy", "delete", chat_id=chat_id)
+            await db.commit()
+
+    # ---------- Links ----------
+    async def add_link(self, chat_id: int, name: str, url: str) -> bool:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "INSERT OR IGNORE INTO links(chat_id,name,url) VALUES (?,?,?)",
+                (chat_id, name.strip(), url.strip()),
+            )
+            await self._changed(db, "link", "add", chat_id=chat_id)
+            await db.commit()
+            return cur.rowcount > 0
+
+    async def add_invite_links(self, rows: List[Tuple[int, str, str, Optional[int]]]):
+        """rows: (chat_id, name, url, expires_at) — stored in one transaction."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany(
+                "INSERT OR IGNORE INTO links(chat_id,name,url,expires_at,is_invite) "
+                "VALUES (?,?,?,?,1)",
+                rows,
+            )
+            await self._changed(db, "link", "add")
+            await db.commit()
+
+    async def list_links(self, chat_id: int) -> List[Tuple[int, str, str, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, name, url, created_at FROM links WHERE chat_id=? ORDER BY id DESC",
+                (chat_id,),
+            )
+            return await cur.fetchall()
+
+    async def get_link(self, link_id: int) -> Optional[Tuple[int, int, str, str, int]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, chat_id, name, url, is_invite FROM links WHERE id=?",
+                (link_id,),
+            )
+            return await cur.fetchone()
+
+    async def delete_link(self, link_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute("DELETE FROM links WHERE id=?", (link_id,))
+            await self._changed(db, "link", "delete", ref=link_id)
+            await db.commit()
+
+    async def delete_links(self, link_ids: List[int]):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany("DELETE FROM links WHERE id=?", [(i,) for i in link_ids])
+            await self._changed(db, "link", "delete")
+            await db.commit()
+
+    async def list_expired_invite_links(self, now: int) -> List[Tuple[int, int, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, chat_id, url FROM links "
+                "WHERE is_invite=1 AND expires_at IS NOT NULL AND expires_at<=?",
+                (now,),
+            )
+            return await cur.fetchall()
+
+    async def chats_with_valid_invite(self, valid_until: int) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT DISTINCT chat_id FROM links "
+                "WHERE is_invite=1 AND (expires_at IS NULL OR expires_at>?)",
+                (valid_until,),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    # ---------- Broadcasts ----------
+    async def create_broadcast(self, from_chat_id: int, message_id: int, chat_ids: List[int]) -> int:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "INSERT INTO broadcasts(from_chat_id, message_id) VALUES (?,?)",
+                (from_chat_id, message_id),
+            )
+            broadcast_id = cur.lastrowid
+            await db.executemany(
+                "INSERT OR IGNORE INTO broadcast_deliveries(broadcast_id, chat_id) VALUES (?,?)",
+                [(broadcast_id, cid) for cid in chat_ids],
+            )
+            await db.commit()
+            return broadcast_id
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Tuple[int, int, int, str, Optional[int], Optional[int]]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT id, from_chat_id, message_id, status, progress_chat_id, progress_message_id "
+                "FROM broadcasts WHERE id=?",
+                (broadcast_id,),
+            )
+            return await cur.fetchone()
+
+    async def list_running_broadcasts(self) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT id FROM broadcasts WHERE status='running' ORDER BY id ASC")
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def set_broadcast_status(self, broadcast_id: int, status: str):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute("UPDATE broadcasts SET status=? WHERE id=?", (status, broadcast_id))
+            await db.commit()
+
+    async def set_broadcast_progress_message(self, broadcast_id: int, chat_id: int, message_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.execute(
+                "UPDATE broadcasts SET progress_chat_id=?, progress_message_id=? WHERE id=?",
+                (chat_id, message_id, broadcast_id),
+            )
+            await db.commit()
+
+    async def pending_deliveries(self, broadcast_id: int) -> List[int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT chat_id FROM broadcast_deliveries WHERE broadcast_id=? AND status='pending'",
+                (broadcast_id,),
+            )
+            rows = await cur.fetchall()
+            return [r[0] for r in rows]
+
+    async def record_deliveries(self, broadcast_id: int, results: List[Tuple[int, str, Optional[str]]]):
+        """results: (chat_id, status, error) — written in one transaction."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany(
+                "UPDATE broadcast_deliveries SET status=?, error=? WHERE broadcast_id=? AND chat_id=?",
+                [(status, error, broadcast_id, chat_id) for chat_id, status, error in results],
+            )
+            await db.commit()
+
+    async def broadcast_counts(self, broadcast_id: int) -> Dict[str, int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE broadcast_id=? GROUP BY status",
+                (broadcast_id,),
+            )
+            return {status: n for status, n in await cur.fetchall()}
+
+    # ---------- Outbox ----------
+    async def _enqueue(self, db: aiosqlite.Connection, method: str, payload: dict):
+        # caller commits: the entry lands in the same transaction as its DB change
+        await db.execute(
+            "INSERT INTO outbox(method, payload, chat_id, user_id) VALUES (?, ?, ?, ?)",
+            (method, json.dumps(payload), payload.get("chat_id"), payload.get("user_id")),
+        )
+
+    async def enqueue_action(self, method: str, payload: dict):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await self._enqueue(db, method, payload)
+            await db.commit()
+
+    async def due_outbox(self, now: int, limit: int) -> List[Tuple[int, str, dict, int]]:
+        """
+        (id, method, payload, attempts) of pending entries whose next_at has passed.
+        An entry waits while an older one for the same (chat, user) is still pending,
+        so a retried ban can never land after a later unban. Entries without a
+        (chat, user) are not ordered.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                """
+                SELECT id, method, payload, attempts FROM outbox AS o
+                WHERE status='pending' AND next_at<=?
+                  AND NOT EXISTS (
+                    SELECT 1 FROM outbox AS p
+                    WHERE p.status='pending' AND p.id < o.id
+                      AND p.chat_id = o.chat_id AND p.user_id = o.user_id
+                  )
+                ORDER BY id LIMIT ?
+                """,
+                (now, limit),
+            )
+            return [(i, m, json.loads(p), a) for i, m, p, a in await cur.fetchall()]
+
+    async def finish_outbox(
+        self,
+        done: List[int],
+        retry: List[Tuple[int, int, str]],
+        failed: List[Tuple[int, str]],
+    ):
+        """
+        Settle one batch in one transaction.
+        retry: (id, next_at, error), failed: (id, error)
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany(
+                "UPDATE outbox SET status='done', attempts=attempts+1, last_error=NULL WHERE id=?",
+                [(i,) for i in done],
+            )
+            await db.executemany(
+                "UPDATE outbox SET attempts=attempts+1, next_at=?, last_error=? WHERE id=?",
+                [(next_at, err, i) for i, next_at, err in retry],
+            )
+            await db.executemany(
+                "UPDATE outbox SET status='failed', attempts=attempts+1, last_error=? WHERE id=?",
+                [(err, i) for i, err in failed],
+            )
+            await db.commit()
+
+    async def outbox_counts(self) -> Dict[str, int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+            return {status: n for status, n in await cur.fetchall()}
+
+    async def purge_outbox(self, keep_days: int = 7) -> int:
+        """Drop settled entries older than keep_days."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "DELETE FROM outbox WHERE status IN ('done','failed') "
+                "AND created_at < datetime('now', ?)",
+                (f"-{int(keep_days)} days",),
+            )
+            await db.commit()
+            return cur.rowcount
+
+    # ---------- Spam blocklist ----------
+    async def add_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        """rows: (kind, pattern), kind in word/url/invite. Returns how many were new."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            before = db.total_changes
+            await db.executemany(
+                "INSERT OR IGNORE INTO blocklist(chat_id, kind, pattern) VALUES (?,?,?)",
+                [(chat_id, kind, pattern) for kind, pattern in rows],
+            )
+            added = db.total_changes - before
+            await self._changed(db, "block", "add", chat_id=chat_id)
+            await db.commit()
+            return added
+
+    async def remove_block_patterns(self, chat_id: int, rows: List[Tuple[str, str]]) -> int:
+        async with self.connect() as db:
+            await self._prepare(db)
+            before = db.total_changes
+            await db.executemany(
+                "DELETE FROM blocklist WHERE chat_id=? AND kind=? AND pattern=?",
+                [(chat_id, kind, pattern) for kind, pattern in rows],
+            )
+            removed = db.total_changes - before
+            await self._changed(db, "block", "remove", chat_id=chat_id)
+            await db.commit()
+            return removed
+
+    async def list_block_patterns(self, chat_id: int) -> List[Tuple[str, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT kind, pattern FROM blocklist WHERE chat_id=? ORDER BY kind, pattern",
+                (chat_id,),
+            )
+            return await cur.fetchall()
+
+    async def all_block_patterns(self) -> List[Tuple[int, str, str]]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT chat_id, kind, pattern FROM blocklist")
+            return await cur.fetchall()
+
+    # ---------- Join requests ----------
+    async def add_join_requests(self, rows: List[Tuple[int, int, str]]):
+        """rows: (chat_id, user_id, user_json); a repeated request replaces the stored user."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany(
+                "INSERT INTO join_requests(chat_id, user_id, user) VALUES (?,?,?) "
+                "ON CONFLICT(chat_id, user_id) DO UPDATE SET user=excluded.user",
+                rows,
+            )
+            await db.commit()
+
+    async def pending_join_requests(self, limit: int = 1000) -> List[Tuple[int, int, str]]:
+        """(chat_id, user_id, user_json), oldest first."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT chat_id, user_id, user FROM join_requests ORDER BY created_at LIMIT ?",
+                (limit,),
+            )
+            return await cur.fetchall()
+
+    async def finish_join_requests(self, keys: List[Tuple[int, int]]):
+        async with self.connect() as db:
+            await self._prepare(db)
+            await db.executemany(
+                "DELETE FROM join_requests WHERE chat_id=? AND user_id=?",
+                keys,
+            )
+            await db.commit()
+
+    # ---------- Stats ----------
+    async def add_stats(self, rows: List[Tuple[int, int, str, int]]):
+        """rows: (chat_id, minute_bucket, event, count); also bumps the all-time row."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            upsert = (
+                "INSERT INTO stats_rollup(chat_id, grain, bucket, event, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(chat_id, grain, bucket, event) DO UPDATE SET count = count + excluded.count"
+            )
+            await db.executemany(upsert, [(c, "m", b, e, n) for c, b, e, n in rows])
+            await db.executemany(upsert, [(c, "a", 0, e, n) for c, _b, e, n in rows])
+            await db.commit()
+
+    async def compact_stats(self, minutes_before: int, hours_before: int) -> int:
+        """
+        Fold minute rows older than `minutes_before` into hour rows and hour rows
+        older than `hours_before` into day rows, in one transaction.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            before = db.total_changes
+            for src, dst, size, cutoff in (("m", "h", 3600, minutes_before), ("h", "d", 86400, hours_before)):
+                await db.execute(
+                    """
+                    INSERT INTO stats_rollup(chat_id, grain, bucket, event, count)
+                    SELECT chat_id, ?, bucket - bucket % ?, event, SUM(count)
+                    FROM stats_rollup WHERE grain=? AND bucket<?
+                    GROUP BY chat_id, bucket - bucket % ?, event
+                    ON CONFLICT(chat_id, grain, bucket, event) DO UPDATE SET count = count + excluded.count
+                    """,
+                    (dst, size, src, cutoff, size),
+                )
+                await db.execute(
+                    "DELETE FROM stats_rollup WHERE grain=? AND bucket<?",
+                    (src, cutoff),
+                )
+            await db.commit()
+            return db.total_changes - before
+
+    async def stats_since(self, chat_id: Optional[int], since: int) -> Dict[str, int]:
+        """
+        Event counts since `since` (bucket-aligned, so approximate at the edge).
+        Only rows inside the retention windows are read, not the whole history.
+        chat_id None => all chats.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            if chat_id is None:
+                cur = await db.execute(
+                    "SELECT event, SUM(count) FROM stats_rollup "
+                    "WHERE grain IN ('m','h','d') AND bucket>=? GROUP BY event",
+                    (since,),
+                )
+            else:
+                cur = await db.execute(
+                    "SELECT event, SUM(count) FROM stats_rollup "
+                    "WHERE chat_id=? AND grain IN ('m','h','d') AND bucket>=? GROUP BY event",
+                    (chat_id, since),
+                )
+            return {event: n for event, n in await cur.fetchall()}
+
+    async def stats_total(self, chat_id: Optional[int]) -> Dict[str, int]:
+        async with self.connect() as db:
+            await self._prepare(db)
+            if chat_id is None:
+                cur = await db.execute(
+                    "SELECT event, SUM(count) FROM stats_rollup WHERE grain='a' GROUP BY event"
+                )
+            else:
+                cur = await db.execute(
+                    "SELECT event, count FROM stats_rollup WHERE chat_id=? AND grain='a' AND bucket=0",
+                    (chat_id,),
+                )
+            return {event: n for event, n in await cur.fetchall()}
+
+    # ---------- Change feed ----------
+    async def change_bounds(self) -> Tuple[int, int]:
+        """
+        (oldest seq still stored, last seq ever issued). The head comes from
+        sqlite_sequence, so it survives pruning; when nothing is stored, oldest = head + 1.
+        """
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("SELECT seq FROM sqlite_sequence WHERE name='changes'")
+            row = await cur.fetchone()
+            hi = row[0] if row else 0
+            cur = await db.execute("SELECT MIN(seq) FROM changes")
+            lo = (await cur.fetchone())[0]
+            return (lo if lo is not None else hi + 1), hi
+
+    async def changes_since(
+        self, seq: int, limit: int = 500
+    ) -> List[Tuple[int, str, str, str, Optional[int], Optional[int], Optional[int]]]:
+        """(seq, origin, kind, op, user_id, chat_id, ref) after `seq`, oldest first."""
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute(
+                "SELECT seq, origin, kind, op, user_id, chat_id, ref FROM changes "
+                "WHERE seq>? ORDER BY seq LIMIT ?",
+                (seq, limit),
+            )
+            return await cur.fetchall()
+
+    async def prune_changes(self, before: int) -> int:
+        async with self.connect() as db:
+            await self._prepare(db)
+            cur = await db.execute("DELETE FROM changes WHERE created_at<?", (before,))
+            await db.commit()
+            return cur.rowcount
+
+    # ---------- Clone (copy settings from src_chat to dst_chat) ----------
+    async def clone_group_data(self, src_chat_id: int, dst_chat_id: int):
+        async with self.connect() as db:
+            await self._prepare(db)
+
+            # safe (group-specific only)
+            await db.execute(
+                "INSERT OR IGNORE INTO safe_users(user_id, chat_id) "
+                "SELECT user_id, ? FROM safe_users WHERE chat_id=?",
+                (dst_chat_id, src_chat_id),
+            )
+
+            # bans (group-specific only)
+            await db.execute(
+                "INSERT OR IGNORE INTO bans(user_id, chat_id) "
+                "SELECT user_id, ? FROM bans WHERE chat_id=?",
+                (dst_chat_id, src_chat_id),
+            )
+
+            # folders + members
+            cur = await db.execute("SELECT name FROM folders WHERE chat_id=?", (src_chat_id,))
+            folder_names = [r[0] for r in await cur.fetchall()]
+            for fname in folder_names:
+                await db.execute(
+                    "INSERT OR IGNORE INTO folders(chat_id,name) VALUES (?,?)",
+                    (dst_chat_id, fname),
+                )
+
+                cur2 = await db.execute(
+                    "SELECT fm.user_id FROM folder_members fm "
+                    "JOIN folders f ON f.id=fm.folder_id "
+                    "WHERE f.chat_id=? AND f.name=?",
+                    (src_chat_id, fname),
+                )
+                users = [r[0] for r in await cur2.fetchall()]
+
+                cur3 = await db.execute(
+                    "SELECT id FROM folders WHERE chat_id=? AND name=?",
+                    (dst_chat_id, fname),
+                )
+                row3 = await cur3.fetchone()
+                if row3:
+                    dst_folder_id = row3[0]
+                    await db.executemany(
+                        "INSERT OR IGNORE INTO folder_members(folder_id,user_id) VALUES (?,?)",
+                        [(dst_folder_id, uid) for uid in users],
+                    )
+
+                    # folder SAFE for its own chat => SAFE for the clone's chat too
+                    await db.execute(
+                        "INSERT OR IGNORE INTO folder_safe_chats(folder_id, chat_id) "
+                        "SELECT ?, ? FROM folder_safe_chats fs "
+                        "JOIN folders f ON f.id=fs.folder_id "
+                        "WHERE f.chat_id=? AND f.name=? AND fs.chat_id=?",
+                        (dst_folder_id, dst_chat_id, src_chat_id, fname, src_chat_id),
+                    )
+
+            # links (copy)
+            await db.execute(
+                "INSERT OR IGNORE INTO links(chat_id,name,url) "
+                "SELECT ?, name, url FROM links WHERE chat_id=? AND is_invite=0",
+                (dst_chat_id, src_chat_id),
+            )
+
+            # spam blocklist
+            await db.execute(
+                "INSERT OR IGNORE INTO blocklist(chat_id, kind, pattern) "
+                "SELECT ?, kind, pattern FROM blocklist WHERE chat_id=?",
+                (dst_chat_id, src_chat_id),
+            )
+
+            # guard policy
+            await db.execute(
+                "INSERT OR REPLACE INTO guard_policies(chat_id, rules, default_action) "
+                "SELECT ?, rules, default_action FROM guard_policies WHERE chat_id=?",
+                (dst_chat_id, src_chat_id),
+            )
+
+            await self._changed(db, "chat", "reload", chat_id=dst_chat_id, ref=src_chat_id)
+            await db.commit()
@@ -0,0 +1,18 @@
+# tests/conftest.py
+"""
+Every test run gets a scratch SQLite DB and files; app.config reads the
+environment once, so this has to happen before any app import.
+"""
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="eclis-test-")
+os.environ.update(
+    DB_BACKEND="sqlite",
+    DB_PATH=os.path.join(_scratch, "test.sqlite3"),
+    JOURNAL_PATH=os.path.join(_scratch, "journal.jsonl"),
+    BACKUP_DIR=os.path.join(_scratch, "backups"),
+    RECORD_DIR="",
+    OWNER_ID="1",
+)
+os.environ.setdefault("BOT_TOKEN", "123456:test")
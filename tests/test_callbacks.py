@@ -0,0 +1,73 @@
+# tests/test_callbacks.py
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+from app.cache import admins
+from app.db import db
+from app.handlers import private_panel
+from app.replay import make_session
+from app.states import OwnerStates
+
+ADMIN_ID = 42
+
+
+def click(bot: Bot, data: str) -> CallbackQuery:
+    user = User(id=ADMIN_ID, is_bot=False, first_name="admin")
+    return CallbackQuery(
+        id="1",
+        from_user=user,
+        chat_instance="ci",
+        data=data,
+        message=Message(
+            message_id=10,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=ADMIN_ID, type="private"),
+            from_user=User(id=bot.id, is_bot=True, first_name="bot"),
+            text="panel",
+        ),
+    ).as_(bot)
+
+
+def test_one_admin_lookup_per_click(monkeypatch):
+    async def scenario():
+        await db.init()
+        await db.add_admin(ADMIN_ID)
+        # cold admin cache: every lookup is a DB round trip
+        monkeypatch.setattr(admins, "loaded", False)
+
+        lookups = []
+        db_calls = []
+        is_admin, db_is_admin = admins.is_admin, db.is_admin
+
+        async def counted(user_id, *args, **kwargs):
+            lookups.append(user_id)
+            return await is_admin(user_id, *args, **kwargs)
+
+        async def counted_db(user_id):
+            db_calls.append(user_id)
+            return await db_is_admin(user_id)
+
+        monkeypatch.setattr(admins, "is_admin", counted)
+        monkeypatch.setattr(db, "is_admin", counted_db)
+
+        bot = Bot(token="123456:test", session=make_session(0))
+        state = FSMContext(MemoryStorage(), StorageKey(bot_id=bot.id, chat_id=ADMIN_ID, user_id=ADMIN_ID))
+        await state.update_data(active_chat_id=-1001)
+        dispatched = private_panel.cbs.dispatched
+
+        # the whole panel router's callback handlers and filters, as aiogram walks them
+        await private_panel.router.propagate_event("callback_query", click(bot, "clone:menu"), state=state)
+
+        assert private_panel.cbs.dispatched == dispatched + 1
+        assert await state.get_state() == OwnerStates.waiting_for_clone_target_ids
+        assert lookups == [ADMIN_ID]
+        assert db_calls == [ADMIN_ID]
+        await bot.session.close()
+
+    asyncio.run(scenario())
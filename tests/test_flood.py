@@ -0,0 +1,130 @@
+# tests/test_flood.py
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram.types import Chat, ChatMemberAdministrator, ChatMemberOwner, Message, User
+
+from app.cache import bans, folder_index, safe_users
+from app.chat_admins import chat_admins
+from app.db import db
+from app.flood import FloodDetector
+from app.spam_filter import spam_filter
+
+TEXT = "join our new channel for free crypto signals every day t.me/example"
+CHATS = (-1001, -1002, -1003)
+OWNER = User(id=900, is_bot=False, first_name="owner")
+
+
+class FakeBot:
+    """Only what the flood path calls: get_chat_administrators."""
+
+    def __init__(self, admins_by_chat):
+        self.admins_by_chat = admins_by_chat
+        self.calls = 0
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls += 1
+        return [
+            ChatMemberOwner(user=OWNER, is_anonymous=False),
+            *(
+                ChatMemberAdministrator(
+                    user=User(id=uid, is_bot=False, first_name="admin"),
+                    can_be_edited=False, is_anonymous=False, can_manage_chat=True,
+                    can_delete_messages=True, can_manage_video_chats=True,
+                    can_restrict_members=True, can_promote_members=False,
+                    can_change_info=True, can_invite_users=True,
+                    can_post_stories=False, can_edit_stories=False, can_delete_stories=False,
+                )
+                for uid in self.admins_by_chat.get(chat_id, ())
+            ),
+        ]
+
+
+def message(chat_id: int, message_id: int, user_id: int) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type="supergroup"),
+        from_user=User(id=user_id, is_bot=False, first_name="u"),
+        text=TEXT,
+    )
+
+
+async def post_everywhere(detector: FloodDetector, bot, user_id: int) -> None:
+    for i, chat_id in enumerate(CHATS, start=1):
+        msg = message(chat_id, 100 + i, user_id)
+        sightings = detector.observe(chat_id, msg.message_id, user_id, detector.fingerprints(msg))
+        if sightings:
+            await detector.punish(bot, sightings)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def setup_function(_):
+    chat_admins.invalidate()
+    spam_filter._deletes.clear()
+
+
+def detector() -> FloodDetector:
+    d = FloodDetector(chats=3, window=60, min_length=20)
+    for chat_id in CHATS:
+        d.track_group(chat_id)
+    return d
+
+
+def test_spammer_is_banned():
+    async def scenario():
+        await db.init()
+        d = detector()
+        await post_everywhere(d, FakeBot({}), 500)
+        assert d.tripped == 1
+        assert bans.contains(500, None)
+        assert sorted(spam_filter._deletes) == sorted(CHATS)
+
+    run(scenario())
+
+
+def test_chat_admin_is_not_banned_on_cold_cache():
+    async def scenario():
+        await db.init()
+        d = detector()
+        bot = FakeBot({-1002: [501]})
+        await post_everywhere(d, bot, 501)
+        assert d.tripped == 1
+        assert bot.calls >= 1
+        assert not bans.contains(501, None)
+        assert not spam_filter._deletes
+
+    run(scenario())
+
+
+def test_folder_safe_user_is_not_banned():
+    async def scenario():
+        await db.init()
+        folder_index.set_folder(9001, [502], [-1003])
+        try:
+            d = detector()
+            bot = FakeBot({})
+            await post_everywhere(d, bot, 502)
+            assert d.tripped == 1
+            assert bot.calls == 0
+            assert not bans.contains(502, None)
+            assert not spam_filter._deletes
+        finally:
+            folder_index.drop_folder(9001)
+
+    run(scenario())
+
+
+def test_safe_user_is_not_banned():
+    async def scenario():
+        await db.init()
+        safe_users.add(503, -1001)
+        d = detector()
+        await post_everywhere(d, FakeBot({}), 503)
+        assert d.tripped == 1
+        assert not bans.contains(503, None)
+
+    run(scenario())
@@ -0,0 +1,136 @@
+# tests/test_pipeline.py
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from aiogram import Bot
+from aiogram.types import (
+    Chat,
+    ChatMemberAdministrator,
+    ChatMemberBanned,
+    ChatMemberLeft,
+    ChatMemberMember,
+    ChatMemberRestricted,
+    ChatMemberUpdated,
+    ChatPermissions,
+    Message,
+    Update,
+    User,
+)
+
+from app.actions import actions
+from app.chat_admins import chat_admins
+from app.db import db
+from app.handlers import group_guard
+from app.policy import policies
+from app.serializer import KeyedSerializer
+from app.startup import startup
+from app.main import build_dispatcher
+
+
+def group_message(update_id: int, chat_id: int) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=chat_id, type="supergroup"),
+            from_user=User(id=700 + update_id, is_bot=False, first_name="u"),
+            text="hello",
+        ),
+    )
+
+
+def test_unwatched_group_traffic_is_not_held_during_warmup():
+    async def scenario():
+        assert not startup.ready.is_set()
+        dp, gate, prefilter = build_dispatcher()
+        bot = Bot(token="123456:test")
+        try:
+            # cold caches: no chat is known to be watched, so nothing is buffered
+            await asyncio.wait_for(
+                asyncio.gather(*(dp.feed_update(bot, group_message(i, -1000 - i)) for i in range(50))),
+                timeout=1,
+            )
+            assert gate.held == 0 and gate.waiting == 0
+            assert prefilter.reasons["group_message"] == 50
+        finally:
+            await bot.session.close()
+
+    asyncio.run(scenario())
+
+
+def member_update(chat_id: int, user_id: int, old: str, new: str) -> ChatMemberUpdated:
+    user = User(id=user_id, is_bot=False, first_name="u")
+    statuses = {
+        "left": lambda: ChatMemberLeft(user=user),
+        "kicked": lambda: ChatMemberBanned(user=user, until_date=datetime.fromtimestamp(0, timezone.utc)),
+        "member": lambda: ChatMemberMember(user=user),
+        "restricted": lambda: ChatMemberRestricted(
+            user=user, is_member=True, until_date=datetime.fromtimestamp(0, timezone.utc),
+            **{field: False for field in ChatPermissions.model_fields if field.startswith("can_")},
+        ),
+        "administrator": lambda: ChatMemberAdministrator(
+            user=user, can_be_edited=True, is_anonymous=False, can_manage_chat=True,
+            can_delete_messages=True, can_manage_video_chats=True, can_restrict_members=True,
+            can_promote_members=False, can_change_info=True, can_invite_users=True,
+            can_post_stories=False, can_edit_stories=False, can_delete_stories=False,
+        ),
+    }
+    return ChatMemberUpdated(
+        chat=Chat(id=chat_id, type="supergroup", title="g"),
+        from_user=User(id=900, is_bot=False, first_name="admin"),
+        date=datetime.now(timezone.utc),
+        old_chat_member=statuses[old](),
+        new_chat_member=statuses[new](),
+    )
+
+
+def guard(monkeypatch, chat_id: int, admins=(), policy=None):
+    """run(*updates): feed chat_member updates through the guard handler;
+    returns (bans in the chat, new outbox rows, new queued actions)."""
+    lanes = KeyedSerializer()
+    monkeypatch.setattr(group_guard, "member_lanes", lanes)
+
+    def run(*updates):
+        async def main():
+            await db.init()
+            if policy is not None:
+                await db.set_policy(chat_id, *policy)
+            policies.invalidate(chat_id)
+            # warm admin entry, so the guard never calls the Bot API
+            chat_admins._chats[chat_id] = (frozenset(admins), time.monotonic() + 60)
+            queued, pending = len(actions), sum((await db.outbox_counts()).values())
+            try:
+                for update in updates:
+                    await group_guard.guard_new_members(update)
+                outbox = sum((await db.outbox_counts()).values()) - pending
+                return await db.list_bans(chat_id), outbox, len(actions) - queued
+            finally:
+                await lanes.stop()
+                chat_admins.invalidate(chat_id)
+                await db.delete_policy(chat_id)
+                policies.invalidate(chat_id)
+
+        return asyncio.run(main())
+
+    return run
+
+
+def test_demoted_admin_is_not_banned(monkeypatch):
+    run = guard(monkeypatch, -2001, admins=[801])
+    assert run(member_update(-2001, 801, "administrator", "member")) == ([], 0, 0)
+    # the demotion reached the admin cache too
+    assert chat_admins.peek(-2001, 801) is None
+
+
+def test_joining_member_is_banned(monkeypatch):
+    run = guard(monkeypatch, -2002)
+    assert run(member_update(-2002, 802, "left", "member")) == ([(802, -2002)], 1, 1)
+
+
+def test_unmute_is_not_undone(monkeypatch):
+    run = guard(monkeypatch, -2003, policy=("[]", "mute"))
+    # join -> muted (restrict + owner log), then an admin lifts the restriction
+    assert run(member_update(-2003, 803, "left", "member")) == ([], 0, 2)
+    assert run(member_update(-2003, 803, "restricted", "member")) == ([], 0, 0)
@@ -0,0 +1,114 @@
+# tests/test_serializer.py
+import asyncio
+import random
+
+from app.serializer import KeyedSerializer
+
+KEYS = 500
+JOBS_PER_KEY = 40
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_stress_keeps_order_without_overlap_or_loss():
+    async def scenario():
+        lanes = KeyedSerializer(workers=32)
+        rng = random.Random(7)
+        ran = {k: [] for k in range(KEYS)}
+        active = set()
+        overlaps = []
+
+        def job(key, seq):
+            async def fn():
+                if key in active:
+                    overlaps.append(key)
+                active.add(key)
+                # yield a random number of times so jobs of different keys interleave
+                for _ in range(rng.randrange(3)):
+                    await asyncio.sleep(0)
+                ran[key].append(seq)
+                active.discard(key)
+                return key, seq
+
+            return fn
+
+        # submissions interleaved across keys, in a random order per round
+        futures = []
+        for seq in range(JOBS_PER_KEY):
+            keys = list(range(KEYS))
+            rng.shuffle(keys)
+            futures += [lanes.run(k, job(k, seq)) for k in keys]
+            await asyncio.sleep(0)
+        results = await asyncio.wait_for(asyncio.gather(*futures), timeout=30)
+        await lanes.stop()
+
+        assert not overlaps
+        # every job ran once and resolved its own future, in submission order per key
+        assert len(results) == KEYS * JOBS_PER_KEY
+        assert all(ran[k] == list(range(JOBS_PER_KEY)) for k in range(KEYS))
+        # drained lanes are dropped
+        assert len(lanes) == 0
+        assert lanes.peak_lanes <= KEYS
+
+    run(scenario())
+
+
+def test_failure_does_not_stall_the_lane():
+    async def scenario():
+        lanes = KeyedSerializer(workers=2)
+        order = []
+
+        async def ok(n):
+            order.append(n)
+            return n
+
+        async def boom():
+            order.append("boom")
+            raise RuntimeError("boom")
+
+        first = lanes.run("k", lambda: ok(1))
+        failed = lanes.run("k", boom)
+        last = lanes.run("k", lambda: ok(2))
+        assert await first == 1
+        try:
+            await failed
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("the job's exception must reach its future")
+        assert await last == 2
+        assert order == [1, "boom", 2]
+        await asyncio.sleep(0)
+        assert len(lanes) == 0
+        await lanes.stop()
+
+    run(scenario())
+
+
+def test_cancelled_job_is_skipped():
+    async def scenario():
+        lanes = KeyedSerializer(workers=1)
+        gate = asyncio.Event()
+        order = []
+
+        async def hold():
+            await gate.wait()
+            order.append("hold")
+
+        async def record(n):
+            order.append(n)
+
+        held = lanes.run("k", hold)
+        skipped = lanes.run("k", lambda: record("skipped"))
+        kept = lanes.run("k", lambda: record("kept"))
+        skipped.cancel()
+        gate.set()
+        await asyncio.gather(held, kept)
+        assert order == ["hold", "kept"]
+        await asyncio.sleep(0)
+        assert len(lanes) == 0
+        await lanes.stop()
+
+    run(scenario())
@@ -0,0 +1,58 @@
+# tests/test_spam_filter.py
+import random
+import re
+import string
+import time
+
+from app.spam_filter import compile_blocklist, parse_blocklist_text
+
+
+def test_blocklist_kinds():
+    rx = compile_blocklist(parse_blocklist_text("crypto signal\nurl bit.ly\ninvite *\nUSDT"))
+    assert rx.search("free crypto signal today")
+    assert not rx.search("cryptosignal")
+    assert rx.search("see bit.ly/abc")
+    assert rx.search("join t.me/+abcdef")
+    assert rx.search("usdt only")
+    assert not rx.search("usdts")
+    assert compile_blocklist([]) is None
+
+
+def big_blocklist(rng: random.Random):
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+    words = sorted({" ".join(word() for _ in range(rng.choice((1, 1, 2)))) for _ in range(9000)})
+    urls = sorted({f"{word()}.{rng.choice(('com', 'io', 'ru'))}" for _ in range(1000)})
+    messages = [" ".join(word() for _ in range(rng.randint(5, 40))) for _ in range(500)]
+    for i in range(0, len(messages), 25):
+        messages[i] += " " + rng.choice(words)
+    for i in range(10, len(messages), 50):
+        messages[i] += " https://" + rng.choice(urls) + "/x"
+    return words, urls, messages
+
+
+def per_second(rx: re.Pattern, messages) -> float:
+    t = time.perf_counter()
+    for text in messages:
+        rx.search(text)
+    return len(messages) / (time.perf_counter() - t)
+
+
+def test_ten_thousand_patterns_throughput():
+    words, urls, messages = big_blocklist(random.Random(42))
+    trie = compile_blocklist([("word", w) for w in words] + [("url", u) for u in urls])
+    # what the trie replaces: one flat alternation of every pattern
+    flat = re.compile(
+        r"(?<!\w)(?:" + "|".join(map(re.escape, words)) + r")(?!\w)|" + "|".join(map(re.escape, urls))
+    )
+
+    sample = messages[:100]
+    assert [bool(trie.search(m)) for m in sample] == [bool(flat.search(m)) for m in sample]
+    assert all(trie.search(m) for m in messages[::25])
+
+    trie_rate = per_second(trie, messages)
+    flat_rate = per_second(flat, sample)
+    # locally ~14k msg/s for the trie vs ~400 msg/s flat; the floors leave wide margins
+    assert trie_rate > 2000, f"trie: {trie_rate:.0f} msg/s"
+    assert trie_rate > 5 * flat_rate, f"trie {trie_rate:.0f} vs flat {flat_rate:.0f} msg/s"
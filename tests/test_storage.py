@@ -0,0 +1,342 @@
+# tests/test_storage.py
+"""
+Conformance suite for the storage backends (app/storage): every test runs
+against SQLite and, when TEST_DATABASE_URL points at a scratch PostgreSQL
+database, against Postgres too. Each test starts from an empty schema.
+
+    TEST_DATABASE_URL=postgresql://user@localhost/eclis_test python -m pytest tests/test_storage.py
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.storage import SCHEMA_VERSION, StorageBackend, create_backend
+
+PG_DSN = os.getenv("TEST_DATABASE_URL", "")
+
+
+async def _reset_postgres(dsn: str) -> None:
+    import asyncpg
+
+    con = await asyncpg.connect(dsn)
+    try:
+        await con.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    finally:
+        await con.close()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path):
+    """run(scenario): `await scenario(db)` on a fresh, initialized backend."""
+    if request.param == "postgres" and not PG_DSN:
+        pytest.skip("TEST_DATABASE_URL not set")
+
+    def run(scenario):
+        async def main():
+            if request.param == "sqlite":
+                db = create_backend("sqlite", path=str(tmp_path / "conformance.sqlite3"))
+            else:
+                await _reset_postgres(PG_DSN)
+                db = create_backend("postgres", dsn=PG_DSN, min_size=1, max_size=4)
+            try:
+                assert await db.init() is True
+                await scenario(db)
+            finally:
+                await db.close()
+
+        asyncio.run(main())
+
+    return run
+
+
+def test_protocol_and_schema_version(storage):
+    async def scenario(db):
+        assert isinstance(db, StorageBackend)
+        # current schema: a second boot does no DDL
+        assert await db.init() is False
+        assert SCHEMA_VERSION >= 8
+
+    storage(scenario)
+
+
+def test_admins_and_groups(storage):
+    async def scenario(db):
+        await db.add_admin(5)
+        await db.add_admin(5)
+        await db.add_admin(3)
+        assert await db.list_admins() == [3, 5]
+        assert await db.is_admin(5) and not await db.is_admin(4)
+
+        await db.upsert_group(-1, "beta", "supergroup")
+        await db.upsert_group(-2, "alpha")
+        await db.upsert_group(-1, "beta 2", "supergroup")
+        assert await db.list_groups() == [(-2, "alpha", "group"), (-1, "beta 2", "supergroup")]
+
+        await db.set_join_gate(-1, True)
+        assert await db.join_gate_chats() == [-1]
+        await db.set_join_gate(-1, False)
+        assert await db.join_gate_chats() == []
+
+    storage(scenario)
+
+
+def test_safe_global_rows_are_unique(storage):
+    async def scenario(db):
+        await db.add_safe(1)
+        await db.add_safe(1)
+        await db.add_safe(1, -10)
+        await db.add_safe(1, -10)
+        await db.add_safe(2, -10)
+        assert sorted(await db.all_safe(), key=repr) == sorted([(1, None), (1, -10), (2, -10)], key=repr)
+        assert await db.list_safe() == [1]
+        assert await db.list_safe(-10) == [1, 2]
+        # GLOBAL covers every chat
+        assert await db.is_safe(1, -99)
+        assert not await db.is_safe(2, -99)
+
+        await db.remove_safe(1)
+        assert await db.list_safe() == []
+        assert await db.is_safe(1, -10)
+
+    storage(scenario)
+
+
+def test_bans_and_bulk_bans(storage):
+    async def scenario(db):
+        await db.add_ban(1)
+        await db.add_ban(1)
+        await db.add_bans([(2, None), (2, None), (3, -10), (1, None)], enforce=[(3, -10)])
+        assert await db.list_bans() == [(1, None), (2, None)]
+        assert await db.list_bans(-10) == [(3, -10)]
+        assert len(await db.all_bans()) == 3
+        assert await db.is_banned(3, -10)
+
+        await db.remove_ban(3, -10)
+        assert not await db.is_banned(3, -10)
+        await db.add_bans([])
+
+    storage(scenario)
+
+
+def test_outbox_orders_entries_per_member(storage):
+    async def scenario(db):
+        await db.add_ban(1, -10, enforce=True)
+        await db.add_bans([(2, -10)], enforce=[(2, -10)])
+        await db.remove_ban(1, -10, enforce=True)
+        await db.enqueue_action("ban_chat_member", {"chat_id": -20, "user_id": 1})
+
+        now = int(time.time())
+        due = await db.due_outbox(now, 50)
+        # the unban for (-10, 1) waits behind its ban
+        assert [(m, p["chat_id"], p["user_id"]) for _i, m, p, _a in due] == [
+            ("ban_chat_member", -10, 1),
+            ("ban_chat_member", -10, 2),
+            ("ban_chat_member", -20, 1),
+        ]
+        assert all(a == 0 for *_x, a in due)
+        ban1, ban2, other = (row[0] for row in due)
+
+        await db.finish_outbox([ban2], [(ban1, now + 60, "RetryAfter")], [(other, "Bad Request")])
+        assert await db.outbox_counts() == {"pending": 2, "done": 1, "failed": 1}
+        # the retried ban is not due yet and still holds back the unban
+        assert await db.due_outbox(now, 50) == []
+
+        due = await db.due_outbox(now + 60, 50)
+        assert [(i, a) for i, _m, _p, a in due] == [(ban1, 1)]
+        await db.finish_outbox([ban1], [], [])
+        due = await db.due_outbox(now + 60, 50)
+        assert [(m, p) for _i, m, p, _a in due] == [
+            ("unban_chat_member", {"chat_id": -10, "user_id": 1, "only_if_banned": True})
+        ]
+        assert await db.purge_outbox() == 0
+
+    storage(scenario)
+
+
+def test_folders_and_folder_safe_state(storage):
+    async def scenario(db):
+        await db.create_folder(-10, "staff")
+        await db.create_folder(-10, "staff")
+        await db.create_folder(-10, "vip")
+        folders = await db.list_folders(-10)
+        assert [name for _id, name in folders] == ["staff", "vip"]
+        staff = folders[0][0]
+        assert await db.get_folder(staff) == (staff, -10, "staff")
+
+        assert await db.folder_add_users(staff, [1, 2, 2, 3]) == 3
+        assert await db.folder_add_users(staff, [3]) == 0
+        assert await db.folder_remove_users(staff, [3, 4]) == 1
+        await db.folder_add_user(-10, "vip", 7)
+        await db.folder_remove_user(-10, "vip", 8)
+        assert await db.list_folder_members_by_id(staff) == [1, 2]
+        assert await db.list_folder_members(-10, "vip") == [7]
+        members = await db.folder_members_map(-10)
+        assert {k: sorted(v) for k, v in members.items()} == {"staff": [1, 2], "vip": [7]}
+
+        await db.set_folder_safe_chats(staff, [-10, -11])
+        assert sorted(await db.list_folder_safe_chats(staff)) == [-11, -10]
+        state = await db.folder_safe_state()
+        assert {k: (sorted(m), sorted(c)) for k, (m, c) in state.items()} == {staff: ([1, 2], [-11, -10])}
+        assert list(await db.folder_safe_state(staff)) == [staff]
+
+        await db.delete_folder(staff)
+        assert await db.get_folder(staff) is None
+        assert await db.folder_safe_state() == {}
+        assert await db.list_folder_members_by_id(staff) == []
+
+    storage(scenario)
+
+
+def test_policy_roundtrip(storage):
+    async def scenario(db):
+        assert await db.get_policy(-10) is None
+        await db.set_policy(-10, '[{"match":"bot","value":true,"action":"ban"}]', "allow")
+        await db.set_policy(-10, "[]", "mute")
+        assert await db.get_policy(-10) == ("[]", "mute")
+        await db.delete_policy(-10)
+        assert await db.get_policy(-10) is None
+
+    storage(scenario)
+
+
+def test_links_and_invite_rotation(storage):
+    async def scenario(db):
+        assert await db.add_link(-10, " site ", " https://example.org ") is True
+        assert await db.add_link(-10, "again", "https://example.org") is False
+        await db.add_invite_links([
+            (-10, "invite", "https://t.me/+a", 100),
+            (-11, "invite", "https://t.me/+b", 1000),
+            (-11, "invite", "https://t.me/+b", 1000),
+        ])
+        links = await db.list_links(-10)
+        assert [(name, url) for _id, name, url, _at in links] == [
+            ("invite", "https://t.me/+a"),
+            ("site", "https://example.org"),
+        ]
+        invite_id = links[0][0]
+        assert await db.get_link(invite_id) == (invite_id, -10, "invite", "https://t.me/+a", 1)
+        assert await db.list_expired_invite_links(500) == [(invite_id, -10, "https://t.me/+a")]
+        assert await db.chats_with_valid_invite(500) == [-11]
+
+        await db.delete_links([invite_id])
+        await db.delete_link(links[1][0])
+        assert await db.list_links(-10) == []
+
+    storage(scenario)
+
+
+def test_broadcast_lifecycle(storage):
+    async def scenario(db):
+        bid = await db.create_broadcast(1, 42, [-1, -2, -3])
+        assert await db.get_broadcast(bid) == (bid, 1, 42, "running", None, None)
+        assert await db.list_running_broadcasts() == [bid]
+        await db.set_broadcast_progress_message(bid, 1, 77)
+        await db.record_deliveries(bid, [(-1, "sent", None), (-2, "failed", "Forbidden")])
+        assert await db.pending_deliveries(bid) == [-3]
+        assert await db.broadcast_counts(bid) == {"sent": 1, "failed": 1, "pending": 1}
+        await db.set_broadcast_status(bid, "done")
+        assert await db.get_broadcast(bid) == (bid, 1, 42, "done", 1, 77)
+        assert await db.list_running_broadcasts() == []
+
+    storage(scenario)
+
+
+def test_blocklist(storage):
+    async def scenario(db):
+        assert await db.add_block_patterns(-10, [("word", "casino"), ("url", "spam.example")]) == 2
+        assert await db.add_block_patterns(-10, [("word", "casino"), ("invite", "abc")]) == 1
+        assert sorted(await db.list_block_patterns(-10)) == [
+            ("invite", "abc"), ("url", "spam.example"), ("word", "casino"),
+        ]
+        assert await db.remove_block_patterns(-10, [("word", "casino"), ("word", "nope")]) == 1
+        assert sorted(await db.all_block_patterns()) == [(-10, "invite", "abc"), (-10, "url", "spam.example")]
+
+    storage(scenario)
+
+
+def test_join_requests(storage):
+    async def scenario(db):
+        await db.add_join_requests([(-10, 1, '{"id":1}'), (-10, 2, '{"id":2}')])
+        await db.add_join_requests([(-10, 1, '{"id":1,"v":2}')])
+        pending = await db.pending_join_requests()
+        assert sorted(pending) == [(-10, 1, '{"id":1,"v":2}'), (-10, 2, '{"id":2}')]
+        await db.finish_join_requests([(-10, 1)])
+        assert await db.pending_join_requests() == [(-10, 2, '{"id":2}')]
+
+    storage(scenario)
+
+
+def test_stats_rollups_keep_totals(storage):
+    async def scenario(db):
+        day = 86400 * 20000
+        await db.add_stats([
+            (-10, day + 60, "ban", 2),
+            (-10, day + 120, "ban", 1),
+            (-10, day + 3600, "allow", 5),
+            (-11, day + 60, "ban", 4),
+        ])
+        await db.add_stats([(-10, day + 60, "ban", 1)])
+        assert await db.stats_total(-10) == {"ban": 4, "allow": 5}
+        assert await db.stats_total(None) == {"ban": 8, "allow": 5}
+        assert await db.stats_since(-10, day + 120) == {"ban": 1, "allow": 5}
+
+        assert await db.compact_stats(day + 7200, day + 7200) > 0
+        # folded into h, then d rows: nothing lost
+        assert await db.stats_since(-10, day) == {"ban": 4, "allow": 5}
+        assert await db.stats_since(None, day) == {"ban": 8, "allow": 5}
+        assert await db.stats_total(-10) == {"ban": 4, "allow": 5}
+
+    storage(scenario)
+
+
+def test_change_feed(storage):
+    async def scenario(db):
+        assert await db.change_bounds() == (1, 0)
+        await db.add_safe(1, -10)
+        await db.add_ban(2)
+        await db.add_bans([(3, -10), (4, None)])
+        await db.set_join_gate(-10, True)
+        await db.upsert_group(-10, "g")
+        # unchanged group (every join re-upserts it): no write, no feed row
+        await db.upsert_group(-10, "g")
+        rows = await db.changes_since(0)
+        assert [(kind, op, user, chat) for _s, _o, kind, op, user, chat, _r in rows] == [
+            ("safe", "add", 1, -10),
+            ("ban", "add", 2, None),
+            ("ban", "add", 3, -10),
+            ("ban", "add", 4, None),
+            ("gate", "on", None, -10),
+            ("group", "upsert", None, -10),
+        ]
+        assert {origin for _s, origin, *_x in rows} == {db.origin}
+        seqs = [s for s, *_x in rows]
+        assert seqs == sorted(seqs)
+        assert await db.changes_since(seqs[1], limit=2) == rows[2:4]
+        assert await db.change_bounds() == (seqs[0], seqs[-1])
+
+        # the head survives pruning
+        assert await db.prune_changes(int(time.time()) + 10) == len(rows)
+        assert await db.change_bounds() == (seqs[-1] + 1, seqs[-1])
+        await db.add_admin(9)
+        assert (await db.changes_since(seqs[-1]))[0][0] > seqs[-1]
+
+    storage(scenario)
+
+
+def test_clone_group_data(storage):
+    async def scenario(db):
+        await db.add_safe(1, -10)
+        await db.add_safe(2)
+        await db.add_ban(3, -10)
+        await db.create_folder(-10, "staff")
+        await db.folder_add_user(-10, "staff", 4)
+        await db.clone_group_data(-10, -20)
+        await db.clone_group_data(-10, -20)
+        assert await db.list_safe(-20) == [1]
+        assert await db.list_bans(-20) == [(3, -20)]
+        assert [name for _id, name in await db.list_folders(-20)] == ["staff"]
+        assert await db.list_folder_members(-20, "staff") == [4]
+
+    storage(scenario)